@@ -1,16 +1,315 @@
 import os
+import sys
 import shutil
+import hashlib
+import pickle
+import socket
+import time
+import weakref
+import datetime
+import tempfile
+import threading
+import uuid
+from collections import OrderedDict
 import numpy as np
 import joblib
-import glob
-from dask.distributed import Lock
 
+from photonai.helper.helper import atomic_write
 from photonai.photonlogger.logger import logger
 
 
+class MemoryCache:
+    """
+    Size-bounded, least recently used store for cache entries inside one process.
+
+    It is shared by all cache managers of the process, so that configurations sharing a prefix
+    of the pipeline find its output in memory instead of reading it from the cache folder again.
+    """
+
+    def __init__(self):
+        self.entries = OrderedDict()
+        self.nbytes = 0
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def estimate_nbytes(data):
+        if isinstance(data, np.ndarray):
+            return data.nbytes
+        if isinstance(data, (list, tuple)):
+            return sum(MemoryCache.estimate_nbytes(i) for i in data)
+        if isinstance(data, dict):
+            return sum(MemoryCache.estimate_nbytes(i) for i in data.values())
+        return sys.getsizeof(data)
+
+    @staticmethod
+    def _copy(data, writeable):
+        # neither the producer nor the consumers of an entry may change it in place, so it is
+        # stored as a read-only copy and every hit gets a writable copy of its own, just as a
+        # copy-on-write memory map of the cache folder
+        if isinstance(data, np.ndarray):
+            data = np.array(data, copy=True)
+            data.flags.writeable = writeable
+            return data
+        if isinstance(data, tuple):
+            return tuple(MemoryCache._copy(i, writeable) for i in data)
+        if isinstance(data, dict):
+            return {k: MemoryCache._copy(v, writeable) for k, v in data.items()}
+        return data
+
+    def __contains__(self, key):
+        return key in self.entries
+
+    def get(self, key):
+        with self._lock:
+            if key not in self.entries:
+                return None
+            self.entries.move_to_end(key)
+            return MemoryCache._copy(self.entries[key][0], writeable=True)
+
+    def put(self, key, data, max_bytes):
+        nbytes = MemoryCache.estimate_nbytes(data)
+        with self._lock:
+            self.discard(key)
+            if nbytes > max_bytes:
+                return
+            self.entries[key] = (MemoryCache._copy(data, writeable=False), nbytes)
+            self.nbytes += nbytes
+            while self.nbytes > max_bytes:
+                _, (_, evicted_bytes) = self.entries.popitem(last=False)
+                self.nbytes -= evicted_bytes
+
+    def discard(self, key):
+        with self._lock:
+            if key in self.entries:
+                self.nbytes -= self.entries.pop(key)[1]
+
+    def clear(self, cache_folder, force_all=False):
+        with self._lock:
+            for key in list(self.entries.keys()):
+                entry_folder = key[0]
+                if entry_folder == cache_folder:
+                    self.discard(key)
+                elif entry_folder.startswith(cache_folder + os.sep):
+                    sub_folders = os.path.relpath(entry_folder, cache_folder)
+                    if force_all or not any(
+                        f.endswith("DND") for f in sub_folders.split(os.sep)
+                    ):
+                        self.discard(key)
+
+
+class CacheIndex:
+    """
+    Append-only log of the entries in a cache folder, so that the folder does not need to be listed
+    every time a pipeline is prepared.
+
+    Every process reads the log of a folder once and afterwards only the lines that have been appended
+    since. Each line is appended with a single write to the log opened in append mode, so that lines of
+    concurrent writers never interleave. The first line holds a random id, which tells the readers that
+    the log has been removed and created again, e.g. when the cache folder has been cleared.
+
+    Besides its size, the log holds the eviction group of an entry, whether it is cheaper to recompute
+    than to read, and a line whenever the entry is used, so that all processes know the order in which
+    the entries have been used and the cache can be evicted without reading the folder.
+    """
+
+    LOG_FILENAME = "cache_index.log"
+    # compact the log when it has that many more lines than entries
+    MAX_STALE_LINES = 10000
+
+    # one index per cache folder and process
+    _indices = dict()
+    _indices_lock = threading.Lock()
+
+    def __init__(self, cache_folder):
+        self.cache_folder = cache_folder
+        self.log_file = os.path.join(cache_folder, CacheIndex.LOG_FILENAME)
+        self.files = dict()
+        self.sizes = dict()
+        # key -> (eviction group, cheaper to recompute than to read)
+        self.costs = dict()
+        # key -> value of _clock when the entry was last added or used
+        self.last_access = dict()
+        self.nbytes = 0
+        self._header = None
+        self._offset = 0
+        self._nr_of_lines = 0
+        self._clock = 0
+        self._lock = threading.RLock()
+
+    @staticmethod
+    def of(cache_folder):
+        with CacheIndex._indices_lock:
+            if cache_folder not in CacheIndex._indices:
+                CacheIndex._indices[cache_folder] = CacheIndex(cache_folder)
+            return CacheIndex._indices[cache_folder]
+
+    def _reset(self):
+        self.files.clear()
+        self.sizes.clear()
+        self.costs.clear()
+        self.last_access.clear()
+        self.nbytes = 0
+        self._header = None
+        self._offset = 0
+        self._nr_of_lines = 0
+        self._clock = 0
+
+    def _apply(self, line):
+        self._nr_of_lines += 1
+        self._clock += 1
+        parts = line.split(" ")
+        if parts[0] == "+" and len(parts) in [3, 5]:
+            key = parts[1]
+            if len(parts) == 5:
+                group, cheap = parts[3], parts[4] == "1"
+            else:
+                group, cheap = key, False
+            self._set(key, int(parts[2]), group, cheap)
+        elif parts[0] == "*" and len(parts) == 2:
+            if parts[1] in self.files:
+                self.last_access[parts[1]] = self._clock
+        elif parts[0] == "-" and len(parts) == 2:
+            self._pop(parts[1])
+
+    def _set(self, key, size, group, cheap):
+        self.nbytes += size - self.sizes.get(key, 0)
+        self.sizes[key] = size
+        self.costs[key] = (group, cheap)
+        self.last_access[key] = self._clock
+        self.files[key] = os.path.join(self.cache_folder, key + ".p")
+
+    def _pop(self, key):
+        self.nbytes -= self.sizes.pop(key, 0)
+        self.costs.pop(key, None)
+        self.last_access.pop(key, None)
+        self.files.pop(key, None)
+
+    @staticmethod
+    def _entry_line(key, size, group, cheap):
+        return "+ {} {} {} {}\n".format(key, size, group, int(cheap))
+
+    def _write_log(self, entries, replace=False):
+        """
+        entries are (key, size, group, cheap) tuples, the least recently used first
+        """
+        # write the complete log to a temporary file first, so readers never see it half-written
+        tmp_file, tmp_filename = tempfile.mkstemp(dir=self.cache_folder, suffix=".tmp")
+        with os.fdopen(tmp_file, "w") as f:
+            f.write("# " + uuid.uuid4().hex + "\n")
+            for entry in entries:
+                f.write(CacheIndex._entry_line(*entry))
+        try:
+            if replace:
+                os.replace(tmp_filename, self.log_file)
+            else:
+                # another process might have created the log meanwhile, then we use that one
+                os.link(tmp_filename, self.log_file)
+        except FileExistsError:
+            pass
+        except OSError:
+            # the file system does not support hard links
+            if not os.path.isfile(self.log_file):
+                os.replace(tmp_filename, self.log_file)
+        finally:
+            if os.path.isfile(tmp_filename):
+                os.remove(tmp_filename)
+
+    def _create_log(self):
+        # cache folders written without a log, e.g. by an older version, are listed once
+        entries = list()
+        for entry in os.scandir(self.cache_folder):
+            if entry.name.endswith(".p"):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, entry.name[:-2], stat.st_size))
+        self._write_log(
+            [(key, size, key, False) for _, key, size in sorted(entries)]
+        )
+
+    def entries_by_access(self):
+        """
+        (key, size, group, cheap) of all entries, the least recently used first.
+        """
+        return [
+            (key, self.sizes[key]) + self.costs[key]
+            for key in sorted(self.last_access, key=self.last_access.get)
+        ]
+
+    def refresh(self):
+        """
+        Read the lines that have been appended to the log since the last refresh.
+        """
+        with self._lock:
+            try:
+                f = open(self.log_file, "rb")
+            except FileNotFoundError:
+                self._reset()
+                self._create_log()
+                f = open(self.log_file, "rb")
+            with f:
+                header = f.readline()
+                if not header.startswith(b"# "):
+                    header = b""
+                if header != self._header:
+                    self._reset()
+                    self._header = header
+                    self._offset = len(header)
+                f.seek(self._offset)
+                new_lines = f.read()
+            # a line that is being written right now is read next time
+            complete = new_lines.rfind(b"\n") + 1
+            for line in new_lines[:complete].decode("utf-8").splitlines():
+                self._apply(line)
+            self._offset += complete
+
+            if self._nr_of_lines > len(self.files) + CacheIndex.MAX_STALE_LINES:
+                self._write_log(self.entries_by_access(), replace=True)
+
+    def _append(self, line):
+        if not os.path.isfile(self.log_file):
+            self.refresh()
+        log = os.open(self.log_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT)
+        try:
+            os.write(log, line.encode("utf-8"))
+        finally:
+            os.close(log)
+
+    def add(self, key, size, group=None, cheap=False):
+        """
+        group is the eviction group of the entry (the key itself if None) and cheap tells if the
+        entry can be recomputed at least as fast as it is read.
+        """
+        if group is None:
+            group = key
+        with self._lock:
+            self._append(CacheIndex._entry_line(key, size, group, cheap))
+            self._clock += 1
+            self._set(key, size, group, cheap)
+
+    def touch(self, key):
+        """
+        Mark an entry as recently used.
+        """
+        with self._lock:
+            self._append("* " + key + "\n")
+            self._clock += 1
+            if key in self.files:
+                self.last_access[key] = self._clock
+
+    def remove(self, key):
+        with self._lock:
+            self._append("- " + key + "\n")
+            self._pop(key)
+
+
 class CacheManager:
 
-    __LOCK_STR = "photon_cache_manager"
+    memory_cache = MemoryCache()
+
+    # seconds after which an in-flight marker is considered abandoned if its owner cannot be checked
+    IN_FLIGHT_TIMEOUT = 3600
 
     def __init__(
         self,
@@ -18,6 +317,9 @@ class CacheManager:
         cache_folder=None,
         parallel_use: bool = False,
         single_subject_caching: bool = False,
+        max_cache_bytes: int = None,
+        max_memory_cache_bytes: int = None,
+        memory_cache_last_only: bool = False,
     ):
         self._hash = _hash
         self.cache_folder = cache_folder
@@ -29,6 +331,35 @@ class CacheManager:
         self.parallel_use = parallel_use
         self.single_subject_caching = single_subject_caching
 
+        # upper bound for the size of all cache entries in the cache folder
+        self.max_cache_bytes = max_cache_bytes
+        # upper bound for the in-process memory cache in front of the cache folder
+        self.max_memory_cache_bytes = max_memory_cache_bytes
+        # if True, only the output of the last element of a chain is kept in memory
+        self.memory_cache_last_only = memory_cache_last_only
+        self.statistics = {
+            "hits": 0,
+            "memory_hits": 0,
+            "misses": 0,
+            "waits": 0,
+            "evictions": 0,
+            "evicted_bytes": 0,
+        }
+        # groups of entries this cache manager has found in the cache: the pipeline elements
+        # have not been fitted, so their outputs for further data must not be evicted
+        self._pinned_groups = set()
+        # cache entries this cache manager is computing, see try_claim
+        self._claimed_keys = set()
+
+        # (weak reference to data, digest) of the data seen last, so that the same array
+        # is only hashed once, e.g. when it is first fitted and then transformed
+        self._digest_memo = list()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_digest_memo"] = list()
+        return state
+
     @property
     def hash(self):
         return self._hash
@@ -45,20 +376,51 @@ class CacheManager:
             self,
             config=None,
             nr_items=None,
-            first_data_hash=None,
+            data_digest=None,
             first_data_str: str = "",
         ):
             self.config = config
             self.nr_items = nr_items
-            self.first_data_hash = first_data_hash
+            self.data_digest = data_digest
             self.first_data_str = first_data_str
 
+    @staticmethod
+    def digest(obj):
+        """
+        Stable content digest that does not depend on the process or the PYTHONHASHSEED.
+        Numeric arrays are hashed directly from their buffer, anything else from its pickled representation.
+        """
+        h = hashlib.blake2b(digest_size=16)
+        if isinstance(obj, str):
+            h.update(obj.encode("utf-8"))
+        elif isinstance(obj, np.ndarray) and obj.dtype != object:
+            obj = np.ascontiguousarray(obj)
+            h.update(str((obj.dtype.str, obj.shape)).encode("utf-8"))
+            h.update(memoryview(obj.reshape(-1).view(np.uint8)))
+        else:
+            h.update(pickle.dumps(obj, protocol=4))
+        return h.hexdigest()
+
+    def _data_digest(self, X):
+        for data_ref, data_digest in self._digest_memo:
+            if data_ref() is X:
+                return data_digest
+        data_digest = CacheManager.digest(X)
+        try:
+            # keep the last two arrays, e.g. training and test data of a fold
+            memo_entry = (weakref.ref(X), data_digest)
+            self._digest_memo = [memo_entry] + self._digest_memo[:1]
+        except TypeError:
+            # lists and other builtins cannot be weakly referenced
+            pass
+        return data_digest
+
     def update_single_subject_state_info(self, X):
-        self.state.first_data_hash = hash(str(X[0]))
+        self.state.data_digest = CacheManager.digest(X[0])
         if isinstance(X[0], str):
             self.state.first_data_str = X[0]
         else:
-            self.state.first_data_str = str(self.state.first_data_hash)
+            self.state.first_data_str = self.state.data_digest
 
     def prepare(self, pipe_elements, config, X=None, single_subject_caching=False):
 
@@ -69,12 +431,12 @@ class CacheManager:
         self.state = CacheManager.State(config=config)
 
         if X is not None:
-            self.state.first_data_hash = hash(str(X[0]))
+            self.state.data_digest = self._data_digest(X)
             if isinstance(X, np.ndarray):
                 self.state.nr_items = X.shape[0]
             else:
                 self.state.nr_items = len(X)
-            self.state.first_data_str = str(self.state.first_data_hash)
+            self.state.first_data_str = self.state.data_digest
 
         if single_subject_caching:
             self.state.nr_items = 1
@@ -98,15 +460,36 @@ class CacheManager:
                     item_name = key_name
 
                 if item_name in relevant_keys:
-                    if isinstance(key_value, list):
-                        key_value = frozenset(key_value)
                     relevant_dict[key_name] = key_value
 
-        return hash(frozenset(relevant_dict.items()))
+        return CacheManager.digest(repr(sorted(relevant_dict.items())))
+
+    def _memory_cache_key(self, cache_query):
+        return self.cache_folder, cache_query
+
+    def _put_into_memory_cache(self, pipe_element_name, cache_query, data):
+        if self.memory_cache_last_only and pipe_element_name in self.pipe_order:
+            # the outputs of the elements before are not needed in memory any more
+            for item in self.pipe_order[: self.pipe_order.index(pipe_element_name)]:
+                CacheManager.memory_cache.discard(
+                    self._memory_cache_key(self.generate_cache_key(item))
+                )
+        CacheManager.memory_cache.put(
+            self._memory_cache_key(cache_query), data, self.max_memory_cache_bytes
+        )
 
     def load_cached_data(self, pipe_element_name):
 
         cache_query = self.generate_cache_key(pipe_element_name)
+        if self.max_memory_cache_bytes is not None:
+            cached_result = CacheManager.memory_cache.get(
+                self._memory_cache_key(cache_query)
+            )
+            if cached_result is not None:
+                self.statistics["hits"] += 1
+                self.statistics["memory_hits"] += 1
+                return cached_result
+
         if cache_query in self.cache_index:
             if not self.single_subject_caching:
                 logger.debug(
@@ -120,14 +503,35 @@ class CacheManager:
                     + str(self.state.config)
                 )
             filename = self.cache_index[cache_query]
-            # lock = Lock(filename)
-            # lock.acquire()
-            with open(filename, "rb") as f:
-                (X, y, kwargs) = joblib.load(f)
-
+            try:
+                # numeric arrays are memory-mapped copy-on-write instead of being copied into memory,
+                # so that all processes using the same cache entry share the page cache, while
+                # elements changing their input in place only change their private copy
+                (X, y, kwargs) = joblib.load(filename, mmap_mode="c")
+            except FileNotFoundError:
+                # evicted by another process in the meantime
+                CacheIndex.of(self.cache_folder).remove(cache_query)
+                return None
+            if self.max_cache_bytes is not None:
+                # access order for the LRU eviction
+                CacheIndex.of(self.cache_folder).touch(cache_query)
+
+            self.statistics["hits"] += 1
+            if self.max_memory_cache_bytes is not None:
+                self._put_into_memory_cache(
+                    pipe_element_name, cache_query, (X, y, kwargs)
+                )
             return X, y, kwargs
         return None
 
+    def generate_group_key(self, pipe_element_name):
+        """
+        Key shared by the outputs of a pipeline element for all data it has been applied to
+        with the same configuration in the same fold, e.g. training and test data.
+        """
+        config_hash = self._find_config_for_element(pipe_element_name)
+        return CacheManager.digest(repr((pipe_element_name, self.hash, config_hash)))
+
     def generate_cache_key(self, pipe_element_name):
         config_hash = self._find_config_for_element(pipe_element_name)
         cache_query = (
@@ -135,22 +539,43 @@ class CacheManager:
             self.hash,
             config_hash,
             self.state.nr_items,
-            self.state.first_data_hash,
+            self.state.data_digest,
         )
-        return hash(cache_query)
+        return CacheManager.digest(repr(cache_query))
 
     def check_cache(self, pipe_element_name):
         cache_query = self.generate_cache_key(pipe_element_name)
 
+        if self.max_memory_cache_bytes is not None and (
+            self._memory_cache_key(cache_query) in CacheManager.memory_cache
+        ):
+            if self.max_cache_bytes is not None:
+                self._pinned_groups.add(self.generate_group_key(pipe_element_name))
+            return True
+
         if cache_query in self.cache_index:
+            if self.max_cache_bytes is not None:
+                # make sure the entry has not been evicted meanwhile and mark it as recently used
+                index = CacheIndex.of(self.cache_folder)
+                if not os.path.isfile(self.cache_index[cache_query]):
+                    index.remove(cache_query)
+                    return False
+                index.touch(cache_query)
+                self._pinned_groups.add(self.generate_group_key(pipe_element_name))
             return True
         else:
             return False
 
-    def save_data_to_cache(self, pipe_element_name, data):
+    def save_data_to_cache(self, pipe_element_name, data, compute_duration=None):
+        """
+        Write the output of a pipeline element to the cache.
+
+        compute_duration is the time in seconds it took to calculate the data. If a cache budget
+        is set, it is stored next to the entry so that cheap entries can be evicted first.
+        """
         cache_query = self.generate_cache_key(pipe_element_name)
-        filename = os.path.join(self.cache_folder, str(cache_query) + ".p")
-        self.cache_index[cache_query] = filename
+        filename = os.path.join(self.cache_folder, cache_query + ".p")
+        self.statistics["misses"] += 1
         if not self.single_subject_caching:
             logger.debug(
                 "Saving data to cache for "
@@ -164,14 +589,189 @@ class CacheManager:
             )
 
         # write cached data to filesystem
-        with open(filename, "wb") as f:
-            joblib.dump(data, f)
+        start_time_saving = datetime.datetime.now()
+        entry_size = atomic_write(
+            filename, lambda tmp_filename: joblib.dump(data, tmp_filename)
+        )
+        saving_duration = (datetime.datetime.now() - start_time_saving).total_seconds()
+
+        group_key = None
+        cheap = False
+        if self.max_cache_bytes is not None:
+            group_key = self.generate_group_key(pipe_element_name)
+            cheap = compute_duration is not None and compute_duration <= saving_duration
+        index = CacheIndex.of(self.cache_folder)
+        index.add(cache_query, entry_size, group_key, cheap)
+        # only now that the entry is visible, processes waiting for it may go on
+        self._release(cache_query)
+
+        if self.max_memory_cache_bytes is not None:
+            self._put_into_memory_cache(pipe_element_name, cache_query, data)
+
+        if (
+            self.max_cache_bytes is not None
+            and index.nbytes > self.max_cache_bytes
+        ):
+            self.evict(keep_group=group_key)
+
+    def _in_flight_marker(self, cache_query):
+        return os.path.join(self.cache_folder, cache_query + ".inflight")
+
+    @staticmethod
+    def _is_abandoned(marker):
+        try:
+            age = time.time() - os.path.getmtime(marker)
+            with open(marker, "r") as f:
+                owner = f.read().split()
+        except FileNotFoundError:
+            return False
+        if os.name == "posix" and len(owner) == 2 and owner[0] == socket.gethostname():
+            try:
+                os.kill(int(owner[1]), 0)
+            except ProcessLookupError:
+                return True
+            except (PermissionError, ValueError):
+                pass
+        return age > CacheManager.IN_FLIGHT_TIMEOUT
+
+    @staticmethod
+    def _remove_marker(marker):
+        try:
+            os.remove(marker)
+        except FileNotFoundError:
+            pass
+
+    def try_claim(self, pipe_element_name):
+        """
+        Mark the cache entry of a pipeline element as being computed by this process, so that other
+        processes needing the same entry wait for it instead of computing it again.
+
+        Returns False if another process is computing the entry already. Markers of processes that
+        died on this host or that are older than IN_FLIGHT_TIMEOUT are taken over.
+        """
+        cache_query = self.generate_cache_key(pipe_element_name)
+        marker = self._in_flight_marker(cache_query)
+        for _ in range(2):
+            try:
+                marker_file = os.open(marker, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+            except FileExistsError:
+                if self._is_abandoned(marker):
+                    self._remove_marker(marker)
+                    continue
+                return False
+            try:
+                os.write(
+                    marker_file,
+                    "{} {}".format(socket.gethostname(), os.getpid()).encode(),
+                )
+            finally:
+                os.close(marker_file)
+            self._claimed_keys.add(cache_query)
+            return True
+        return False
+
+    def wait_for(self, pipe_element_name, poll_interval=0.05):
+        """
+        Wait until no other process is computing the cache entry of a pipeline element any more.
+
+        Returns True if the entry is in the cache afterwards, False if its computation failed.
+        """
+        cache_query = self.generate_cache_key(pipe_element_name)
+        marker = self._in_flight_marker(cache_query)
+        if os.path.exists(marker):
+            self.statistics["waits"] += 1
+        while os.path.exists(marker):
+            if self._is_abandoned(marker):
+                self._remove_marker(marker)
+                break
+            time.sleep(poll_interval)
+            poll_interval = min(2 * poll_interval, 1)
+        self.read_cache_index()
+        return cache_query in self.cache_index
+
+    def acquire(self, pipe_element_name):
+        """
+        Single-flight computation of a cache entry: if another process is computing the entry, wait
+        for it and return its result. Otherwise claim the entry and return None, the caller then
+        computes the data, saves it with save_data_to_cache and calls release in any case.
+        """
+        while not self.try_claim(pipe_element_name):
+            if self.wait_for(pipe_element_name):
+                cached_result = self.load_cached_data(pipe_element_name)
+                if cached_result is not None:
+                    return cached_result
+        return None
+
+    def _release(self, cache_query):
+        if cache_query in self._claimed_keys:
+            self._claimed_keys.discard(cache_query)
+            self._remove_marker(self._in_flight_marker(cache_query))
+
+    def release(self, pipe_element_name=None):
+        """
+        Remove the in-flight marker of a pipeline element claimed by try_claim,
+        or all markers of this cache manager if no element is given.
+        """
+        if pipe_element_name is None:
+            for cache_query in list(self._claimed_keys):
+                self._release(cache_query)
+        else:
+            self._release(self.generate_cache_key(pipe_element_name))
 
     def read_cache_index(self):
-        cached_files = glob.glob(os.path.join(self.cache_folder, "*.p"))
-        self.cache_index = {
-            int(os.path.splitext(os.path.basename(i))[0]): i for i in cached_files
-        }
+        index = CacheIndex.of(self.cache_folder)
+        index.refresh()
+        self.cache_index = index.files
+
+    def evict(self, keep_group=None):
+        """
+        Delete cache entries until the cache folder fits into max_cache_bytes again.
+
+        The outputs of an element for all data of a fold (see generate_group_key) are evicted together,
+        because a pipeline that loads the training data from the cache skips fitting the element and
+        then relies on the cached test data as well. Groups that can be recomputed at least as fast
+        as they can be written to (and hence read from) the cache are evicted first, the least recently
+        used first within both categories. Groups in use by this cache manager and keep_group, to which
+        data has just been written, are kept.
+        """
+        index = CacheIndex.of(self.cache_folder)
+        # the index knows sizes, groups and access order of all entries, so that only the evicted
+        # entries touch the file system
+        index.refresh()
+        groups = dict()
+        total_bytes = index.nbytes
+        for key, size, group, cheap in index.entries_by_access():
+            if group == keep_group or group in self._pinned_groups:
+                continue
+            if group not in groups:
+                groups[group] = {"cheap": True, "last_access": 0, "entries": list()}
+            groups[group]["cheap"] = groups[group]["cheap"] and cheap
+            groups[group]["last_access"] = index.last_access[key]
+            groups[group]["entries"].append((key, size))
+
+        eviction_order = sorted(
+            groups.values(), key=lambda g: (not g["cheap"], g["last_access"])
+        )
+        for group in eviction_order:
+            if total_bytes <= self.max_cache_bytes:
+                break
+            for key, size in group["entries"]:
+                total_bytes -= size
+                index.remove(key)
+                try:
+                    os.remove(os.path.join(self.cache_folder, key + ".p"))
+                except FileNotFoundError:
+                    # evicted by another process
+                    continue
+                self.statistics["evictions"] += 1
+                self.statistics["evicted_bytes"] += size
+
+        if total_bytes > self.max_cache_bytes:
+            logger.debug(
+                "Cache folder "
+                + self.cache_folder
+                + " exceeds max_cache_bytes, all remaining entries are in use."
+            )
 
     def clear_cache(self):
         CacheManager.clear_cache_files(self.cache_folder)
@@ -179,6 +779,7 @@ class CacheManager:
     @staticmethod
     def clear_cache_files(cache_folder, force_all=False):
         if cache_folder is not None:
+            CacheManager.memory_cache.clear(cache_folder, force_all)
             if os.path.isdir(cache_folder):
                 for the_file in os.listdir(cache_folder):
                     file_path = os.path.join(cache_folder, the_file)
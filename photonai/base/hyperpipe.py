@@ -1,4 +1,5 @@
 import datetime
+import functools
 import importlib
 import importlib.util
 import inspect
@@ -14,11 +15,9 @@ from dataclasses import dataclass
 from typing import Dict
 from copy import deepcopy
 
-import dask
 import numpy as np
 import pandas as pd
 from bson.objectid import ObjectId
-from dask.distributed import Client
 from sklearn.base import BaseEstimator
 from sklearn.dummy import DummyClassifier, DummyRegressor
 from sklearn.externals import joblib
@@ -39,6 +38,7 @@ from photonai.base.photon_elements import (
     PhotonNative,
 )
 from photonai.base.photon_pipeline import PhotonPipeline
+from photonai.helper.helper import PhotonDataHelper, PhotonWorkerPool
 from photonai.optimization import (
     GridSearchOptimizer,
     TimeBoxedRandomGridSearchOptimizer,
@@ -100,6 +100,13 @@ class OutputSettings:
 
     * `wizard_project_name` [str]:
        How the project is titled in the PHOTON Wizard
+
+    * `resume` [bool, default=False]:
+        If True, the results folder gets no timestamp and every tested config is saved as soon as it is computed,
+        together with the indices of the cross validation folds. If the fit is interrupted, fitting the hyperpipe
+        again continues the analysis: finished outer folds are taken over and the configs of an unfinished outer
+        fold are told to the optimizer instead of being computed again. Requires save_output=True. Outer folds
+        computed in parallel (nr_of_processes > 1) are only saved once they are finished.
     """
 
     def __init__(
@@ -112,10 +119,12 @@ class OutputSettings:
         user_id: str = "",
         wizard_object_id: str = "",
         wizard_project_name: str = "",
+        resume: bool = False,
     ):
 
         self.mongodb_connect_url = mongodb_connect_url
         self.overwrite_results = overwrite_results
+        self.resume = resume
 
         if project_folder == "":
             self.project_folder = os.getcwd()
@@ -147,7 +156,7 @@ class OutputSettings:
 
         if self.save_output:
             # Todo: give rights to user if this is done by docker container
-            if self.overwrite_results:
+            if self.overwrite_results or self.resume:
                 self.results_folder = os.path.join(
                     self.project_folder, name + "_results"
                 )
@@ -203,6 +212,12 @@ class OutputSettings:
             self.logging_file_handler.close()
             self.logging_file_handler.baseFilename = self.log_file
 
+    def __getstate__(self):
+        # file handlers cannot be pickled, a worker process opens its own in set_log_file
+        state = self.__dict__.copy()
+        state["logging_file_handler"] = None
+        return state
+
     def set_log_level(self):
         verbose_num = self._get_log_level()
         logger.setLevel(verbose_num)
@@ -290,6 +305,46 @@ class Hyperpipe(BaseEstimator):
         variable and a StratifiedCV is passed, the targets will be ignored and only the group variable will be used
         for the stratification.
 
+    * `cache_folder` [str, default=None]:
+        Folder in which the outputs of the pipeline transformers are cached, so that configurations sharing
+        the same preprocessing do not have to recompute it.
+
+    * `max_cache_bytes` [int, default=None]:
+        Upper bound for the size of each cache folder in bytes. When it is exceeded, cache entries that can be
+        recomputed faster than they can be loaded are evicted first, then the least recently used ones.
+        None means the cache grows until it is cleared at the end of each outer fold.
+
+    * `max_memory_cache_bytes` [int, default=None]:
+        Size of an in-memory cache in front of the cache folder, kept by every process. Configurations that
+        share a prefix of the pipeline, e.g. that only differ in the hyperparameters of the estimator,
+        then take the transformed data from memory instead of reading it from disk. None disables it.
+
+    * `memory_cache_last_only` [bool, default=False]:
+        If True, only the output of the last cached element of a pipeline is kept in memory,
+        instead of the outputs of all elements.
+
+    * `nr_of_processes` [int, default=1]:
+        Number of outer folds that are computed in parallel, each in its own worker process.
+        The configurations and inner folds of an outer fold are then computed one after another
+        inside its worker, config_n_jobs and inner_fold_n_jobs are ignored.
+
+    * `parallel_backend` [str, default="processes"]:
+        How the outer folds (nr_of_processes > 1), the configurations (config_n_jobs > 1)
+        and the inner folds (inner_fold_n_jobs > 1) are distributed:
+        "processes" uses a local process pool, "dask" a local dask cluster with worker processes.
+        The data is shared with the workers via a read-only memory map instead of being copied for every fold.
+
+    * `inner_fold_n_jobs` [int, default=1]:
+        Number of worker processes the inner cross validation folds of each configuration are distributed to.
+        The results are collected in fold order. If performance constraints are set, the folds that
+        have not been started yet are cancelled as soon as a constraint stops the cross validation.
+
+    * `config_n_jobs` [int, default=1]:
+        Number of hyperparameter configurations that are tested at the same time, each in its own worker process.
+        Whenever a configuration is done, the optimizer is asked for new ones. Grid and random search hand out
+        their configurations freely, scikit-optimize uses a constant liar strategy and smac hands out the
+        challengers of one iteration. If config_n_jobs > 1, inner_fold_n_jobs is ignored.
+
     Attributes
     ----------
     * `optimum_pipe` [Pipeline]:
@@ -341,7 +396,13 @@ class Hyperpipe(BaseEstimator):
         performance_constraints=None,
         permutation_id: str = None,
         cache_folder: str = None,
+        max_cache_bytes: int = None,
+        max_memory_cache_bytes: int = None,
+        memory_cache_last_only: bool = False,
         nr_of_processes: int = 1,
+        parallel_backend: str = "processes",
+        inner_fold_n_jobs: int = 1,
+        config_n_jobs: int = 1,
     ):
 
         self.name = re.sub(r"\W+", "", name)
@@ -350,6 +411,9 @@ class Hyperpipe(BaseEstimator):
             self.cache_folder = os.path.join(cache_folder, self.name)
         else:
             self.cache_folder = None
+        self.max_cache_bytes = max_cache_bytes
+        self.max_memory_cache_bytes = max_memory_cache_bytes
+        self.memory_cache_last_only = memory_cache_last_only
         # ====================== Cross Validation ===========================
         # check if both calculate_metrics_per_folds and calculate_metrics_across_folds is False
         if not calculate_metrics_across_folds and not calculate_metrics_per_fold:
@@ -378,6 +442,9 @@ class Hyperpipe(BaseEstimator):
         self.results_handler = None
         self.results = None
         self.best_config = None
+        self._resume = False
+        self._resume_digests = None
+        self._saved_inner_folds = 0
 
         # ====================== Pipeline ===========================
         self.elements = []
@@ -401,6 +468,15 @@ class Hyperpipe(BaseEstimator):
 
         self.is_final_fit = False
         self.nr_of_processes = nr_of_processes
+        if parallel_backend not in PhotonWorkerPool.BACKENDS:
+            raise_PhotonaiError(
+                "Parallel backend {} not supported. Choose one of {}".format(
+                    parallel_backend, PhotonWorkerPool.BACKENDS
+                )
+            )
+        self.parallel_backend = parallel_backend
+        self.inner_fold_n_jobs = inner_fold_n_jobs
+        self.config_n_jobs = config_n_jobs
         self.random_state = random_seed
         if random_seed:
             import random
@@ -848,7 +924,10 @@ class Hyperpipe(BaseEstimator):
         # set caching
         # we want caching disabled in general but still want to do single subject caching
         self.recursive_cache_folder_propagation(
-            self.optimum_pipe, self.cache_folder, "fixed_fold_id"
+            self.optimum_pipe,
+            self.cache_folder,
+            "fixed_fold_id",
+            self.cache_settings,
         )
         self.optimum_pipe.caching = False
 
@@ -1009,12 +1088,22 @@ class Hyperpipe(BaseEstimator):
     #     if cache_folder and not os.path.isdir(cache_folder):
     #         os.makedirs(cache_folder, exist_ok=True)
 
+    @property
+    def cache_settings(self):
+        return {
+            "max_cache_bytes": self.max_cache_bytes,
+            "max_memory_cache_bytes": self.max_memory_cache_bytes,
+            "memory_cache_last_only": self.memory_cache_last_only,
+        }
+
     @staticmethod
-    def recursive_cache_folder_propagation(element, cache_folder, inner_fold_id):
+    def recursive_cache_folder_propagation(
+        element, cache_folder, inner_fold_id, cache_settings=None
+    ):
         if isinstance(element, (Switch, Stack, Preprocessing)):
             for child in element.elements:
                 Hyperpipe.recursive_cache_folder_propagation(
-                    child, cache_folder, inner_fold_id
+                    child, cache_folder, inner_fold_id, cache_settings
                 )
 
         elif isinstance(element, Branch):
@@ -1022,11 +1111,15 @@ class Hyperpipe(BaseEstimator):
             if cache_folder:
                 cache_folder = os.path.join(cache_folder, element.name)
             Hyperpipe.recursive_cache_folder_propagation(
-                element.base_element, cache_folder, inner_fold_id
+                element.base_element, cache_folder, inner_fold_id, cache_settings
             )
             # Hyperpipe.prepare_caching(element.base_element.cache_folder)
 
         elif isinstance(element, PhotonPipeline):
+            # size limits of the cache, they have to be known when the cache manager is created
+            if cache_settings is not None:
+                for setting, value in cache_settings.items():
+                    setattr(element, setting, value)
             element.fold_id = inner_fold_id
             element.cache_folder = cache_folder
 
@@ -1035,7 +1128,7 @@ class Hyperpipe(BaseEstimator):
             for name, child in element.named_steps.items():
                 # we need to check if any element is Branch, Stack or Swtich
                 Hyperpipe.recursive_cache_folder_propagation(
-                    child, cache_folder, inner_fold_id
+                    child, cache_folder, inner_fold_id, cache_settings
                 )
 
         # if it's a simple PipelineElement, then we just don't do anything
@@ -1068,12 +1161,121 @@ class Hyperpipe(BaseEstimator):
             return estimation_type
 
     @staticmethod
-    def fit_outer_folds(outer_fold_computer, X, y, kwargs, cache_folder):
-        try:
-            outer_fold_computer.fit(X, y, **kwargs)
-        finally:
-            CacheManager.clear_cache_files(cache_folder)
-        return
+    def fit_outer_fold_in_worker(outer_fold_computer, shared_data_file):
+        # runs in a worker process: the data is memory-mapped, the result tree is sent back to the parent
+        X, y, kwargs = PhotonDataHelper.load_shared_data(shared_data_file)
+        outer_fold_computer.fit(X, y, **kwargs)
+        return outer_fold_computer.result_object
+
+    def _fit_outer_folds_parallelized(self, outer_fold_computers):
+        """
+        outer_fold_computers is a list of (position in results.outer_folds, OuterFoldManager) tuples
+        """
+        logger.info(
+            "Computing {} outer folds on {} processes...".format(
+                len(outer_fold_computers), self.nr_of_processes
+            )
+        )
+        with PhotonWorkerPool(
+            self.nr_of_processes, self.parallel_backend
+        ) as worker_pool:
+            shared_data_file = worker_pool.share_data(
+                self.data.X, self.data.y, self.data.kwargs
+            )
+            futures = [
+                (
+                    i,
+                    worker_pool.submit(
+                        Hyperpipe.fit_outer_fold_in_worker,
+                        outer_fold_computer,
+                        shared_data_file,
+                    ),
+                )
+                for i, outer_fold_computer in outer_fold_computers
+            ]
+            # merge the result trees back in fold order
+            for i, future in futures:
+                self.results.outer_folds[i] = future.result()
+                self._save_results()
+
+    def _load_interrupted_run(self):
+        """
+        Returns the fold indices and the result tree that a previous fit with resume=True saved to the
+        results folder, or (None, None) if there is nothing to continue.
+        """
+        fold_file = os.path.join(
+            self.output_settings.results_folder, "photon_fold_indices.p"
+        )
+        results_file = os.path.join(
+            self.output_settings.results_folder, "photon_result_file.p"
+        )
+        if not (os.path.isfile(fold_file) and os.path.isfile(results_file)):
+            return None, None
+        with open(fold_file, "rb") as f:
+            fold_indices = pickle.load(f)
+        if (
+            fold_indices["n_samples"] != self.data.y.shape[0]
+            or fold_indices.get("data_digest") != self._resume_digests[0]
+            or fold_indices.get("pipeline_digest") != self._resume_digests[1]
+        ):
+            logger.warning(
+                "Found results of a previous fit on different data or with a different "
+                "pipeline in " + self.output_settings.results_folder + ". "
+                "Starting from scratch."
+            )
+            return None, None
+        logger.info("Resuming fit from " + self.output_settings.results_folder)
+        return fold_indices, MDBHelper.load_results(results_file)
+
+    def _compute_resume_digests(self):
+        """
+        Digests of the data and of the analysis design, a fit is only resumed if both match.
+        """
+        data_digest = CacheManager.digest(
+            (
+                CacheManager.digest(np.asarray(self.data.X)),
+                CacheManager.digest(np.asarray(self.data.y)),
+                [
+                    (key, CacheManager.digest(np.asarray(value)))
+                    for key, value in sorted(self.data.kwargs.items())
+                ],
+            )
+        )
+        # the elements with their hyperparameter space, the optimizer and the cross validation
+        info = self.results.hyperpipe_info
+        pipeline_digest = CacheManager.digest(
+            (
+                info.flowchart,
+                info.optimization,
+                info.cross_validation,
+                info.metrics,
+                info.best_config_metric,
+            )
+        )
+        return data_digest, pipeline_digest
+
+    def _save_fold_indices(self):
+        fold_indices = {
+            "n_samples": self.data.y.shape[0],
+            "data_digest": self._resume_digests[0],
+            "pipeline_digest": self._resume_digests[1],
+            "outer_folds": list(self.cross_validation.outer_folds.values()),
+            "inner_folds": self.cross_validation.inner_folds,
+        }
+        with open(
+            os.path.join(self.output_settings.results_folder, "photon_fold_indices.p"),
+            "wb",
+        ) as f:
+            pickle.dump(fold_indices, f)
+        self._saved_inner_folds = len(self.cross_validation.inner_folds)
+
+    def _save_results(self):
+        # with resume the fold indices are saved as well, whenever new inner folds were drawn
+        if self._resume and self._saved_inner_folds != len(
+            self.cross_validation.inner_folds
+        ):
+            self._save_fold_indices()
+        self.results_handler.save()
 
     def fit(self, data, targets, **kwargs):
         """
@@ -1120,12 +1322,6 @@ class Hyperpipe(BaseEstimator):
         )
         logger.info("Preparing data and PHOTON objects for analysis...")
 
-        # loop over outer cross validation
-        if self.nr_of_processes > 1:
-            hyperpipe_client = Client(
-                threads_per_worker=1, n_workers=self.nr_of_processes, processes=False
-            )
-
         try:
             # check data
             self._input_data_sanity_checks(data, targets, **kwargs)
@@ -1137,19 +1333,33 @@ class Hyperpipe(BaseEstimator):
             self.preprocess_data()
 
             if not self.is_final_fit:
+                self._resume = (
+                    self.output_settings.resume and self.output_settings.save_output
+                )
+                fold_indices, interrupted_results = None, None
+                if self._resume:
+                    self._resume_digests = self._compute_resume_digests()
+                    fold_indices, interrupted_results = self._load_interrupted_run()
 
                 # Outer Folds
-                outer_folds = FoldInfo.generate_folds(
-                    self.cross_validation.outer_cv,
-                    self.data.X,
-                    self.data.y,
-                    self.data.kwargs,
-                    self.cross_validation.eval_final_performance,
-                    self.cross_validation.test_size,
-                )
+                if fold_indices is not None:
+                    outer_folds = fold_indices["outer_folds"]
+                    self.cross_validation.inner_folds = fold_indices["inner_folds"]
+                else:
+                    outer_folds = FoldInfo.generate_folds(
+                        self.cross_validation.outer_cv,
+                        self.data.X,
+                        self.data.y,
+                        self.data.kwargs,
+                        self.cross_validation.eval_final_performance,
+                        self.cross_validation.test_size,
+                    )
+                    self.cross_validation.inner_folds = dict()
 
                 self.cross_validation.outer_folds = {f.fold_id: f for f in outer_folds}
-                delayed_jobs = []
+                if self._resume:
+                    self._save_fold_indices()
+                outer_fold_computers = []
 
                 # Run Dummy Estimator
                 dummy_estimator = self._prepare_dummy_estimator()
@@ -1158,8 +1368,38 @@ class Hyperpipe(BaseEstimator):
                     logger.info("Removing cache files...")
                     CacheManager.clear_cache_files(self.cache_folder, force_all=True)
 
+                inner_fold_n_jobs = self.inner_fold_n_jobs
+                config_n_jobs = self.config_n_jobs
+                if self.nr_of_processes > 1 and (
+                    inner_fold_n_jobs > 1 or config_n_jobs > 1
+                ):
+                    # worker processes must not start worker pools of their own
+                    logger.warning(
+                        "Computing the outer folds on {} processes, ignoring "
+                        "config_n_jobs and inner_fold_n_jobs".format(
+                            self.nr_of_processes
+                        )
+                    )
+                    inner_fold_n_jobs = 1
+                    config_n_jobs = 1
+
                 # loop over outer cross validation
                 for i, outer_f in enumerate(outer_folds):
+                    finished_configs = None
+                    if interrupted_results is not None and i < len(
+                        interrupted_results.outer_folds
+                    ):
+                        interrupted_fold = interrupted_results.outer_folds[i]
+                        if interrupted_fold.best_config is not None:
+                            # the outer fold was finished before the fit was interrupted
+                            logger.info(
+                                "Taking over outer fold {} from the results".format(
+                                    outer_f.fold_nr
+                                )
+                            )
+                            self.results.outer_folds.append(interrupted_fold)
+                            continue
+                        finished_configs = interrupted_fold.tested_config_list
 
                     # 1. generate OuterFolds Object
                     outer_fold = MDBOuterFold(fold_nr=outer_f.fold_nr)
@@ -1169,37 +1409,42 @@ class Hyperpipe(BaseEstimator):
                         outer_f.fold_id,
                         self.cross_validation,
                         cache_folder=self.cache_folder,
-                        cache_updater=self.recursive_cache_folder_propagation,
+                        cache_updater=functools.partial(
+                            self.recursive_cache_folder_propagation,
+                            cache_settings=self.cache_settings,
+                        ),
                         dummy_estimator=dummy_estimator,
                         result_obj=outer_fold,
+                        inner_fold_n_jobs=inner_fold_n_jobs,
+                        config_n_jobs=config_n_jobs,
+                        parallel_backend=self.parallel_backend,
+                        finished_configs=finished_configs,
                     )
                     # 2. monitor outputs
                     self.results.outer_folds.append(outer_fold)
 
                     if self.nr_of_processes > 1:
-                        result = dask.delayed(Hyperpipe.fit_outer_folds)(
-                            outer_fold_computer,
-                            self.data.X,
-                            self.data.y,
-                            self.data.kwargs,
-                            self.cache_folder,
-                        )
-                        delayed_jobs.append(result)
+                        outer_fold_computers.append((i, outer_fold_computer))
                     else:
+                        if self._resume:
+                            outer_fold_computer.result_saver = self._save_results
                         try:
                             # 3. fit
                             outer_fold_computer.fit(
                                 self.data.X, self.data.y, **self.data.kwargs
                             )
                             # 4. save outer fold results
-                            self.results_handler.save()
+                            self._save_results()
                         finally:
                             # 5. clear cache
                             CacheManager.clear_cache_files(self.cache_folder)
 
-                if self.nr_of_processes > 1:
-                    dask.compute(*delayed_jobs)
-                    self.results_handler.save()
+                if outer_fold_computers:
+                    try:
+                        self._fit_outer_folds_parallelized(outer_fold_computers)
+                    finally:
+                        # the folds share the cache folder, so it is cleared once all of them are done
+                        CacheManager.clear_cache_files(self.cache_folder)
 
                 # evaluate hyperparameter optimization results for best config
                 self._finalize_optimization()
@@ -1216,9 +1461,6 @@ class Hyperpipe(BaseEstimator):
             logger.error(traceback.format_exc())
             traceback.print_exc()
             raise e
-        finally:
-            if self.nr_of_processes > 1:
-                hyperpipe_client.close()
         return self
 
     def predict(self, data, **kwargs):
@@ -25,6 +25,23 @@ class PhotonPipeline(_BaseComposition):
             "predict": [],
         }
         self.cache_man = None
+        self.max_cache_bytes = None
+        self.max_memory_cache_bytes = None
+        self.memory_cache_last_only = False
+        # hits, misses and evictions of all cache managers this pipe has used
+        self.cache_statistics = {
+            "hits": 0,
+            "memory_hits": 0,
+            "misses": 0,
+            "waits": 0,
+            "evictions": 0,
+            "evicted_bytes": 0,
+        }
+
+        # elements that have not been fitted because their output was found in the cache, and
+        # the training data to fit them in case the cache entries for further data are evicted
+        self._unfitted_elements = set()
+        self._fit_data = None
 
         # helper for single subject caching
         self._single_subject_caching = False
@@ -77,7 +94,11 @@ class PhotonPipeline(_BaseComposition):
                 self.cache_folder,
                 self._parallel_use,
                 self._single_subject_caching,
+                self.max_cache_bytes,
+                self.max_memory_cache_bytes,
+                self.memory_cache_last_only,
             )
+            self.cache_man.statistics = self.cache_statistics
 
     @property
     def cache_folder(self):
@@ -103,7 +124,11 @@ class PhotonPipeline(_BaseComposition):
                 self.cache_folder,
                 self._parallel_use,
                 self._single_subject_caching,
+                self.max_cache_bytes,
+                self.max_memory_cache_bytes,
+                self.memory_cache_last_only,
             )
+            self.cache_man.statistics = self.cache_statistics
         else:
             self.caching = False
 
@@ -166,8 +191,19 @@ class PhotonPipeline(_BaseComposition):
             )
 
     def fit(self, X, y=None, **kwargs):
+        self._fit(X, y, **kwargs)
+        return self
 
+    def _fit(self, X, y=None, **kwargs):
+        """
+        Fits all elements and returns the training data as transformed for the final estimator.
+        """
         self._validate_elements()
+        self._unfitted_elements = set()
+        if self.caching and self.max_cache_bytes is not None:
+            self._fit_data = (X, y, kwargs)
+        else:
+            self._fit_data = None
         X, y, kwargs = self._caching_fit_transform(X, y, kwargs, fit=True)
 
         if self._final_estimator is not None:
@@ -180,7 +216,7 @@ class PhotonPipeline(_BaseComposition):
             n = PhotonDataHelper.find_n(X)
             fit_duration = (datetime.datetime.now() - fit_start_time).total_seconds()
             self.time_monitor["fit"].append((self.elements[-1][0], fit_duration, n))
-        return self
+        return X, y, kwargs
 
     def check_for_numpy_array(self, list_object):
         # be compatible to list of (image-) files
@@ -234,6 +270,7 @@ class PhotonPipeline(_BaseComposition):
         fit=False,
         needed_for_further_computation=False,
         initial_X=None,
+        preceding_steps=(),
     ):
         if not self.single_subject_caching:
             # if we do it group-wise then its easy
@@ -250,15 +287,42 @@ class PhotonPipeline(_BaseComposition):
                 cached_result = self.cache_man.load_cached_data(name)
 
             if cached_result is None:
-                X, y, kwargs = self._do_timed_fit_transform(
-                    name, transformer, fit, X, y, **kwargs
-                )
+                # the data might have been evicted from the cache after it had been found there,
+                # then the steps before that have been skipped and need to be redone first
+                for step_name, step in preceding_steps:
+                    X, y, kwargs = self.load_or_save_cached_data(
+                        step_name,
+                        X,
+                        y,
+                        kwargs,
+                        step,
+                        fit,
+                        needed_for_further_computation=True,
+                    )
+                # if another process is computing the same data, wait for its result
+                start_time_for_loading = datetime.datetime.now()
+                cached_result = self.cache_man.acquire(name)
 
-                start_time_saving = datetime.datetime.now()
-                self.cache_man.save_data_to_cache(name, (X, y, kwargs))
-                saving_duration = (
-                    datetime.datetime.now() - start_time_saving
-                ).total_seconds()
+            if cached_result is None:
+                try:
+                    self._fit_unfitted_elements(name, fit)
+                    start_time_computing = datetime.datetime.now()
+                    X, y, kwargs = self._do_timed_fit_transform(
+                        name, transformer, fit, X, y, **kwargs
+                    )
+                    computing_duration = (
+                        datetime.datetime.now() - start_time_computing
+                    ).total_seconds()
+
+                    start_time_saving = datetime.datetime.now()
+                    self.cache_man.save_data_to_cache(
+                        name, (X, y, kwargs), computing_duration
+                    )
+                    saving_duration = (
+                        datetime.datetime.now() - start_time_saving
+                    ).total_seconds()
+                finally:
+                    self.cache_man.release(name)
                 self.time_monitor["transform_cached"].append((name, saving_duration, 1))
             else:
                 X, y, kwargs = cached_result[0], cached_result[1], cached_result[2]
@@ -280,6 +344,8 @@ class PhotonPipeline(_BaseComposition):
                 list(),
             )
             list_of_idx_cached, list_of_idx_non_cached = list(), list()
+            # items another process is computing right now, they are loaded once they are ready
+            list_of_idx_in_flight = set()
 
             nr = PhotonDataHelper.find_n(X)
             for start, stop in PhotonDataHelper.chunker(nr, 1):
@@ -295,6 +361,9 @@ class PhotonPipeline(_BaseComposition):
                 # check if item has been processed
                 if self.cache_man.check_cache(name):
                     list_of_idx_cached.append(start)
+                elif not self.cache_man.try_claim(name):
+                    list_of_idx_cached.append(start)
+                    list_of_idx_in_flight.add(start)
                 else:
                     list_of_idx_non_cached.append(start)
                     X_uncached = PhotonDataHelper.stack_data_vertically(
@@ -313,35 +382,45 @@ class PhotonPipeline(_BaseComposition):
             # now we know which part can be loaded and which part should be transformed
             # first apply the transformation to the group, then save it single-subject-wise
             if len(list_of_idx_non_cached) > 0:
+                try:
+                    self._fit_unfitted_elements(name, fit)
 
-                # apply transformation groupwise
-                new_group_X, new_group_y, new_group_kwargs = self._do_timed_fit_transform(
-                    name, transformer, fit, X_uncached, y_uncached, **kwargs_uncached
-                )
-
-                # then save it single
-                nr = PhotonDataHelper.find_n(new_group_X)
-                for start in range(nr):
-                    # split data in single entities
-                    X_batched, y_batched, kwargs_dict_batched = PhotonDataHelper.split_data(
-                        new_group_X, new_group_y, new_group_kwargs, start, start
+                    # apply transformation groupwise
+                    start_time_computing = datetime.datetime.now()
+                    new_group_X, new_group_y, new_group_kwargs = self._do_timed_fit_transform(
+                        name, transformer, fit, X_uncached, y_uncached, **kwargs_uncached
                     )
-                    X_key, _, _ = PhotonDataHelper.split_data(
-                        initial_X_uncached, None, {}, start, start
-                    )
-                    # we save the data in relation to the input path (X_key = hash(input X))
-                    self.cache_man.update_single_subject_state_info(X_key)
 
-                    start_time_saving = datetime.datetime.now()
-                    self.cache_man.save_data_to_cache(
-                        name, (X_batched, y_batched, kwargs_dict_batched)
-                    )
-                    saving_duration = (
-                        datetime.datetime.now() - start_time_saving
-                    ).total_seconds()
-                    self.time_monitor["transform_cached"].append(
-                        (name, saving_duration, 1)
-                    )
+                    # then save it single
+                    nr = PhotonDataHelper.find_n(new_group_X)
+                    computing_duration = (
+                        datetime.datetime.now() - start_time_computing
+                    ).total_seconds() / max(nr, 1)
+                    for start in range(nr):
+                        # split data in single entities
+                        X_batched, y_batched, kwargs_dict_batched = PhotonDataHelper.split_data(
+                            new_group_X, new_group_y, new_group_kwargs, start, start
+                        )
+                        X_key, _, _ = PhotonDataHelper.split_data(
+                            initial_X_uncached, None, {}, start, start
+                        )
+                        # we save the data in relation to the input path (X_key = hash(input X))
+                        self.cache_man.update_single_subject_state_info(X_key)
+
+                        start_time_saving = datetime.datetime.now()
+                        self.cache_man.save_data_to_cache(
+                            name,
+                            (X_batched, y_batched, kwargs_dict_batched),
+                            computing_duration,
+                        )
+                        saving_duration = (
+                            datetime.datetime.now() - start_time_saving
+                        ).total_seconds()
+                        self.time_monitor["transform_cached"].append(
+                            (name, saving_duration, 1)
+                        )
+                finally:
+                    self.cache_man.release()
 
                 # we need to collect the data only when we want to load them
                 # we can skip that process if we only want them to get into the cache (case: parallelisation)
@@ -364,9 +443,23 @@ class PhotonPipeline(_BaseComposition):
 
                         # time the loading of the cached item
                         start_time_for_loading = datetime.datetime.now()
-                        transformed_X, transformed_y, transformed_kwargs = self.cache_man.load_cached_data(
-                            name
-                        )
+                        if cache_idx in list_of_idx_in_flight:
+                            self.cache_man.wait_for(name)
+                        cached_result = self.cache_man.load_cached_data(name)
+                        if cached_result is None:
+                            # the other process failed or the item has been evicted meanwhile
+                            X_single, y_single, kwargs_single = PhotonDataHelper.split_data(
+                                X, y, kwargs, cache_idx, cache_idx
+                            )
+                            cached_result = self._do_timed_fit_transform(
+                                name,
+                                transformer,
+                                fit,
+                                X_single,
+                                y_single,
+                                **kwargs_single
+                            )
+                        transformed_X, transformed_y, transformed_kwargs = cached_result
                         loading_duration = (
                             datetime.datetime.now() - start_time_for_loading
                         ).total_seconds()
@@ -403,6 +496,27 @@ class PhotonPipeline(_BaseComposition):
 
             return processed_X, processed_y, processed_kwargs
 
+    def _fit_unfitted_elements(self, name, fit):
+        """
+        An element whose output for the training data was loaded from the cache has not been fitted.
+        If its output for other data has been evicted from the cache meanwhile, it has to be computed,
+        so all elements are fitted on the training data again.
+        """
+        if fit or name not in self._unfitted_elements:
+            return
+        logger.debug(
+            "PhotonPipeline: Cache entries of "
+            + name
+            + " have been evicted, fitting the pipeline again."
+        )
+        X, y, kwargs = self._fit_data
+        self.caching = False
+        try:
+            self._caching_fit_transform(X, y, dict(kwargs), fit=True)
+        finally:
+            self.caching = True
+        self._unfitted_elements = set()
+
     def _do_timed_fit_transform(self, name, transformer, fit, X, y, **kwargs):
 
         n = PhotonDataHelper.find_n(X)
@@ -415,6 +529,7 @@ class PhotonPipeline(_BaseComposition):
             transformer.fit(X, y, **kwargs)
             fit_duration = (datetime.datetime.now() - fit_start_time).total_seconds()
             self.time_monitor["fit"].append((name, fit_duration, n))
+            self._unfitted_elements.discard(name)
 
         logger.debug("PhotonPipeline: Transforming data with " + transformer.name)
         transform_start_time = datetime.datetime.now()
@@ -446,7 +561,7 @@ class PhotonPipeline(_BaseComposition):
                     self.current_config,
                     single_subject_caching=True,
                 )
-            last_cached_item = None
+            cached_steps = list()
 
         # all elements except the last one
         num_steps = len(self.elements) - 1
@@ -464,31 +579,38 @@ class PhotonPipeline(_BaseComposition):
                 # load data when the first item occurs that needs new calculation
                 if self.cache_man.check_cache(name):
                     # as long as we find something cached, we remember what it was
-                    last_cached_item = name
+                    cached_steps.append((name, transformer))
+                    if fit and self._fit_data is not None:
+                        self._unfitted_elements.add(name)
                     # if it is the last step, we need to load the data now
                     if num + 1 == num_steps and not self.skip_loading:
                         X, y, kwargs = self.load_or_save_cached_data(
-                            last_cached_item,
+                            name,
                             X,
                             y,
                             kwargs,
                             transformer,
                             fit,
                             initial_X=initial_X,
+                            preceding_steps=cached_steps[:-1],
                         )
                 else:
-                    if last_cached_item is not None:
+                    if len(cached_steps) > 0:
                         # we load the cached data when the first transformation on this data is upcoming
+                        last_cached_name, last_cached_transformer = cached_steps[-1]
                         X, y, kwargs = self.load_or_save_cached_data(
-                            last_cached_item,
+                            last_cached_name,
                             X,
                             y,
                             kwargs,
-                            transformer,
+                            last_cached_transformer,
                             fit,
                             needed_for_further_computation=True,
                             initial_X=initial_X,
+                            preceding_steps=cached_steps[:-1],
                         )
+                        # later steps may be cached again while steps in between have been evicted
+                        cached_steps = list()
                     X, y, kwargs = self.load_or_save_cached_data(
                         name, X, y, kwargs, transformer, fit, initial_X=initial_X
                     )
@@ -567,10 +689,15 @@ class PhotonPipeline(_BaseComposition):
         return X, y, kwargs
 
     def fit_transform(self, X, y=None, **kwargs):
-        # return self.fit(X, y, **kwargs).transform(X, y, **kwargs)
-        raise NotImplementedError(
-            "fit_transform not yet implemented in PHOTON Pipeline"
-        )
+        """
+        Same as fit(X, y, **kwargs).transform(X, y, **kwargs), but the training data
+        is not pushed through the pipeline again: the transformation computed while fitting
+        is returned.
+        """
+        X, y, kwargs = self._fit(X, y, **kwargs)
+        if self._final_estimator is not None and self._estimator_type is None:
+            X, y, kwargs = self._final_estimator.transform(X, y, **kwargs)
+        return X, y, kwargs
 
     def fit_predict(self, X, y=None, **kwargs):
         raise NotImplementedError("fit_predict not yet implemented in PHOTON Pipeline")
@@ -1,7 +1,15 @@
+import os
+import shutil
+import tempfile
+import uuid
 from collections.abc import Iterable
+from concurrent.futures import ProcessPoolExecutor
+
+import joblib
+import numpy as np
 from prettytable import PrettyTable
+
 from photonai.photonlogger.logger import logger
-import numpy as np
 
 
 class Singleton:
@@ -234,6 +242,24 @@ class PhotonDataHelper:
                 existing_array = np.concatenate((existing_array, new_array), axis=1)
         return existing_array
 
+    @staticmethod
+    def dump_shared_data(folder, X, y=None, kwargs=None):
+        """
+        Writes X, y and kwargs once to the given folder so that worker processes can memory-map them
+        instead of receiving a pickled copy for every job.
+
+        Returns the filename that is to be passed to load_shared_data.
+        """
+        filename = os.path.join(folder, "photon_shared_data_" + str(uuid.uuid4()) + ".pkl")
+        joblib.dump((X, y, kwargs), filename)
+        return filename
+
+    @staticmethod
+    def load_shared_data(filename):
+        # numeric arrays are memory-mapped copy-on-write, so jobs may change them in place without
+        # affecting each other, everything else is unpickled
+        return joblib.load(filename, mmap_mode="c")
+
     @staticmethod
     def resort_splitted_data(X, y, kwargs, idx_list):
         _sort_order = np.argsort(idx_list)
@@ -246,6 +272,118 @@ class PhotonDataHelper:
         return X, y, kwargs
 
 
+class PhotonWorkerPool:
+    """
+    Process based worker pool used to distribute PHOTON jobs to several cores.
+
+    Parameters
+    ----------
+    * `nr_of_processes` [int]:
+        Number of worker processes.
+
+    * `backend` [str, default="processes"]:
+        - "processes": a local concurrent.futures.ProcessPoolExecutor
+        - "dask": a local dask cluster with one single-threaded worker process per core
+
+    Example
+    -------
+        with PhotonWorkerPool(4) as pool:
+            futures = [pool.submit(job, item) for item in items]
+            results = [f.result() for f in futures]
+    """
+
+    BACKENDS = ["processes", "dask"]
+
+    def __init__(self, nr_of_processes: int, backend: str = "processes"):
+        if backend not in PhotonWorkerPool.BACKENDS:
+            raise ValueError(
+                "Parallel backend {} not supported. Choose one of {}".format(
+                    backend, PhotonWorkerPool.BACKENDS
+                )
+            )
+        self.nr_of_processes = nr_of_processes
+        self.backend = backend
+        self._client = None
+        self._executor = None
+        self._futures = list()
+        self._shared_data_folder = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.shutdown(cancel_pending=exc_type is not None)
+
+    def start(self):
+        if self.backend == "dask":
+            from dask.distributed import Client
+
+            self._client = Client(
+                threads_per_worker=1, n_workers=self.nr_of_processes, processes=True
+            )
+            self._executor = self._client.get_executor()
+        else:
+            self._executor = ProcessPoolExecutor(max_workers=self.nr_of_processes)
+
+    def submit(self, fnc, *args, **kwargs):
+        future = self._executor.submit(fnc, *args, **kwargs)
+        self._futures.append(future)
+        return future
+
+    def share_data(self, X, y=None, kwargs=None):
+        """
+        Dumps the data once into a temporary folder that lives as long as the pool.
+        Returns the filename that the jobs pass to PhotonDataHelper.load_shared_data.
+        """
+        if self._shared_data_folder is None:
+            self._shared_data_folder = tempfile.mkdtemp(prefix="photon_shared_data_")
+        return PhotonDataHelper.dump_shared_data(self._shared_data_folder, X, y, kwargs)
+
+    def cancel_pending(self):
+        # jobs that are already running cannot be cancelled and are simply left to finish
+        for future in self._futures:
+            future.cancel()
+        self._futures = [f for f in self._futures if not f.cancelled()]
+
+    def shutdown(self, cancel_pending: bool = False):
+        if self._executor is not None:
+            if cancel_pending:
+                self.cancel_pending()
+            self._executor.shutdown(wait=True)
+            self._futures = list()
+            self._executor = None
+        if self._client is not None:
+            self._client.close()
+            self._client = None
+        if self._shared_data_folder is not None:
+            shutil.rmtree(self._shared_data_folder, ignore_errors=True)
+            self._shared_data_folder = None
+
+
+def atomic_write(filename, write_fnc, suffix=".tmp"):
+    """
+    Writes a file through write_fnc(tmp_filename) under a temporary name in the same folder and
+    renames it to filename, so that other processes never see a partially written file.
+    The temporary file is removed if writing fails. Returns the size of the written file.
+    """
+    tmp_file, tmp_filename = tempfile.mkstemp(
+        dir=os.path.dirname(filename), suffix=suffix
+    )
+    os.close(tmp_file)
+    try:
+        write_fnc(tmp_filename)
+        file_size = os.path.getsize(tmp_filename)
+        os.replace(tmp_filename, filename)
+    except BaseException:
+        try:
+            os.remove(tmp_filename)
+        except OSError:
+            pass
+        raise
+    return file_size
+
+
 def print_metrics(header, metric_dict):
     t = PrettyTable(["PERFORMANCE " + header, ""])
     for m_key, m_value in metric_dict.items():
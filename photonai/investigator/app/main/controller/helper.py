@@ -16,7 +16,7 @@ def load_pipe_from_db(name):
             .raw({"name": name})
             .first()
         )
-        return pipe
+        return MDBHelper.load_config_records_from_mongodb(pipe)
     except DoesNotExist as dne:
         # Todo: pretty error handling
         return dne
@@ -30,7 +30,7 @@ def load_pipe_from_wizard(obj_id):
             .raw({"wizard_object_id": ObjectId(obj_id)})
             .first()
         )
-        return pipe
+        return MDBHelper.load_config_records_from_mongodb(pipe)
     except DoesNotExist as dne:
         # Todo: pretty error handling
         return dne
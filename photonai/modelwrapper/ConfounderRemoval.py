@@ -9,6 +9,8 @@ from typing import Union
 
 class ConfounderRemoval(BaseEstimator, TransformerMixin):
     _estimator_type = "transformer"
+    # number of features regressed at once, bounds the memory of the temporary arrays
+    FEATURE_CHUNK_SIZE = 10000
 
     def __init__(
         self,
@@ -92,11 +94,17 @@ class ConfounderRemoval(BaseEstimator, TransformerMixin):
 
         # sample_ols_confounder: confounder variables of the samples to be fitted
         ols_confounder = sm.add_constant(sample_ols_confounder)
-        self.olsModel_params = np.zeros(shape=(X.shape[1], ols_confounder.shape[1]))
 
-        for i in range(X.shape[1]):
-            ols_model = sm.OLS(endog=np.squeeze(X[:, i]), exog=ols_confounder).fit()
-            self.olsModel_params[i] = ols_model.params
+        # all features share the design matrix, so the OLS fits of all features
+        # reduce to multiplying its pseudo-inverse with X (like statsmodels' OLS)
+        dtype = np.result_type(X.dtype, np.float32)
+        pinv_confounder = np.linalg.pinv(ols_confounder).astype(dtype)
+        self.olsModel_params = np.empty(
+            shape=(X.shape[1], ols_confounder.shape[1]), dtype=dtype
+        )
+        for start in range(0, X.shape[1], self.FEATURE_CHUNK_SIZE):
+            chunk = slice(start, start + self.FEATURE_CHUNK_SIZE)
+            self.olsModel_params[chunk] = np.matmul(pinv_confounder, X[:, chunk]).T
         return self
 
     def transform(self, X, y=None, **kwargs):
@@ -110,15 +118,13 @@ class ConfounderRemoval(BaseEstimator, TransformerMixin):
                 sample_ols_confounder, is_fit=False
             )
 
-        sample_ols_confounder = sm.add_constant(sample_ols_confounder)
-        X_new = np.empty(X.shape)
-        for i in range(X.shape[1]):
-            preds = np.matmul(
-                sample_ols_confounder, np.squeeze(self.olsModel_params[i])
-            )
-            residuum_feature_vector = np.squeeze(X[:, i]) - preds
-            # residuum_feature_vector += self.olsModel_params[i, 0]  # add intercept
-            X_new[:, i] = np.asarray(
-                residuum_feature_vector
-            )  # writing back the residuum of the feature vector
+        sample_ols_confounder = sm.add_constant(sample_ols_confounder).astype(
+            self.olsModel_params.dtype
+        )
+        X_new = np.empty(X.shape, dtype=self.olsModel_params.dtype)
+        for start in range(0, X.shape[1], self.FEATURE_CHUNK_SIZE):
+            chunk = slice(start, start + self.FEATURE_CHUNK_SIZE)
+            preds = np.matmul(sample_ols_confounder, self.olsModel_params[chunk].T)
+            # writing back the residuum of the feature vectors
+            X_new[:, chunk] = X[:, chunk] - preds
         return X_new, kwargs
@@ -19,12 +19,10 @@ Translationale Psychiatrie
 Universitaetsklinikum Muenster
 """
 
-import itertools
 import math
-import random
 
 import numpy as np
-from scipy.spatial.distance import pdist
+from scipy.spatial.distance import cdist
 from sklearn.base import BaseEstimator, TransformerMixin
 from sklearn.preprocessing import StandardScaler
 
@@ -33,6 +31,9 @@ from photonai.photonlogger.logger import logger
 
 
 class SamplePairingBase(BaseEstimator, TransformerMixin):
+    # number of distances computed at once when searching the nearest pairs
+    DISTANCE_BLOCK_SIZE = 1000000
+
     @staticmethod
     def _stirling(n):
         # http://en.wikipedia.org/wiki/Stirling%27s_approximation
@@ -58,48 +59,88 @@ class SamplePairingBase(BaseEstimator, TransformerMixin):
         except:
             return -1
 
+    @staticmethod
+    def _triu_pairs(linear_indices, n):
+        """
+        Converts indices into the upper triangle of an n x n matrix, counted row by row
+        like scipy's pdist, into an array of (row, column) pairs.
+        """
+        linear_indices = np.asarray(linear_indices, dtype=np.int64)
+        # the first linear index of row i is i * (2n - i - 1) / 2
+        rows = np.floor(
+            (2 * n - 1 - np.sqrt((2 * n - 1) ** 2 - 8 * linear_indices)) / 2
+        ).astype(np.int64)
+        # correct rounding errors of the square root
+        row_start = rows * (2 * n - rows - 1) // 2
+        rows[row_start > linear_indices] -= 1
+        row_start = rows * (2 * n - rows - 1) // 2
+        next_row = row_start + n - rows - 1
+        rows[next_row <= linear_indices] += 1
+        row_start = rows * (2 * n - rows - 1) // 2
+        columns = linear_indices - row_start + rows + 1
+        return np.stack((rows, columns), axis=1)
+
     @staticmethod
     def random_pair_generator(sample_indices, rand_seed, draw_limit):
-        """Return a list of random pairs from a list of items."""
-        random.seed(rand_seed)
-
-        pairs = list()
-
-        for i in range(draw_limit):
-            n_attempts = 0
-            while True:
-                pair = tuple(sorted(random.sample(sample_indices, 2)))
-                if pair not in pairs:
-                    pairs.append(pair)
-                    break
-                elif n_attempts > draw_limit:
-                    # prevent while loop from continuing infinitely
-                    # stop in case the number of attempts exceeds the draw limit
-                    # this is just an arbitrary threshold
-                    break
-                n_attempts += 1
-        return pairs
+        """Return an array of unique random pairs from a list of items."""
+        sample_indices = np.asarray(sample_indices)
+        n = len(sample_indices)
+        n_combinations = n * (n - 1) // 2
+        draw_limit = max(min(draw_limit, n_combinations), 0)
+        random_state = np.random.RandomState(rand_seed)
+
+        # draw linear indices into the upper triangle of all sample combinations
+        if draw_limit > n_combinations // 2:
+            linear_indices = random_state.permutation(n_combinations)[:draw_limit]
+        else:
+            linear_indices = np.empty(0, dtype=np.int64)
+            while len(linear_indices) < draw_limit:
+                draws = np.concatenate(
+                    (
+                        linear_indices,
+                        random_state.randint(
+                            0,
+                            n_combinations,
+                            size=draw_limit - len(linear_indices),
+                            dtype=np.int64,
+                        ),
+                    )
+                )
+                # drop repeated pairs but keep the order in which they were drawn
+                _, first_draws = np.unique(draws, return_index=True)
+                linear_indices = draws[np.sort(first_draws)]
+        return sample_indices[SamplePairingBase._triu_pairs(linear_indices, n)]
 
     @staticmethod
     def nearest_pair_generator(X, distance_metric, draw_limit):
         n_samples = X.shape[0]
         scaler = StandardScaler()
         X = scaler.fit_transform(X)
-        distance_indices = np.argsort(pdist(X, distance_metric))
-        triu_indices = np.triu_indices(n_samples, k=1)
+        draw_limit = max(min(draw_limit, n_samples * (n_samples - 1) // 2), 0)
+
+        # keep the draw_limit closest pairs while walking through blocks of rows
+        # of the distance matrix, so that the full matrix is never held in memory
+        distances = np.empty(0)
+        pairs = np.empty((0, 2), dtype=np.int64)
+        n_rows = max(1, SamplePairingBase.DISTANCE_BLOCK_SIZE // max(n_samples, 1))
+        for start in range(0, n_samples - 1, n_rows):
+            stop = min(start + n_rows, n_samples - 1)
+            block = cdist(X[start:stop], X[start + 1 :], distance_metric)
+            rows, columns = np.nonzero(
+                np.arange(start + 1, n_samples)[None, :]
+                > np.arange(start, stop)[:, None]
+            )
+            distances = np.concatenate((distances, block[rows, columns]))
+            pairs = np.concatenate(
+                (pairs, np.stack((rows + start, columns + start + 1), axis=1))
+            )
+            if len(distances) > draw_limit:
+                closest = np.argpartition(distances, draw_limit)[:draw_limit]
+                distances, pairs = distances[closest], pairs[closest]
 
-        pairs = list()
-        for i in range(draw_limit):
-            if i > len(distance_indices) - 1:
-                break
-            else:
-                pairs.append(
-                    (
-                        triu_indices[0][distance_indices[i]],
-                        (triu_indices[1][distance_indices[i]]),
-                    )
-                )
-        return pairs
+        # order by distance, equal distances in the order of scipy's pdist
+        order = np.lexsort((pairs[:, 1], pairs[:, 0], distances))
+        return pairs[order]
 
     def _get_pairs(
         self, X, draw_limit, rand_seed, distance_metric, generator="random_pair"
@@ -112,10 +153,10 @@ class SamplePairingBase(BaseEstimator, TransformerMixin):
                             'random_pair': sample randomly from all pairs
                             'nearest_pair': get most similar pairs
         :param distance metric: if generator is 'nearest_pair', this will set the distance metric to obtained similarity
-        :return: list of tuples indicating which samples to merge
+        :return: array of shape (n_pairs, 2) indicating which samples to merge
         """
 
-        sample_indices = range(X.shape[0])
+        sample_indices = np.arange(X.shape[0])
 
         # limit the number of new samples generated if all combinations > draw_limit
         n_combinations = self._calculate_number_of_possible_combinations(
@@ -139,7 +180,7 @@ class SamplePairingBase(BaseEstimator, TransformerMixin):
                 )
         else:
             # get all combinations of samples
-            return list(itertools.combinations(sample_indices, 2))
+            return np.stack(np.triu_indices(len(sample_indices), k=1), axis=1)
 
     def _return_samples(
         self, X, y, kwargs, generator, distance_metric, draw_limit, rand_seed
@@ -162,34 +203,20 @@ class SamplePairingBase(BaseEstimator, TransformerMixin):
             rand_seed=rand_seed,
         )
 
-        # compute mean over sample pairs
-        X_new = np.empty([len(pairs), X.shape[1]])
-        i = 0
-        for pair in pairs:
-            X_new[i] = np.mean([X[pair[0]], X[pair[1]]], axis=0)
-            i += 1
+        def pair_means(values):
+            values = np.asarray(values)
+            return (values[pairs[:, 0]] + values[pairs[:, 1]]) / 2
 
-        # add augmented samples to existing data
-        X_new = np.concatenate((X, X_new), axis=0)
+        # compute mean over sample pairs and add augmented samples to existing data
+        X_new = np.concatenate((X, pair_means(X)), axis=0)
 
         # get the corresponding targets and kwargs
         if kwargs:
             for name, kwarg in kwargs.items():
-                kwarg_new = np.empty(len(pairs))
-                for i, pair in enumerate(pairs):
-                    kwarg_new[i] = np.mean(
-                        [kwargs[name][pair[0]], kwargs[name][pair[1]]]
-                    )
-                kwargs[name] = np.concatenate((np.asarray(kwargs[name]), kwarg_new))
+                kwargs[name] = np.concatenate((np.asarray(kwarg), pair_means(kwarg)))
 
         if y is not None:
-            y_aug = np.empty(len(pairs))
-            i = 0
-            for pair in pairs:
-                y_aug[i] = np.mean([y[pair[0]], y[pair[1]]])
-                i += 1
-            # add augmented samples to existing data
-            y_new = np.concatenate((y, y_aug))
+            y_new = np.concatenate((y, pair_means(y)))
             return X_new, y_new, kwargs
         else:
             return X_new, None, kwargs
@@ -298,8 +325,8 @@ class SamplePairingClassification(SamplePairingBase):
                 rand_seed=self.random_state,
             )
 
-            X_extended.extend(X_new_class)
-            y_extended.extend(y_new_class)
+            X_extended.append(X_new_class)
+            y_extended.append(y_new_class)
 
             # get the corresponding kwargs
             if kwargs:
@@ -307,4 +334,4 @@ class SamplePairingClassification(SamplePairingBase):
                     kwargs_extended, kwargs_new_class
                 )
 
-        return X_extended, y_extended, kwargs_extended
+        return np.concatenate(X_extended), np.concatenate(y_extended), kwargs_extended
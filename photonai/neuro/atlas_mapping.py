@@ -10,7 +10,9 @@ import pandas as pd
 from nilearn import datasets, surface, plotting
 
 from photonai.base import PipelineElement
+from photonai.base.cache_manager import CacheManager
 from photonai.base.hyperpipe import Hyperpipe
+from photonai.helper.helper import PhotonDataHelper, PhotonWorkerPool
 from photonai.neuro.brain_atlas import BrainAtlas, AtlasLibrary
 from photonai.neuro.neuro_branch import NeuroBranch
 from photonai.photonlogger.logger import logger
@@ -19,7 +21,29 @@ from photonai.processing import ResultsHandler
 
 
 class AtlasMapper:
-    def __init__(self, create_surface_plots: bool = False):
+    """
+    Fits a copy of a hyperpipe on every region of interest of a brain atlas and maps
+    the performance of each region back into the atlas space.
+
+    Parameters
+    ----------
+    * `create_surface_plots` [bool, default=False]:
+        Plot the backmapped performances onto the fsaverage surface.
+
+    * `nr_of_processes` [int, default=1]:
+        Number of hyperpipes that are fitted at the same time. The extracted regions
+        are dumped once and memory mapped by the worker processes. Each worker fits
+        its hyperpipe without further parallelism, regardless of its nr_of_processes,
+        config_n_jobs and inner_fold_n_jobs.
+
+    If the output settings of the hyperpipe have resume=True, fitting again after an
+    interruption only computes the regions whose hyperpipe has not finished yet on the
+    same data.
+    """
+
+    ROI_RESULT_FILE = "atlas_mapper_roi.json"
+
+    def __init__(self, create_surface_plots: bool = False, nr_of_processes: int = 1):
         self.folder = None
         self.neuro_element = None
         self.original_hyperpipe_name = None
@@ -30,6 +54,9 @@ class AtlasMapper:
         self.roi_indices = dict()
         self.best_config_metric = None
         self.create_surface_plots = create_surface_plots
+        self.nr_of_processes = nr_of_processes
+        self.parallel_backend = "processes"
+        self.resume = False
 
     def generate_mappings(
         self,
@@ -46,6 +73,8 @@ class AtlasMapper:
         self.verbosity = hyperpipe.verbosity
         self.hyperpipe_infos = None
         self.best_config_metric = hyperpipe.optimization.best_config_metric
+        self.parallel_backend = hyperpipe.parallel_backend
+        self.resume = hyperpipe.output_settings.resume
 
         hyperpipes_to_fit = dict()
 
@@ -92,9 +121,12 @@ class AtlasMapper:
         # ToDo: currently not supported for hyperparameters inside neurobranch
         self.neuro_element.fit(X)
 
-        # extract regions
+        # extract regions into one (n_subjects, n_voxels) array, each roi is a slice
         X_extracted, _, _ = self.neuro_element.transform(X)
-        X_extracted = self._reshape_roi_data(X_extracted)
+        roi_sizes = [len(roi_data) for roi_data in X_extracted[0]]
+        roi_bounds = np.concatenate([[0], np.cumsum(roi_sizes)])
+        X_rois = np.asarray([np.concatenate(subject) for subject in X_extracted])
+        del X_extracted
 
         # save neuro branch to file
         joblib.dump(
@@ -105,22 +137,79 @@ class AtlasMapper:
 
         hyperpipe_infos = dict()
         hyperpipe_results = dict()
+        rois_to_fit = list()
 
         for roi_name, hyperpipe in self.hyperpipes_to_fit.items():
             hyperpipe.verbosity = self.verbosity
-            hyperpipe.fit(X_extracted[self.roi_indices[roi_name]], y, **kwargs)
+            roi_index = self.roi_indices[roi_name]
             hyperpipe_infos[roi_name] = {
                 "hyperpipe_name": hyperpipe.name,
                 "model_filename": os.path.join(
-                    os.path.basename(hyperpipe.output_settings.results_folder),
-                    "photon_best_model.photon",
+                    hyperpipe.name + "_results", "photon_best_model.photon"
                 ),
-                "roi_index": self.roi_indices[roi_name],
+                "roi_index": roi_index,
             }
-            hyperpipe_results[roi_name] = ResultsHandler(
-                hyperpipe.results
-            ).get_performance_outer_folds()
+            start, stop = roi_bounds[roi_index], roi_bounds[roi_index + 1]
+            roi_result = None
+            if self.resume:
+                roi_result = self._load_roi_result(
+                    hyperpipe, X_rois[:, start:stop], y, kwargs
+                )
+            if roi_result is not None:
+                logger.info("Taking over finished hyperpipe of ROI " + roi_name)
+                hyperpipe_results[roi_name] = roi_result
+                self.hyperpipes_to_fit[roi_name] = self._load_roi_model(
+                    hyperpipe_infos[roi_name]
+                )
+            else:
+                rois_to_fit.append((roi_name, start, stop))
+
+        if self.nr_of_processes > 1 and len(rois_to_fit) > 1:
+            logger.info(
+                "Fitting {} ROI hyperpipes on {} processes...".format(
+                    len(rois_to_fit), self.nr_of_processes
+                )
+            )
+            with PhotonWorkerPool(
+                self.nr_of_processes, self.parallel_backend
+            ) as worker_pool:
+                shared_data_file = worker_pool.share_data(X_rois, y, kwargs)
+                futures = list()
+                for roi_name, start, stop in rois_to_fit:
+                    hyperpipe = self.hyperpipes_to_fit[roi_name]
+                    # the rois are distributed, a worker must not start a worker pool
+                    # for the outer folds, configs or inner folds of its hyperpipe
+                    hyperpipe.nr_of_processes = 1
+                    hyperpipe.config_n_jobs = 1
+                    hyperpipe.inner_fold_n_jobs = 1
+                    futures.append(
+                        (
+                            roi_name,
+                            worker_pool.submit(
+                                AtlasMapper.fit_roi_in_worker,
+                                hyperpipe,
+                                shared_data_file,
+                                start,
+                                stop,
+                            ),
+                        )
+                    )
+                for roi_name, future in futures:
+                    hyperpipe_results[roi_name] = future.result()
+                    # the fitted hyperpipe lives in the worker, load its best model
+                    self.hyperpipes_to_fit[roi_name] = self._load_roi_model(
+                        hyperpipe_infos[roi_name]
+                    )
+        else:
+            for roi_name, start, stop in rois_to_fit:
+                hyperpipe_results[roi_name] = AtlasMapper._fit_roi(
+                    self.hyperpipes_to_fit[roi_name], X_rois[:, start:stop], y, kwargs
+                )
 
+        # keep the order of the rois in the atlas
+        hyperpipe_results = {
+            roi_name: hyperpipe_results[roi_name] for roi_name in self.hyperpipes_to_fit
+        }
         self.hyperpipe_infos = hyperpipe_infos
 
         # write results
@@ -142,8 +231,11 @@ class AtlasMapper:
         performances = list()
 
         for roi_name, roi_res in hyperpipe_results.items():
-            n_voxels = len(X_extracted[self.roi_indices[roi_name]][0])
-            performances.append(np.repeat(roi_res[self.best_config_metric], n_voxels))
+            n_voxels = roi_sizes[self.roi_indices[roi_name]]
+            # one value per voxel: the mean performance over the outer folds
+            performances.append(
+                np.repeat(np.mean(roi_res[self.best_config_metric]), n_voxels)
+            )
 
         backmapped_img, _, _ = self.neuro_element.inverse_transform(performances)
         backmapped_img.to_filename(
@@ -153,6 +245,86 @@ class AtlasMapper:
         if self.create_surface_plots:
             self.surface_plots(backmapped_img)
 
+    @staticmethod
+    def _roi_result_file(hyperpipe):
+        # the results folder of the roi hyperpipes has no timestamp (overwrite_results)
+        return os.path.join(
+            hyperpipe.output_settings.project_folder,
+            hyperpipe.name + "_results",
+            AtlasMapper.ROI_RESULT_FILE,
+        )
+
+    @staticmethod
+    def _roi_data_digest(X, y, kwargs):
+        return CacheManager.digest(
+            (
+                CacheManager.digest(np.asarray(X)),
+                CacheManager.digest(np.asarray(y)),
+                [
+                    (key, CacheManager.digest(np.asarray(value)))
+                    for key, value in sorted(kwargs.items())
+                ],
+            )
+        )
+
+    @staticmethod
+    def _load_roi_result(hyperpipe, X, y, kwargs):
+        """
+        Performance of a roi hyperpipe that was fitted before the mapping was interrupted,
+        or None if it has not finished or was fitted on other data.
+        """
+        roi_result_file = AtlasMapper._roi_result_file(hyperpipe)
+        if not os.path.isfile(roi_result_file):
+            return None
+        with open(roi_result_file, "r") as read_file:
+            roi_result = json.load(read_file)
+        data_digest = AtlasMapper._roi_data_digest(X, y, kwargs)
+        if (
+            roi_result.get("n_samples") != len(X)
+            or roi_result.get("data_digest") != data_digest
+        ):
+            logger.warning(
+                "ROI hyperpipe {} was fitted on other data, fitting it again".format(
+                    hyperpipe.name
+                )
+            )
+            return None
+        return roi_result["performance"]
+
+    @staticmethod
+    def _fit_roi(hyperpipe, X, y, kwargs):
+        hyperpipe.fit(X, y, **kwargs)
+        performance = {
+            metric: [float(value) for value in values]
+            for metric, values in ResultsHandler(hyperpipe.results)
+            .get_performance_outer_folds()
+            .items()
+        }
+        # the file marks the roi as finished for a resumed mapping on the same data
+        roi_result = {
+            "n_samples": len(X),
+            "data_digest": AtlasMapper._roi_data_digest(X, y, kwargs),
+            "performance": performance,
+        }
+        with open(AtlasMapper._roi_result_file(hyperpipe), "w") as fp:
+            json.dump(roi_result, fp)
+        return performance
+
+    @staticmethod
+    def fit_roi_in_worker(hyperpipe, shared_data_file, start, stop):
+        # runs in a worker process: the extracted rois are memory-mapped
+        X_rois, y, kwargs = PhotonDataHelper.load_shared_data(shared_data_file)
+        return AtlasMapper._fit_roi(
+            hyperpipe, np.asarray(X_rois[:, start:stop]), y, kwargs
+        )
+
+    def _load_roi_model(self, infos):
+        model_path = os.path.join(
+            os.path.join(self.folder, infos["hyperpipe_name"] + "_results"),
+            os.path.basename(infos["model_filename"]),
+        )
+        return Hyperpipe.load_optimum_pipe(model_path)
+
     def surface_plots(self, perf_img):
         print("Creating surface plots")
 
@@ -267,9 +439,5 @@ class AtlasMapper:
 
         roi_models = dict()
         for roi_name, infos in self.hyperpipe_infos.items():
-            model_path = os.path.join(
-                os.path.join(self.folder, infos["hyperpipe_name"] + "_results"),
-                os.path.basename(infos["model_filename"]),
-            )
-            roi_models[roi_name] = Hyperpipe.load_optimum_pipe(model_path)
+            roi_models[roi_name] = self._load_roi_model(infos)
             self.hyperpipes_to_fit = roi_models
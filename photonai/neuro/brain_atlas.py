@@ -1,9 +1,11 @@
 import glob
 import inspect
+import os
 import time
 from os import path
 from pathlib import Path
 
+import joblib
 import nibabel as nib
 import numpy as np
 import pandas as pd
@@ -13,17 +15,33 @@ from nilearn.image import math_img
 from nilearn.input_data import NiftiMasker
 from sklearn.base import BaseEstimator
 
-from photonai.helper.helper import Singleton
+from photonai.base.cache_manager import CacheManager
+from photonai.helper.helper import Singleton, atomic_write
+from photonai.neuro.nifti_loader import NiftiLoader
 from photonai.photonlogger.logger import logger
 
 
 class RoiObject:
-    def __init__(self, index=0, label="", size=None, mask=None):
+    def __init__(self, index=0, label="", size=None, mask=None, atlas_object=None):
         self.index = index
         self.label = label
         self.size = size
-        self.mask = mask
-        self.is_empty = False
+        self._mask = mask
+        # without a mask, it is only created from the map of the atlas once it is used
+        self.atlas_object = atlas_object
+        self.is_empty = size == 0
+
+    @property
+    def mask(self):
+        if self._mask is None and self.atlas_object is not None and not self.is_empty:
+            self._mask = image.new_img_like(
+                self.atlas_object.path, self.atlas_object.map == self.index
+            )
+        return self._mask
+
+    @mask.setter
+    def mask(self, value):
+        self._mask = value
 
 
 class MaskObject:
@@ -53,6 +71,8 @@ class AtlasObject:
         self.roi_list = list()
         self.map = None
         self.atlas = None
+        self.voxel_order = None
+        self.sorted_labels = None
         self.affine = affine
         self.shape = shape
 
@@ -98,6 +118,10 @@ class AtlasLibrary:
         "Cerebellum": "P_08_Cere.nii.gz",
     }
 
+    # set a folder in order to share resampled atlases and masks with other processes,
+    # it must only be writable by the current user since the entries are unpickled
+    CACHE_FOLDER = None
+
     def __init__(self):
         self.photon_atlases = self._load_photon_atlases()
         self.photon_masks = self._load_photon_masks()
@@ -163,6 +187,47 @@ class AtlasLibrary:
             shape=target_shape,
         )
 
+        cache_file = self._cache_file(
+            "atlas",
+            [atlas_object.path, atlas_object.labels_file],
+            target_affine,
+            target_shape,
+            mask_threshold,
+        )
+        cached_atlas = self._load_from_cache(cache_file)
+        if cached_atlas is not None:
+            atlas_object.atlas = cached_atlas["atlas"]
+            atlas_object.map = np.asarray(atlas_object.atlas.get_data())
+            if mask_threshold is not None:
+                atlas_object.map = atlas_object.map.astype(int)
+            atlas_object.indices = cached_atlas["indices"]
+            atlas_object.roi_list = [
+                RoiObject(
+                    index=index, label=label, size=size, atlas_object=atlas_object
+                )
+                for index, label, size in cached_atlas["rois"]
+            ]
+        else:
+            self._build_atlas(atlas_object, target_affine, target_shape, mask_threshold)
+            self._save_to_cache(
+                cache_file,
+                {
+                    "atlas": atlas_object.atlas,
+                    "indices": atlas_object.indices,
+                    "rois": [
+                        (roi.index, roi.label, roi.size)
+                        for roi in atlas_object.roi_list
+                    ],
+                },
+            )
+
+        # finally add atlas to atlas library
+        self.library[
+            (atlas_name, str(target_affine), str(target_shape), str(mask_threshold))
+        ] = atlas_object
+        logger.debug("BrainAtlas: Done adding atlas to library!")
+
+    def _build_atlas(self, atlas_object, target_affine, target_shape, mask_threshold):
         # load atlas
         img = image.load_img(atlas_object.path)
         resampled_img = self._resample(
@@ -176,8 +241,10 @@ class AtlasLibrary:
             atlas_object.map[atlas_object.map < mask_threshold] = 0
             atlas_object.map = atlas_object.map.astype(int)
 
-        # now get indices
-        atlas_object.indices = list(np.unique(atlas_object.map))
+        # now get indices and the number of voxels of each of them in one pass
+        indices, sizes = np.unique(atlas_object.map, return_counts=True)
+        atlas_object.indices = list(indices)
+        roi_sizes = dict(zip(indices, sizes))
 
         # check labels
         if Path(
@@ -208,7 +275,12 @@ class AtlasLibrary:
                 )
 
                 atlas_object.roi_list = [
-                    RoiObject(index=i, label=str(i), size=np.sum(i == atlas_object.map))
+                    RoiObject(
+                        index=i,
+                        label=str(i),
+                        size=roi_sizes[i],
+                        atlas_object=atlas_object,
+                    )
                     for i in atlas_object.indices
                 ]
             else:
@@ -217,36 +289,19 @@ class AtlasLibrary:
                     new_roi = RoiObject(
                         index=roi_index,
                         label=labels_dict[roi_index].replace("\n", ""),
-                        size=np.sum(roi_index == atlas_object.map),
+                        size=roi_sizes[roi_index],
+                        atlas_object=atlas_object,
                     )
                     atlas_object.roi_list.append(new_roi)
 
         else:  # if we don't have a labels file, we just use str(indices) as labels
             atlas_object.roi_list = [
-                RoiObject(index=i, label=str(i), size=np.sum(i == atlas_object.map))
+                RoiObject(
+                    index=i, label=str(i), size=roi_sizes[i], atlas_object=atlas_object
+                )
                 for i in atlas_object.indices
             ]
 
-        # check for empty ROIs and create roi mask
-        for roi in atlas_object.roi_list:
-
-            if roi.size == 0:
-                continue
-
-            roi.mask = image.new_img_like(
-                atlas_object.path, atlas_object.map == roi.index
-            )
-
-            # check if roi is empty
-            if np.sum(roi.mask.dataobj != 0) == 0:
-                roi.is_empty = True
-
-        # finally add atlas to atlas library
-        self.library[
-            (atlas_name, str(target_affine), str(target_shape), str(mask_threshold))
-        ] = atlas_object
-        logger.debug("BrainAtlas: Done adding atlas to library!")
-
     def _add_mask_to_library(
         self,
         mask_name: str = "",
@@ -270,16 +325,24 @@ class AtlasLibrary:
             name=mask_name, mask_file=original_mask_object.mask_file
         )
 
-        # mask_object.mask = image.threshold_img(mask_object.mask_file, threshold=mask_threshold)
-        mask_object.mask = math_img(
-            "img > {}".format(mask_threshold), img=mask_object.mask_file
+        cache_file = self._cache_file(
+            "mask", [mask_object.mask_file], target_affine, target_shape, mask_threshold
         )
-
-        if target_affine is not None and target_shape is not None:
-            mask_object.mask = self._resample(
-                mask_object.mask, target_affine=target_affine, target_shape=target_shape
+        mask_object.mask = self._load_from_cache(cache_file)
+        if mask_object.mask is None:
+            # mask_object.mask = image.threshold_img(mask_object.mask_file, threshold=mask_threshold)
+            mask_object.mask = math_img(
+                "img > {}".format(mask_threshold), img=mask_object.mask_file
             )
 
+            if target_affine is not None and target_shape is not None:
+                mask_object.mask = self._resample(
+                    mask_object.mask,
+                    target_affine=target_affine,
+                    target_shape=target_shape,
+                )
+            self._save_to_cache(cache_file, mask_object.mask)
+
         # check if roi is empty
         if np.sum(mask_object.mask.dataobj != 0) == 0:
             logger.error(
@@ -317,7 +380,12 @@ class AtlasLibrary:
     def get_mask(
         self, mask_name, target_affine=None, target_shape=None, mask_threshold=0.5
     ):
-        if (mask_name, str(target_affine), str(target_shape)) not in self.library:
+        if (
+            mask_name,
+            str(target_affine),
+            str(target_shape),
+            str(mask_threshold),
+        ) not in self.library:
             self._add_mask_to_library(
                 mask_name, target_affine, target_shape, mask_threshold
             )
@@ -326,6 +394,47 @@ class AtlasLibrary:
             (mask_name, str(target_affine), str(target_shape), str(mask_threshold))
         ]
 
+    def _cache_file(self, kind, files, target_affine, target_shape, mask_threshold):
+        """
+        Path of the cache entry for an atlas or mask, keyed by the content of its files
+        and by the space it is resampled to.
+        """
+        if self.CACHE_FOLDER is None:
+            return None
+        key = CacheManager.digest(
+            (
+                kind,
+                [NiftiLoader.file_digest(f) if path.isfile(f) else None for f in files],
+                None if target_affine is None else np.asarray(target_affine).tolist(),
+                None if target_shape is None else [int(i) for i in target_shape],
+                None if mask_threshold is None else float(mask_threshold),
+            )
+        )
+        return path.join(self.CACHE_FOLDER, kind + "_" + key + ".p")
+
+    @staticmethod
+    def _load_from_cache(cache_file):
+        if cache_file is None or not path.isfile(cache_file):
+            return None
+        try:
+            # memory map the arrays so that all processes share the same pages
+            return joblib.load(cache_file, mmap_mode="r")
+        except Exception as e:
+            logger.warning("Could not load {}: {}".format(cache_file, e))
+            return None
+
+    @staticmethod
+    def _save_to_cache(cache_file, data):
+        if cache_file is None:
+            return
+        try:
+            os.makedirs(path.dirname(cache_file), mode=0o700, exist_ok=True)
+            atomic_write(
+                cache_file, lambda tmp_filename: joblib.dump(data, tmp_filename)
+            )
+        except Exception as e:
+            logger.warning("Could not write {}: {}".format(cache_file, e))
+
     @staticmethod
     def _resample(mask, target_affine, target_shape):
         if target_affine is not None and target_shape is not None:
@@ -379,6 +488,9 @@ class AtlasLibrary:
 
 
 class BrainAtlas(BaseEstimator):
+    # number of subjects that are loaded into memory at the same time
+    LOAD_CHUNK_SIZE = 50
+
     def __init__(
         self,
         atlas_name: str,
@@ -433,18 +545,7 @@ class BrainAtlas(BaseEstimator):
 
         self.affine, self.shape = BrainMask.get_format_info_from_first_image(X)
 
-        # load all niftis to memory
-        if isinstance(X, list):
-            n_subjects = len(X)
-            X = image.load_img(X)
-        elif isinstance(X, str):
-            n_subjects = 1
-            X = image.load_img(X)
-        elif isinstance(X, np.ndarray):
-            n_subjects = X.shape[0]
-            X = image.load_img(X)
-        else:
-            n_subjects = X.shape[-1]
+        n_subjects = BrainMask._n_images(X)
 
         # get ROI mask
         atlas_obj = AtlasLibrary().get_atlas(
@@ -454,33 +555,41 @@ class BrainAtlas(BaseEstimator):
             atlas_obj, which_rois=self.rois, background_id=self.background_id
         )
 
-        roi_data = [list() for i in range(n_subjects)]
-        roi_data_concat = list()
         t1 = time.time()
 
-        # convert to series and C ordering since this will speed up the masking process
-        series = _utils.as_ndarray(
-            _safe_get_data(X), dtype="float32", order="C", copy=True
-        )
-        mask_indices = list()
-
-        for i, roi in enumerate(roi_objects):
-            logger.debug("Extracting ROI {}".format(roi.label))
-            # simply call apply_mask to extract one roi
-            extraction = self.apply_mask(series, roi.mask)
-            if collection_mode == "list":
-                for sub_i in range(extraction.shape[0]):
-                    roi_data[sub_i].append(extraction[sub_i])
-                mask_indices.append(i)
-            else:
-                roi_data_concat.append(extraction)
-                mask_indices.append(np.ones(extraction[0].size) * i)
-
-        if self.collection_mode == "concat":
-            roi_data = np.concatenate(roi_data_concat, axis=1)
-            self.mask_indices = np.concatenate(mask_indices)
+        # load a bounded number of subjects at a time and gather the voxels of all ROIs
+        # from each chunk in one pass over the atlas labels
+        voxels, roi_sizes = self._roi_voxels(atlas_obj, roi_objects)
+        extraction = np.empty((n_subjects, voxels.size), dtype="float32")
+        n_done = 0
+        loader = NiftiLoader()
+        for chunk in BrainMask._image_chunks(X, self.LOAD_CHUNK_SIZE):
+            # the files of a chunk are decompressed in parallel
+            chunk_img = image.load_img(loader.load_images(chunk))
+            if chunk_img.shape[:3] != tuple(self.shape) or not np.allclose(
+                chunk_img.affine, self.affine
+            ):
+                raise ValueError(
+                    "Brain Atlas: All images must have the affine and shape of the "
+                    "first image."
+                )
+            # convert to series and C ordering since this speeds up the masking process
+            series = _utils.as_ndarray(
+                _safe_get_data(chunk_img), dtype="float32", order="C"
+            )
+            chunk_extraction = self._extract_rois(series, voxels)
+            extraction[n_done : n_done + len(chunk_extraction)] = chunk_extraction
+            n_done += len(chunk_extraction)
+
+        if collection_mode == "list":
+            roi_bounds = np.cumsum(roi_sizes)[:-1]
+            roi_data = [np.split(subject, roi_bounds) for subject in extraction]
+            self.mask_indices = list(range(len(roi_objects)))
         else:
-            self.mask_indices = mask_indices
+            roi_data = extraction
+            self.mask_indices = np.repeat(
+                np.arange(len(roi_objects), dtype=float), roi_sizes
+            )
 
         elapsed_time = time.time() - t1
         logger.debug(
@@ -497,6 +606,41 @@ class BrainAtlas(BaseEstimator):
         mask_data = _utils.as_ndarray(mask_img.get_data(), dtype=np.bool)
         return series[mask_data].T
 
+    @staticmethod
+    def _group_voxels(atlas_obj):
+        # sort the voxels by their label once per atlas, a stable sort keeps the
+        # voxels of each ROI in the same (C) order as a boolean mask would
+        if atlas_obj.voxel_order is None:
+            labels = np.asarray(atlas_obj.map).ravel()
+            atlas_obj.voxel_order = np.argsort(labels, kind="stable")
+            atlas_obj.sorted_labels = labels[atlas_obj.voxel_order]
+        return atlas_obj.voxel_order, atlas_obj.sorted_labels
+
+    @staticmethod
+    def _roi_voxels(atlas_obj, roi_objects):
+        """
+        Flat indices of the voxels of all ROIs, one ROI after another, and the number
+        of voxels of each ROI.
+        """
+        voxel_order, sorted_labels = BrainAtlas._group_voxels(atlas_obj)
+        roi_indices = [roi.index for roi in roi_objects]
+        starts = np.searchsorted(sorted_labels, roi_indices, side="left")
+        stops = np.searchsorted(sorted_labels, roi_indices, side="right")
+        voxels = np.concatenate(
+            [voxel_order[start:stop] for start, stop in zip(starts, stops)]
+            + [np.zeros(0, dtype=voxel_order.dtype)]
+        )
+        return voxels, stops - starts
+
+    @staticmethod
+    def _extract_rois(series, voxels):
+        """
+        Extract the given voxels from a C-ordered series of shape (x, y, z[, n_subjects]).
+        Returns an array of shape (n_subjects, n_voxels).
+        """
+        n_subjects = series.shape[3] if series.ndim > 3 else 1
+        return series.reshape(-1, n_subjects)[voxels].T
+
     def inverse_transform(self, X, y=None, **kwargs):
         X = np.asarray(X)
 
@@ -508,17 +652,16 @@ class BrainAtlas(BaseEstimator):
             atlas_obj, which_rois=self.rois, background_id=self.background_id
         )
 
-        unmasked = np.squeeze(np.zeros_like(atlas_obj.map, dtype="float32"))
-
-        for i, roi in enumerate(roi_objects):
-            mask, mask_affine = masking._load_mask_img(roi.mask)
-            mask_img = image.new_img_like(roi.mask, mask, mask_affine)
-            mask_data = _utils.as_ndarray(mask_img.get_data(), dtype=np.bool)
-
-            if self.collection_mode == "list":
-                unmasked[mask_data] = X[i]
-            else:
-                unmasked[mask_data] = X[self.mask_indices == i]
+        # write the ROIs back to their voxels in the same order they were extracted
+        voxels, _ = self._roi_voxels(atlas_obj, roi_objects)
+        unmasked = np.zeros(np.asarray(atlas_obj.map).size, dtype="float32")
+        if self.collection_mode == "list":
+            unmasked[voxels] = np.concatenate(
+                [np.ravel(X[i]) for i in range(len(roi_objects))]
+            )
+        else:
+            unmasked[voxels] = np.ravel(X)
+        unmasked = np.squeeze(unmasked.reshape(np.shape(atlas_obj.map)))
 
         new_image = image.new_img_like(atlas_obj.atlas, unmasked)
         return new_image
@@ -554,6 +697,9 @@ class BrainAtlas(BaseEstimator):
 
 
 class BrainMask(BaseEstimator):
+    # number of subjects that are loaded into memory at the same time
+    LOAD_CHUNK_SIZE = 50
+
     def __init__(
         self,
         mask_image="MNI_ICBM152_WholeBrain",
@@ -568,6 +714,11 @@ class BrainMask(BaseEstimator):
         self.masker = None
         self.extract_mode = extract_mode
         self.mask_threshold = mask_threshold
+        # the masker and the mask voxels only change with the mask or the target space
+        self._masker_key = None
+        self._mask_index_key = None
+        self._mask_voxels = None
+        self._mask_box = None
 
     @staticmethod
     def get_format_info_from_first_image(X):
@@ -596,25 +747,73 @@ class BrainMask(BaseEstimator):
             raise ValueError("Could not load image for affine and shape definition.")
 
     @staticmethod
-    def _get_box(in_imgs, roi):
-        # get ROI infos
-        map = roi.get_data()
-        true_points = np.argwhere(map)
-        corner1 = true_points.min(axis=0)
-        corner2 = true_points.max(axis=0)
-        box = []
-        for img in in_imgs:
-            if isinstance(img, str):
-                data = image.load_img(img).get_data()
+    def _n_images(X):
+        if isinstance(X, (list, np.ndarray)):
+            return len(X)
+        # only reads the header of files
+        img = image.load_img(X)
+        return img.shape[3] if len(img.shape) > 3 else 1
+
+    @staticmethod
+    def _image_chunks(X, chunk_size):
+        """
+        Split X into parts of at most chunk_size images, so that only one part at a time
+        has to be loaded into memory. Image files are read lazily by nibabel, uncompressed
+        .nii files are memory mapped.
+        """
+        if isinstance(X, (list, np.ndarray)):
+            for start in range(0, len(X), chunk_size):
+                yield list(X[start : start + chunk_size])
+        else:
+            img = image.load_img(X)
+            if len(img.shape) > 3 and img.shape[3] > chunk_size:
+                for start in range(0, img.shape[3], chunk_size):
+                    yield image.index_img(img, slice(start, start + chunk_size))
             else:
-                data = img.get_data()
-            tmp = data[
-                corner1[0] : corner2[0] + 1,
-                corner1[1] : corner2[1] + 1,
-                corner1[2] : corner2[2] + 1,
-            ]
-            box.append(tmp)
-        return np.asarray(box)
+                yield img
+
+    def _mask_key(self):
+        return id(self.mask_image), str(self.affine), str(self.shape)
+
+    def _get_mask_index(self):
+        """
+        Voxel indices (in C order, as NiftiMasker extracts them) and bounding box of
+        the mask, computed once per mask and target space.
+        """
+        if self._mask_index_key != self._mask_key():
+            mask, _ = masking._load_mask_img(self.mask_image.mask)
+            self._mask_voxels = np.nonzero(mask)
+            self._mask_box = tuple(
+                slice(voxels.min(), voxels.max() + 1) for voxels in self._mask_voxels
+            )
+            self._mask_index_key = self._mask_key()
+        return self._mask_voxels, self._mask_box
+
+    def _extract_from_images(self, X):
+        """
+        'mean' and 'box' extraction straight from the loaded images, without masking
+        every voxel of the mask into a matrix first.
+        """
+        mask_voxels, mask_box = self._get_mask_index()
+        extraction = list()
+        imgs = X if isinstance(X, (list, np.ndarray)) else [X]
+        for img in NiftiLoader().iter_images(imgs):
+            if img.shape[:3] != tuple(self.shape) or not np.allclose(
+                img.affine, self.affine
+            ):
+                # same as NiftiMasker does with images in another space
+                img = image.resample_img(
+                    img, target_affine=self.affine, target_shape=self.shape
+                )
+            data = img.get_data()
+            if self.extract_mode == "mean":
+                roi = np.asarray(data[mask_voxels], dtype="float32")
+                extraction.append(np.mean(roi, axis=0))
+            else:
+                extraction.append(data[mask_box])
+        if self.extract_mode == "mean":
+            return np.hstack(extraction)
+        return np.asarray(extraction)
 
     def fit(self, X, y):
         return self
@@ -632,14 +831,32 @@ class BrainMask(BaseEstimator):
             pass
 
         if not self.mask_image.is_empty:
-            self.masker = NiftiMasker(
-                mask_img=self.mask_image.mask,
-                target_affine=self.affine,
-                target_shape=self.shape,
-                dtype="float32",
-            )
             try:
-                single_roi = self.masker.fit_transform(X)
+                if self.extract_mode in ["mean", "box"]:
+                    return self._extract_from_images(X)
+
+                if self._masker_key != self._mask_key():
+                    self.masker = NiftiMasker(
+                        mask_img=self.mask_image.mask,
+                        target_affine=self.affine,
+                        target_shape=self.shape,
+                        dtype="float32",
+                    )
+                    self.masker.fit()
+                    self._masker_key = self._mask_key()
+                # mask a bounded number of subjects at a time
+                n_subjects = BrainMask._n_images(X)
+                single_roi = None
+                n_done = 0
+                loader = NiftiLoader()
+                for chunk in BrainMask._image_chunks(X, self.LOAD_CHUNK_SIZE):
+                    chunk_roi = self.masker.transform(loader.load_images(chunk))
+                    if single_roi is None:
+                        single_roi = np.empty(
+                            (n_subjects, chunk_roi.shape[1]), dtype=chunk_roi.dtype
+                        )
+                    single_roi[n_done : n_done + len(chunk_roi)] = chunk_roi
+                    n_done += len(chunk_roi)
             except BaseException as e:
                 logger.error(e)
                 single_roi = None
@@ -648,12 +865,6 @@ class BrainMask(BaseEstimator):
                 if self.extract_mode == "vec":
                     return np.asarray(single_roi)
 
-                elif self.extract_mode == "mean":
-                    return np.mean(single_roi, axis=1)
-
-                elif self.extract_mode == "box":
-                    return BrainMask._get_box(X, self.mask_image)
-
                 elif self.extract_mode == "img":
                     return self.masker.inverse_transform(single_roi)
 
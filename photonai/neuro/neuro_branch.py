@@ -176,6 +176,16 @@ class NeuroBranch(Branch):
         new_copy = super().copy_me()
         new_copy.base_element.current_config = self.base_element.current_config
         new_copy.base_element.single_subject_caching = True
+        for cache_setting in [
+            "max_cache_bytes",
+            "max_memory_cache_bytes",
+            "memory_cache_last_only",
+        ]:
+            setattr(
+                new_copy.base_element,
+                cache_setting,
+                getattr(self.base_element, cache_setting),
+            )
         new_copy.base_element.cache_folder = self.base_element.cache_folder
         new_copy.local_cluster = self.local_cluster
         new_copy.nr_of_processes = self.nr_of_processes
@@ -0,0 +1,137 @@
+import multiprocessing
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from os import path
+
+import nibabel as nib
+import numpy as np
+from nilearn import image
+
+from photonai.base.cache_manager import CacheManager
+from photonai.helper.helper import atomic_write
+from photonai.photonlogger.logger import logger
+
+
+class NiftiLoader:
+    """
+    Loads NIfTI images on a pool of threads and hands them out in their original order.
+
+    Decompressing .nii.gz files spends most of its time in zlib, which releases the GIL,
+    so the images of a cohort are decoded on several cores at the same time. The decoded
+    data is kept by nibabel inside the returned image objects, so that nilearn and the
+    PHOTON neuro elements do not read the file again.
+
+    Parameters
+    ----------
+    * `nr_of_threads` [int, default=None]:
+        Number of images that are decoded at the same time. Defaults to NR_OF_THREADS,
+        or, if that is None, to all cores in the main process and to a single thread in
+        the worker processes of a PhotonWorkerPool, which already keep every core busy.
+
+    * `cache_folder` [str, default=None]:
+        If given, every image file is decoded only once: its data is stored as an
+        uncompressed float32 .nii file named after the digest of the file content, and
+        later loads memory map that file. Defaults to CACHE_FOLDER.
+
+    Example
+    -------
+        for img in NiftiLoader().iter_images(files):
+            data = img.get_data()
+    """
+
+    NR_OF_THREADS = None
+    # set a folder in order to share decoded images between all folds and configurations
+    CACHE_FOLDER = None
+
+    _file_digests = dict()
+
+    def __init__(self, nr_of_threads: int = None, cache_folder: str = None):
+        if nr_of_threads is None:
+            nr_of_threads = NiftiLoader.NR_OF_THREADS
+        if nr_of_threads is None:
+            nr_of_threads = NiftiLoader.default_nr_of_threads()
+        if cache_folder is None:
+            cache_folder = NiftiLoader.CACHE_FOLDER
+        self.nr_of_threads = nr_of_threads
+        self.cache_folder = cache_folder
+
+    @staticmethod
+    def default_nr_of_threads():
+        if multiprocessing.current_process().name != "MainProcess":
+            return 1
+        return os.cpu_count() or 1
+
+    @staticmethod
+    def file_digest(filename):
+        """
+        Content digest of a file, remembered as long as the file is not modified.
+        """
+        file_stat = os.stat(filename)
+        file_key = (path.abspath(filename), file_stat.st_mtime, file_stat.st_size)
+        if file_key not in NiftiLoader._file_digests:
+            with open(filename, "rb") as f:
+                NiftiLoader._file_digests[file_key] = CacheManager.digest(f.read())
+        return NiftiLoader._file_digests[file_key]
+
+    def load_image(self, img):
+        if (
+            self.cache_folder is not None
+            and isinstance(img, str)
+            and path.isfile(img)
+        ):
+            return self._load_cached_image(img)
+        img = image.load_img(img)
+        # decode the data now, nibabel keeps it with the image object
+        img.get_data()
+        return img
+
+    def _load_cached_image(self, filename):
+        cache_file = path.join(
+            self.cache_folder, NiftiLoader.file_digest(filename) + "_float32.nii"
+        )
+        if not path.isfile(cache_file):
+            img = image.load_img(filename)
+            decoded_img = nib.Nifti1Image(
+                np.asarray(img.get_data(), dtype=np.float32), img.affine
+            )
+            try:
+                os.makedirs(self.cache_folder, exist_ok=True)
+                # nibabel chooses the file format by the extension
+                atomic_write(cache_file, decoded_img.to_filename, suffix=".nii")
+            except Exception as e:
+                logger.warning("Could not write {}: {}".format(cache_file, e))
+                return decoded_img
+
+        img = nib.load(cache_file)
+        # uncompressed data is memory mapped by nibabel instead of read
+        img.get_data()
+        return img
+
+    def iter_images(self, imgs):
+        """
+        Yield the loaded images in order. At most twice as many images as there are
+        threads are loaded ahead of the consumer, so memory does not grow with the
+        cohort.
+        """
+        if self.nr_of_threads <= 1:
+            for img in imgs:
+                yield self.load_image(img)
+            return
+
+        with ThreadPoolExecutor(max_workers=self.nr_of_threads) as executor:
+            pending = deque()
+            for img in imgs:
+                pending.append(executor.submit(self.load_image, img))
+                if len(pending) >= 2 * self.nr_of_threads:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+
+    def load_images(self, imgs):
+        """
+        Load a list (or array) of images in parallel, a single image is simply loaded.
+        """
+        if isinstance(imgs, (list, np.ndarray)):
+            return list(self.iter_images(imgs))
+        return self.load_image(imgs)
@@ -4,6 +4,7 @@ from sklearn.base import BaseEstimator
 from nilearn.image import resample_img, smooth_img, index_img
 from nibabel.nifti1 import Nifti1Image
 
+from photonai.neuro.nifti_loader import NiftiLoader
 from photonai.photonlogger.logger import logger
 
 
@@ -146,9 +147,13 @@ class PatchImages(BaseEstimator):
             return PatchImages.draw_patch_from_mri(patch_x, patch_size)
         else:
             return_list = []
-            for p in patch_x:
+            imgs = patch_x
+            if all(isinstance(p, str) for p in patch_x):
+                # decompress the next files while drawing patches from the current one
+                imgs = NiftiLoader().iter_images(patch_x)
+            for p, img in zip(patch_x, imgs):
                 print(str(p))
-                return_list.append(PatchImages.draw_patch_from_mri(p, patch_size))
+                return_list.append(PatchImages.draw_patch_from_mri(img, patch_size))
             return return_list
 
     @staticmethod
@@ -160,7 +165,7 @@ class PatchImages(BaseEstimator):
             patch_x = np.ascontiguousarray(image.load_img(patch_x).get_data())
 
         if isinstance(patch_x, Nifti1Image):
-            patch_x = np.ascontiguousarray(patch_x.dataobj)
+            patch_x = np.ascontiguousarray(patch_x.get_data())
 
         # Todo: import is failing; why?
         from skimage.util.shape import view_as_windows
@@ -1,3 +1,6 @@
+import itertools
+
+
 class PhotonBaseOptimizer:
     """
     The PHOTON interface for hyperparameter search optimization algorithms.
@@ -35,6 +38,28 @@ class PhotonBaseOptimizer:
         """
         pass
 
+    def ask_batch(self, n_configurations: int, n_pending: int = 0):
+        """
+        When called, returns up to n_configurations configurations that can be tested at the same time.
+        The performance of each of them is passed to tell as soon as it is known, in arbitrary order.
+        By default, the optimizer is regarded as strictly sequential: a configuration is only handed out
+        if the performance of all pending configurations has been told.
+
+        Parameters
+        ----------
+        * 'n_configurations' [int]:
+            The maximal number of configurations to return, i.e. the number of idle workers.
+        * 'n_pending' [int, default=0]:
+            The number of configurations that have been handed out but not told about yet.
+
+        Returns
+        -------
+        list of configs to test. If it is empty and no configuration is pending, the search is finished.
+        """
+        if n_pending > 0:
+            return []
+        return list(itertools.islice(self.ask, 1))
+
     def plot(self, results_folder):
         """
         Plot optimizer specific visualizations
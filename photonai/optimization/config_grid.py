@@ -75,3 +75,38 @@ def create_global_config_grid(pipeline_elements, add_name=""):
             dict((praefix + pair[0], pair[1]) for d in c for pair in d.items())
         )
     return config_dicts
+
+
+def order_config_grid(config_dicts, pipeline_elements):
+    """
+    Orders configurations so that all configurations sharing the hyperparameters of the
+    first pipeline elements are tested one after the other: grouped by the hyperparameters
+    of the first element, then within each group by those of the second element and so on.
+
+    The pipeline caches the output of each element for the hyperparameters of all elements
+    up to it, so an expensive transformation early in the pipeline is computed once and
+    then reused for all configurations of the later elements, even if the cache is too
+    small to keep all outputs. Groups keep the order of their first occurrence.
+    """
+    element_names = [element.name for element in pipeline_elements]
+    # the position of each prefix of hyperparameter values in order of first occurrence
+    prefix_ranks = dict()
+
+    def sort_key(config):
+        values_by_element = [list() for _ in range(len(element_names) + 1)]
+        for key in sorted(config):
+            name = key.split("__")[0]
+            level = (
+                element_names.index(name)
+                if name in element_names
+                else len(element_names)
+            )
+            values_by_element[level].append((key, repr(config[key])))
+
+        ranks, prefix = list(), tuple()
+        for values in values_by_element:
+            prefix += tuple(values)
+            ranks.append(prefix_ranks.setdefault(prefix, len(prefix_ranks)))
+        return ranks
+
+    return sorted(config_dicts, key=sort_key)
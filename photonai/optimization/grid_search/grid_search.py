@@ -1,9 +1,13 @@
 import datetime
+import itertools
 
 import numpy as np
 
 from photonai.optimization.base_optimizer import PhotonBaseOptimizer
-from photonai.optimization.config_grid import create_global_config_grid
+from photonai.optimization.config_grid import (
+    create_global_config_grid,
+    order_config_grid,
+)
 from photonai.photonlogger.logger import logger
 
 
@@ -11,8 +15,14 @@ class GridSearchOptimizer(PhotonBaseOptimizer):
     """
     Searches for the best configuration by iteratively testing all
     possible hyperparameter combinations.
+
+    Configurations sharing the hyperparameters of the first pipeline elements
+    are tested one after the other, so that cached outputs of these elements are reused.
     """
 
+    # whether the configurations are reordered with order_config_grid
+    order_for_caching = True
+
     def __init__(self):
         self.param_grid = []
         self.pipeline_elements = None
@@ -26,6 +36,13 @@ class GridSearchOptimizer(PhotonBaseOptimizer):
         logger.info(
             "Grid Search generated " + str(len(self.param_grid)) + " configurations"
         )
+        self._select_configurations()
+        if self.order_for_caching:
+            self.param_grid = order_config_grid(self.param_grid, self.pipeline_elements)
+
+    def _select_configurations(self):
+        # all configurations are tested
+        pass
 
     def next_config_generator(self):
         for parameters in self.param_grid:
@@ -35,6 +52,10 @@ class GridSearchOptimizer(PhotonBaseOptimizer):
         # influence return value of next_config
         pass
 
+    def ask_batch(self, n_configurations: int, n_pending: int = 0):
+        # the configurations do not depend on each other's performance
+        return list(itertools.islice(self.ask, n_configurations))
+
 
 class RandomGridSearchOptimizer(GridSearchOptimizer):
     """
@@ -48,10 +69,12 @@ class RandomGridSearchOptimizer(GridSearchOptimizer):
         self.n_configurations = self._k
 
     def prepare(self, pipeline_elements, maximize_metric):
+        self.n_configurations = self._k
         super(RandomGridSearchOptimizer, self).prepare(
             pipeline_elements, maximize_metric
         )
-        self.n_configurations = self._k
+
+    def _select_configurations(self):
         self.param_grid = list(self.param_grid)
         # create random chaos in list
         np.random.shuffle(self.param_grid)
@@ -67,6 +90,10 @@ class TimeBoxedRandomGridSearchOptimizer(RandomGridSearchOptimizer):
     Iteratively tests k possible hyperparameter configurations until a certain time limit is reached.
     """
 
+    # the search is stopped after some time, so the configurations tested until then
+    # must be a random sample
+    order_for_caching = False
+
     def __init__(self, limit_in_minutes=60):
         super(TimeBoxedRandomGridSearchOptimizer, self).__init__()
         self.limit_in_minutes = limit_in_minutes
@@ -12,7 +12,13 @@ class PhotonBaseConstraint:
     evaluate if the configuration is promising. If not, further testing in other folds is skipped to increase speed.
     """
 
-    ENUM_STRATEGY = Enum("strategy", "first all mean")
+    # module and qualname are given so that the constraints can be pickled to worker processes
+    ENUM_STRATEGY = Enum(
+        "strategy",
+        "first all mean",
+        module=__name__,
+        qualname="PhotonBaseConstraint.ENUM_STRATEGY",
+    )
 
     def __init__(
         self,
@@ -1,4 +1,5 @@
 import datetime
+import itertools
 import random
 
 from photonai.optimization.base_optimizer import PhotonBaseOptimizer
@@ -35,6 +36,8 @@ class RandomSearchOptimizer(PhotonBaseOptimizer):
 
     def prepare(self, pipeline_elements, maximize_metric):
         self.pipeline_elements = pipeline_elements
+        self.k_configutration = 0
+        self.start_time = None
         self.ask = self.next_config_generator()
 
     def next_config_generator(self):
@@ -60,6 +63,10 @@ class RandomSearchOptimizer(PhotonBaseOptimizer):
         # influence return value of next_config
         pass
 
+    def ask_batch(self, n_configurations: int, n_pending: int = 0):
+        # the configurations do not depend on each other's performance
+        return list(itertools.islice(self.ask, n_configurations))
+
     def generate_config(self):
         config = {}
         for p_element in self.pipeline_elements:
@@ -1,3 +1,5 @@
+import itertools
+
 from skopt import Optimizer
 from skopt.space import Real, Integer
 from skopt.space import Categorical as skoptCategorical
@@ -18,6 +20,7 @@ class SkOptOptimizer(PhotonBaseOptimizer):
         n_configurations: int = 20,
         acq_func: str = "gp_hedge",
         acq_func_kwargs: dict = None,
+        batch_strategy: str = "cl_min",
     ):
         self.optimizer = None
         self.hyperparameter_list = []
@@ -28,6 +31,10 @@ class SkOptOptimizer(PhotonBaseOptimizer):
         self.acq_func_kwargs = acq_func_kwargs
         self.maximize_metric = True
         self.constant_dictionary = {}
+        # constant liar strategy for configs that are tested at the same time
+        self.batch_strategy = batch_strategy
+        self._n_asked = 0
+        self._pending_points = []
 
     def prepare(self, pipeline_elements: list, maximize_metric: bool):
 
@@ -58,6 +65,8 @@ class SkOptOptimizer(PhotonBaseOptimizer):
                 acq_func=self.acq_func,
                 acq_func_kwargs=self.acq_func_kwargs,
             )
+        self._n_asked = 0
+        self._pending_points = []
         self.ask = self.ask_generator()
 
     def _convert_PHOTON_to_skopt_space(self, hyperparam: object, name: str):
@@ -86,13 +95,41 @@ class SkOptOptimizer(PhotonBaseOptimizer):
         if self.optimizer is None:
             yield {}
         else:
-            for i in range(self.n_configurations):
+            while self._n_asked < self.n_configurations:
+                self._n_asked += 1
                 next_config_list = self.optimizer.ask()
-                next_config_dict = {
-                    self.hyperparameter_list[number]: self._convert_to_native(value)
-                    for number, value in enumerate(next_config_list)
-                }
-                yield next_config_dict
+                yield self._convert_to_config_dict(next_config_list)
+
+    def ask_batch(self, n_configurations: int, n_pending: int = 0):
+        if self.optimizer is None:
+            return list(itertools.islice(self.ask, 1))
+        n_configurations = min(n_configurations, self.n_configurations - self._n_asked)
+        if n_configurations <= 0:
+            return []
+        optimizer = self.optimizer
+        if self._pending_points:
+            # constant liar: the pending configs are told with a fake performance,
+            # so that the new configs are not proposed at the same spot
+            optimizer = self.optimizer.copy(
+                random_state=self.optimizer.rng.randint(0, np.iinfo(np.int32).max)
+            )
+            lie_fnc = {"cl_min": np.min, "cl_mean": np.mean, "cl_max": np.max}
+            y_lie = lie_fnc[self.batch_strategy](optimizer.yi) if optimizer.yi else 0.0
+            optimizer.tell(
+                self._pending_points, [y_lie] * len(self._pending_points)
+            )
+        next_config_lists = optimizer.ask(
+            n_points=n_configurations, strategy=self.batch_strategy
+        )
+        self._n_asked += len(next_config_lists)
+        self._pending_points.extend(next_config_lists)
+        return [self._convert_to_config_dict(c) for c in next_config_lists]
+
+    def _convert_to_config_dict(self, config_list):
+        return {
+            self.hyperparameter_list[number]: self._convert_to_native(value)
+            for number, value in enumerate(config_list)
+        }
 
     def _convert_to_native(self, obj):
         # check if we have a numpy object, if so convert it to python native
@@ -105,6 +142,8 @@ class SkOptOptimizer(PhotonBaseOptimizer):
         # convert dictionary to list in correct order
         if self.optimizer is not None:
             config_values = [config[name] for name in self.hyperparameter_list]
+            if config_values in self._pending_points:
+                self._pending_points.remove(config_values)
             best_config_metric_performance = performance[1]
             if self.maximize_metric:
                 if isinstance(best_config_metric_performance, list):
@@ -61,6 +61,8 @@ class SMACOptimizer(PhotonBaseOptimizer):
         self.challengers = []
         self.old_challengers = None
         self.ask_list = []
+        # index of the last config of ask_list that has been handed out
+        self.ask_list_position = -1
 
         self.switch_optiones = {}
         self.hyperparameters = []
@@ -176,6 +178,8 @@ class SMACOptimizer(PhotonBaseOptimizer):
 
         self.optimizer = self.smac.solver
         self.optimizer.runhistory.overwrite_existing_runs = True
+        self.ask_list = []
+        self.ask_list_position = -1
         self.ask = self.ask_generator()
 
     def tell(self, config, performance):
@@ -215,6 +219,20 @@ class SMACOptimizer(PhotonBaseOptimizer):
 
         self.runtime += 1
 
+    def ask_batch(self, n_configurations: int, n_pending: int = 0):
+        # the challengers of one smac iteration are independent of each other,
+        # but the next iteration is only computed once all of them have been told
+        batch = []
+        while len(batch) < n_configurations:
+            end_of_challengers = self.ask_list_position >= len(self.ask_list) - 1
+            if end_of_challengers and (batch or n_pending > 0):
+                break
+            config = next(self.ask, None)
+            if config is None:
+                break
+            batch.append(config)
+        return batch
+
     def ask_generator(self):
         def init():
 
@@ -297,6 +315,7 @@ class SMACOptimizer(PhotonBaseOptimizer):
                 val = yield {}
                 return
             else:
+                self.ask_list_position = i
                 val = (yield self.ask_list[i])
             if len(self.ask_list) - 1 == i:
                 i = init()
@@ -4,6 +4,8 @@ import traceback
 import warnings
 import datetime
 import numpy as np
+from sklearn.base import ClassifierMixin, RegressorMixin
+from sklearn.metrics import accuracy_score, r2_score
 
 from photonai.helper.helper import (
     PhotonPrintHelper,
@@ -43,6 +45,8 @@ class InnerFoldManager(object):
         training: bool = False,
         cache_folder=None,
         cache_updater=None,
+        worker_pool=None,
+        shared_data_file=None,
     ):
         """
         Creates a new InnerFoldManager object
@@ -51,6 +55,10 @@ class InnerFoldManager(object):
         :type specific_config: dict
         :param raise_error: if true, raises exception when training and testing the pipeline fails
         :type raise_error: bool
+        :param worker_pool: if given, the inner folds are computed in parallel by the pool's workers
+        :type worker_pool: PhotonWorkerPool
+        :param shared_data_file: the data passed to fit, already shared with the workers of the pool
+        :type shared_data_file: str
         """
         self.params = specific_config
         self.pipe = pipe_ctor
@@ -62,6 +70,9 @@ class InnerFoldManager(object):
         self.cache_folder = cache_folder
         self.cache_updater = cache_updater
 
+        self.worker_pool = worker_pool
+        self.shared_data_file = shared_data_file
+
         self.raise_error = raise_error
         self.training = training
 
@@ -86,101 +97,34 @@ class InnerFoldManager(object):
 
         try:
             # do inner cv
-            for idx, (inner_fold_id, inner_fold) in enumerate(
-                self.cross_validation_infos.inner_folds[self.outer_fold_id].items()
-            ):
-
-                train, test = inner_fold.train_indices, inner_fold.test_indices
-
-                # split kwargs according to cross validation
-                train_X, train_y, kwargs_cv_train = PhotonDataHelper.split_data(
-                    X, y, kwargs, indices=train
-                )
-                test_X, test_y, kwargs_cv_test = PhotonDataHelper.split_data(
-                    X, y, kwargs, indices=test
-                )
-
-                new_pipe = self.pipe()
-                if self.cache_folder is not None and self.cache_updater is not None:
-                    self.cache_updater(new_pipe, self.cache_folder, inner_fold_id)
-
-                if not config_item.human_readable_config:
-                    config_item.human_readable_config = PhotonPrintHelper.config_to_human_readable_dict(
-                        new_pipe, self.params
+            inner_fold_results = self._compute_inner_folds(X, y, kwargs, config_item)
+            try:
+                for idx, inner_fold_result in enumerate(inner_fold_results):
+                    curr_test_fold, curr_train_fold, durations, feature_importances = (
+                        inner_fold_result
                     )
-                    logger.clean_info(
-                        json.dumps(
-                            config_item.human_readable_config, indent=4, sort_keys=True
-                        )
+                    fold_nr = idx + 1
+                    logger.debug("Performance inner fold " + str(fold_nr))
+                    print_double_metrics(
+                        curr_train_fold.metrics,
+                        curr_test_fold.metrics,
+                        photon_system_log=False,
                     )
 
-                job_data = InnerFoldManager.InnerCVJob(
-                    pipe=new_pipe,
-                    config=dict(self.params),
-                    metrics=self.optimization_infos.metrics,
-                    callbacks=self.optimization_constraints,
-                    train_data=InnerFoldManager.JobData(
-                        train_X, train_y, train, kwargs_cv_train
-                    ),
-                    test_data=InnerFoldManager.JobData(
-                        test_X, test_y, test, kwargs_cv_test
-                    ),
-                )
-
-                # only for unparallel processing
-                # inform children in which inner fold we are
-                # self.pipe.distribute_cv_info_to_hyperpipe_children(inner_fold_counter=fold_cnt)
-                # self.mother_inner_fold_handle(fold_cnt)
-
-                # --> write that output in InnerFoldManager!
-                # logger.debug(config_item.human_readable_config)
-                fold_nr = idx + 1
-                logger.debug("calculating inner fold " + str(fold_nr) + "...")
-
-                curr_test_fold, curr_train_fold = InnerFoldManager.fit_and_score(
-                    job_data
-                )
-                logger.debug("Performance inner fold " + str(fold_nr))
-                print_double_metrics(
-                    curr_train_fold.metrics,
-                    curr_test_fold.metrics,
-                    photon_system_log=False,
-                )
-
-                durations = job_data.pipe.time_monitor
-
-                self.update_config_item_with_inner_fold(
-                    config_item=config_item,
-                    fold_cnt=fold_nr,
-                    curr_train_fold=curr_train_fold,
-                    curr_test_fold=curr_test_fold,
-                    time_monitor=durations,
-                    feature_importances=new_pipe.feature_importances_,
-                )
+                    self.update_config_item_with_inner_fold(
+                        config_item=config_item,
+                        fold_cnt=fold_nr,
+                        curr_train_fold=curr_train_fold,
+                        curr_test_fold=curr_test_fold,
+                        time_monitor=durations,
+                        feature_importances=feature_importances,
+                    )
 
-                if isinstance(self.optimization_constraints, list):
-                    break_cv = 0
-                    for cf in self.optimization_constraints:
-                        if not cf.shall_continue(config_item):
-                            logger.info(
-                                "Skipped further cross validation after fold "
-                                + str(fold_nr)
-                                + " due to performance constraints in "
-                                + cf.metric
-                            )
-                            break_cv += 1
-                            break
-                    if break_cv > 0:
-                        break
-                elif self.optimization_constraints is not None:
-                    if not self.optimization_constraints.shall_continue(config_item):
-                        logger.info(
-                            "Skipped further cross validation after fold "
-                            + str(fold_nr)
-                            + " due to performance constraints in "
-                            + cf.metric
-                        )
+                    if not self._shall_continue(config_item, fold_nr):
                         break
+            finally:
+                # cancels the folds that have not been started yet
+                inner_fold_results.close()
 
             InnerFoldManager.process_fit_results(
                 config_item,
@@ -208,6 +152,109 @@ class InnerFoldManager(object):
         config_item.computation_end_time = datetime.datetime.now()
         return config_item
 
+    def _create_job(self, X, y, kwargs, inner_fold_id, inner_fold, config_item):
+        train, test = inner_fold.train_indices, inner_fold.test_indices
+
+        new_pipe = self.pipe()
+        if self.cache_folder is not None and self.cache_updater is not None:
+            self.cache_updater(new_pipe, self.cache_folder, inner_fold_id)
+
+        if not config_item.human_readable_config:
+            config_item.human_readable_config = PhotonPrintHelper.config_to_human_readable_dict(
+                new_pipe, self.params
+            )
+            logger.clean_info(
+                json.dumps(config_item.human_readable_config, indent=4, sort_keys=True)
+            )
+
+        if self.worker_pool is not None:
+            # the worker splits the shared data itself
+            train_data = InnerFoldManager.JobData(None, None, train, None)
+            test_data = InnerFoldManager.JobData(None, None, test, None)
+        else:
+            # split kwargs according to cross validation
+            train_X, train_y, kwargs_cv_train = PhotonDataHelper.split_data(
+                X, y, kwargs, indices=train
+            )
+            test_X, test_y, kwargs_cv_test = PhotonDataHelper.split_data(
+                X, y, kwargs, indices=test
+            )
+            train_data = InnerFoldManager.JobData(
+                train_X, train_y, train, kwargs_cv_train
+            )
+            test_data = InnerFoldManager.JobData(test_X, test_y, test, kwargs_cv_test)
+
+        return InnerFoldManager.InnerCVJob(
+            pipe=new_pipe,
+            config=dict(self.params),
+            metrics=self.optimization_infos.metrics,
+            callbacks=self.optimization_constraints,
+            train_data=train_data,
+            test_data=test_data,
+        )
+
+    def _compute_inner_folds(self, X, y, kwargs, config_item):
+        """
+        Generator yielding (test fold, train fold, time monitor, feature importances) in fold order.
+        If there is a worker pool, all folds are submitted at once and the ones that are not
+        started yet are cancelled when the generator is closed early.
+        """
+        inner_folds = self.cross_validation_infos.inner_folds[self.outer_fold_id].items()
+
+        if self.worker_pool is None:
+            for idx, (inner_fold_id, inner_fold) in enumerate(inner_folds):
+                job_data = self._create_job(
+                    X, y, kwargs, inner_fold_id, inner_fold, config_item
+                )
+                logger.debug("calculating inner fold " + str(idx + 1) + "...")
+                curr_test_fold, curr_train_fold = InnerFoldManager.fit_and_score(
+                    job_data
+                )
+                yield (
+                    curr_test_fold,
+                    curr_train_fold,
+                    job_data.pipe.time_monitor,
+                    job_data.pipe.feature_importances_,
+                )
+        else:
+            shared_data_file = self.shared_data_file
+            if shared_data_file is None:
+                shared_data_file = self.worker_pool.share_data(X, y, kwargs)
+            futures = [
+                self.worker_pool.submit(
+                    InnerFoldManager.fit_and_score_in_worker,
+                    self._create_job(
+                        X, y, kwargs, inner_fold_id, inner_fold, config_item
+                    ),
+                    shared_data_file,
+                )
+                for inner_fold_id, inner_fold in inner_folds
+            ]
+            try:
+                for future in futures:
+                    yield future.result()
+            finally:
+                for future in futures:
+                    future.cancel()
+
+    def _shall_continue(self, config_item, fold_nr):
+        if self.optimization_constraints is None:
+            return True
+        if isinstance(self.optimization_constraints, list):
+            constraints = self.optimization_constraints
+        else:
+            constraints = [self.optimization_constraints]
+        for cf in constraints:
+            if not cf.shall_continue(config_item):
+                logger.info(
+                    "Skipped further cross validation after fold "
+                    + str(fold_nr)
+                    + " due to performance constraints in "
+                    + cf.metric
+                )
+                return False
+        return True
+
     class JobData:
         def __init__(self, X, y, indices, cv_kwargs):
             self.X = X
@@ -335,8 +382,10 @@ class InnerFoldManager(object):
         # set params to current config
         pipe.set_params(**job.config)
 
-        # start fitting
-        pipe.fit(job.train_data.X, job.train_data.y, **job.train_data.cv_kwargs)
+        # start fitting, the transformed training data is kept for scoring it
+        train_data_transformed = pipe.fit_transform(
+            job.train_data.X, job.train_data.y, **job.train_data.cv_kwargs
+        )
 
         logger.debug("Scoring Training Data")
 
@@ -359,11 +408,28 @@ class InnerFoldManager(object):
             job.metrics,
             indices=job.train_data.indices,
             training=True,
+            transformed_data=train_data_transformed,
             **job.train_data.cv_kwargs
         )
 
         return curr_test_fold, curr_train_fold
 
+    @staticmethod
+    def fit_and_score_in_worker(job: InnerCVJob, shared_data_file):
+        # runs in a worker process: the fold is cut out of the memory-mapped data
+        X, y, kwargs = PhotonDataHelper.load_shared_data(shared_data_file)
+        for job_data in [job.train_data, job.test_data]:
+            job_data.X, job_data.y, job_data.cv_kwargs = PhotonDataHelper.split_data(
+                X, y, kwargs, indices=job_data.indices
+            )
+        curr_test_fold, curr_train_fold = InnerFoldManager.fit_and_score(job)
+        return (
+            curr_test_fold,
+            curr_train_fold,
+            job.pipe.time_monitor,
+            job.pipe.feature_importances_,
+        )
+
     @staticmethod
     def score(
         estimator,
@@ -373,11 +439,15 @@ class InnerFoldManager(object):
         indices=[],
         calculate_metrics: bool = True,
         training: bool = False,
+        transformed_data: tuple = None,
         **kwargs
     ):
         """
         Uses the pipeline to predict the given data, compare it to the truth values and calculate metrics
 
+        The data is transformed by the pipeline only once, the predictions, the probabilities and
+        the default score are calculated by the final estimator on the transformed data.
+
         :param estimator: the pipeline or pipeline element for prediction
         :param X: the data for prediction
         :param y_true: the truth values for the data
@@ -385,6 +455,7 @@ class InnerFoldManager(object):
         :param indices: the indices of the given data and targets that are logged into the result tree
         :param training: if True, all training_only pipeline elements are executed, if False they are skipped
         :param calculate_metrics: if True, calculates metrics for given data
+        :param transformed_data: (X, y, kwargs) already transformed by the pipeline, e.g. by fit_transform
         :return: ScoreInformation object
         """
 
@@ -397,21 +468,32 @@ class InnerFoldManager(object):
         # so we use this:
         checklist = ["score"]
         matches = set(checklist).intersection(set(non_default_score_metrics))
-        if len(matches) > 0:
-            # Todo: Here it is potentially slowing down!!!!!!!!!!!!!!!!
-            default_score = estimator.score(X, y_true)
-            output_metrics["score"] = default_score
+        calculate_default_score = len(matches) > 0
+        if calculate_default_score:
             non_default_score_metrics.remove("score")
 
-        if not training:
+        is_pipeline = hasattr(estimator, "_final_estimator")
+        if not is_pipeline:
+            if calculate_default_score:
+                output_metrics["score"] = estimator.score(X, y_true)
             y_pred = estimator.predict(X, **kwargs)
         else:
-            X, y_true_new, kwargs_new = estimator.transform(X, y_true, **kwargs)
-            if y_true_new is not None:
-                y_true = y_true_new
-            if kwargs_new is not None and len(kwargs_new) > 0:
-                kwargs = kwargs_new
+            if not training:
+                X, _, kwargs = estimator.transform(X, y=None, **kwargs)
+            else:
+                if transformed_data is None:
+                    transformed_data = estimator.transform(X, y_true, **kwargs)
+                X, y_true_new, kwargs_new = transformed_data
+                if y_true_new is not None:
+                    y_true = y_true_new
+                if kwargs_new is not None and len(kwargs_new) > 0:
+                    kwargs = kwargs_new
+            # from here on X is transformed, so the pipeline only calls the final estimator
             y_pred = estimator.predict(X, training=True, **kwargs)
+            if calculate_default_score:
+                output_metrics["score"] = InnerFoldManager._default_score(
+                    estimator._final_estimator, X, y_true, y_pred
+                )
 
         # Nice to have
         # InnerFoldManager.plot_some_data(y_true, y_pred)
@@ -432,29 +514,33 @@ class InnerFoldManager(object):
         final_scoring_time = time.time() - scoring_time_start
 
         probabilities = []
-        if hasattr(estimator, "_final_estimator"):
+        if is_pipeline:
             if hasattr(estimator._final_estimator.base_element, "predict_proba"):
-                probabilities = estimator.predict_proba(X, training=training, **kwargs)
-
-                try:
-                    if probabilities is not None:
-                        if not len(probabilities) == 0:
-                            probabilities = probabilities.tolist()
-                except:
-                    warnings.warn("No probabilities available.")
-
-        if not isinstance(y_pred, list):
-            y_pred = np.asarray(y_pred).tolist()
-        if not isinstance(y_true, list):
-            y_true = np.asarray(y_true).tolist()
+                probabilities = estimator.predict_proba(X, training=True, **kwargs)
+                if probabilities is not None and len(probabilities) > 0:
+                    probabilities = np.asarray(probabilities)
 
+        # the result tree stores typed arrays, see ArrayField
         score_result_object = MDBScoreInformation(
             metrics=output_metrics,
             score_duration=final_scoring_time,
-            y_pred=y_pred,
-            y_true=y_true,
-            indices=np.asarray(indices).tolist(),
+            y_pred=np.asarray(y_pred),
+            y_true=np.asarray(y_true),
+            indices=np.asarray(indices),
             probabilities=probabilities,
         )
 
         return score_result_object
+
+    @staticmethod
+    def _default_score(final_estimator, X, y_true, y_pred):
+        # the default scores of sklearn classifiers and regressors only need the predictions
+        score_function = getattr(
+            type(getattr(final_estimator, "base_element", None)), "score", None
+        )
+        if np.ndim(y_true) == 1:
+            if score_function is ClassifierMixin.score:
+                return accuracy_score(y_true, y_pred)
+            if score_function is RegressorMixin.score:
+                return r2_score(y_true, y_pred)
+        return final_estimator.score(X, y_true)
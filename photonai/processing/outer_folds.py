@@ -1,11 +1,17 @@
 import datetime
 import warnings
+from concurrent.futures import wait, FIRST_COMPLETED
 import numpy as np
 import json
 
 from prettytable import PrettyTable
 
-from photonai.helper.helper import PhotonDataHelper, print_double_metrics, print_metrics
+from photonai.helper.helper import (
+    PhotonDataHelper,
+    PhotonWorkerPool,
+    print_double_metrics,
+    print_metrics,
+)
 from photonai.optimization import DummyPerformance
 from photonai.photonlogger.logger import logger
 from photonai.processing.inner_folds import InnerFoldManager
@@ -32,6 +38,11 @@ class OuterFoldManager:
         cache_updater=None,
         dummy_estimator=None,
         result_obj=None,
+        inner_fold_n_jobs: int = 1,
+        config_n_jobs: int = 1,
+        parallel_backend: str = "processes",
+        finished_configs: list = None,
+        result_saver=None,
     ):
         # Information from the Hyperpipe about the design choices
         self.outer_fold_id = outer_fold_id
@@ -44,8 +55,22 @@ class OuterFoldManager:
         self.cache_folder = cache_folder
         self.cache_updater = cache_updater
 
+        # configs of an interrupted run that are taken over instead of being computed,
+        # and the function that saves the results after every config
+        self.finished_configs = finished_configs
+        self.result_saver = result_saver
+        self._finished_configs = dict()
+
+        # either the configs or the inner folds of each config are distributed to one worker pool
+        self.inner_fold_n_jobs = inner_fold_n_jobs
+        self.config_n_jobs = config_n_jobs
+        self.parallel_backend = parallel_backend
+        self._worker_pool = None
+        self._shared_validation_data = None
+
         # Information about the optimization progress
         self.current_best_config = None
+        self._best_metric_yet = None
         self.optimizer = None
         self.constraint_objects = None
 
@@ -110,6 +135,11 @@ class OuterFoldManager:
         self._test_X, self._test_y, self._test_kwargs = PhotonDataHelper.split_data(
             X, y, kwargs, indices=test_indices
         )
+        if self._worker_pool is not None:
+            # the workers cut the inner folds out of the memory-mapped validation set
+            self._shared_validation_data = self._worker_pool.share_data(
+                self._validation_X, self._validation_y, self._validation_kwargs
+            )
 
         # write numbers to database info object
         self.result_object.number_samples_validation = self._validation_y.shape[0]
@@ -123,6 +153,12 @@ class OuterFoldManager:
             )
 
     def _generate_inner_folds(self):
+        if self.outer_fold_id in self.cross_validaton_info.inner_folds:
+            # a resumed outer fold keeps the inner folds of the interrupted run
+            self.inner_folds = list(
+                self.cross_validaton_info.inner_folds[self.outer_fold_id].values()
+            )
+            return
 
         self.inner_folds = FoldInfo.generate_folds(
             self.cross_validaton_info.inner_cv,
@@ -136,6 +172,23 @@ class OuterFoldManager:
         }
 
     def fit(self, X, y=None, **kwargs):
+        if self.config_n_jobs > 1 or self.inner_fold_n_jobs > 1:
+            # if the configs are evaluated in parallel, their inner folds are computed sequentially
+            if self.config_n_jobs > 1:
+                n_jobs = self.config_n_jobs
+            else:
+                n_jobs = self.inner_fold_n_jobs
+            with PhotonWorkerPool(n_jobs, self.parallel_backend) as worker_pool:
+                self._worker_pool = worker_pool
+                try:
+                    self._fit(X, y, **kwargs)
+                finally:
+                    self._worker_pool = None
+                    self._shared_validation_data = None
+        else:
+            self._fit(X, y, **kwargs)
+
+    def _fit(self, X, y=None, **kwargs):
         logger.photon_system_log("")
         logger.photon_system_log(
             "********************************************************"
@@ -155,8 +208,7 @@ class OuterFoldManager:
         self._prepare_optimization()
 
         outer_fold_fit_start_time = datetime.datetime.now()
-        best_metric_yet = None
-        tested_config_counter = 0
+        self._best_metric_yet = None
 
         # distribute number of folds to encapsulated child hyperpipes
         # self.__distribute_cv_info_to_hyperpipe_children(num_of_folds=num_folds,
@@ -171,119 +223,45 @@ class OuterFoldManager:
         if hasattr(self.optimizer, "n_configurations"):
             max_nr_of_configs = str(self.optimizer.n_configurations)
 
-        # do the optimizing1
-        for current_config in self.optimizer.ask:
-            if current_config is None:
-                continue
-            logger.clean_info(
-                "---------------------------------------------------------------------------------------------------------------"
-            )
-            tested_config_counter += 1
+        tested_config_counter = self._tell_finished_configs(
+            fold_operation, max_nr_of_configs
+        )
 
-            if hasattr(self.optimizer, "ask_for_pipe"):
-                pipe_ctor = self.optimizer.ask_for_pipe()
-            else:
-                pipe_ctor = self.copy_pipe_fnc
-
-            # self.__distribute_cv_info_to_hyperpipe_children(reset=True, config_counter=tested_config_counter)
-
-            hp = InnerFoldManager(
-                pipe_ctor,
-                current_config,
-                self.optimization_info,
-                self.cross_validaton_info,
-                self.outer_fold_id,
-                self.constraint_objects,
-                cache_folder=self.cache_folder,
-                cache_updater=self.cache_updater,
+        # do the optimizing
+        if self.config_n_jobs > 1:
+            tested_config_counter = self._optimize_parallelized(
+                fold_operation, max_nr_of_configs, tested_config_counter
             )
+        else:
+            for current_config in self.optimizer.ask:
+                if current_config is None:
+                    continue
+                if self._skip_finished_config(current_config):
+                    continue
+                if self._n_configs_left(tested_config_counter) == 0:
+                    # the finished configs of an interrupted fit used up the budget
+                    break
+                logger.clean_info(
+                    "---------------------------------------------------------------------------------------------------------------"
+                )
+                tested_config_counter += 1
 
-            # Test the configuration cross validated by inner_cv object
-            current_config_mdb = hp.fit(
-                self._validation_X, self._validation_y, **self._validation_kwargs
-            )
-            current_config_mdb.config_nr = tested_config_counter
+                hp = self._create_inner_fold_manager(
+                    current_config, worker_pool=self._worker_pool
+                )
 
-            if not current_config_mdb.config_failed:
-                metric_train = MDBHelper.get_metric(
-                    current_config_mdb,
-                    fold_operation,
-                    self.optimization_info.best_config_metric,
+                # Test the configuration cross validated by inner_cv object
+                current_config_mdb = hp.fit(
+                    self._validation_X, self._validation_y, **self._validation_kwargs
                 )
-                metric_test = MDBHelper.get_metric(
+                current_config_mdb.config_nr = tested_config_counter
+
+                self._process_config_result(
+                    current_config,
                     current_config_mdb,
                     fold_operation,
-                    self.optimization_info.best_config_metric,
-                    train=False,
-                )
-
-                if metric_train is None or metric_test is None:
-                    raise Exception(
-                        "Config did not fail, but did not get any metrics either....!!?"
-                    )
-                config_performance = (metric_train, metric_test)
-                if best_metric_yet is None:
-                    best_metric_yet = config_performance
-                    self.current_best_config = current_config_mdb
-                else:
-                    # check if we have the next superstar around that exceeds any old performance
-                    if self.optimization_info.maximize_metric:
-                        if metric_test > best_metric_yet[1]:
-                            best_metric_yet = config_performance
-                            self.current_best_config.save_memory()
-                            self.current_best_config = current_config_mdb
-                        else:
-                            current_config_mdb.save_memory()
-                    else:
-                        if metric_test < best_metric_yet[1]:
-                            best_metric_yet = config_performance
-                            self.current_best_config.save_memory()
-                            self.current_best_config = current_config_mdb
-                        else:
-                            current_config_mdb.save_memory()
-
-                # Print Result for config
-                computation_duration = (
-                    current_config_mdb.computation_end_time
-                    - current_config_mdb.computation_start_time
+                    max_nr_of_configs,
                 )
-                logger.info(
-                    "Computed configuration "
-                    + str(tested_config_counter)
-                    + "/"
-                    + max_nr_of_configs
-                    + " in "
-                    + str(computation_duration)
-                )
-                logger.info(
-                    "Performance:             "
-                    + self.optimization_info.best_config_metric
-                    + " - Train: "
-                    + "%.4f" % config_performance[0]
-                    + ", Validation: "
-                    + "%.4f" % config_performance[1]
-                )
-                logger.info(
-                    "Best Performance So Far: "
-                    + self.optimization_info.best_config_metric
-                    + " - Train: "
-                    + "%.4f" % best_metric_yet[0]
-                    + ", Validation: "
-                    + "%.4f" % best_metric_yet[1]
-                )
-            else:
-                config_performance = (-1, -1)
-                # Print Result for config
-                logger.debug("...failed:")
-                logger.error(current_config_mdb.config_error)
-
-            # add config to result tree
-            self.result_object.tested_config_list.append(current_config_mdb)
-
-            # 3. inform optimizer about performance
-            logger.debug("Telling hyperparameter optimizer about recent performance.")
-            self.optimizer.tell(current_config, config_performance)
-            logger.debug("Asking hyperparameter optimizer for new config.")
         logger.clean_info(
             "---------------------------------------------------------------------------------------------------------------"
         )
@@ -323,7 +301,8 @@ class OuterFoldManager:
             # self.__distribute_cv_info_to_hyperpipe_children(reset=True)
 
             logger.debug("Fitting model with best configuration of outer fold...")
-            optimum_pipe.fit(
+            # the transformed training data is kept for scoring it
+            validation_data_transformed = optimum_pipe.fit_transform(
                 self._validation_X, self._validation_y, **self._validation_kwargs
             )
 
@@ -369,6 +348,7 @@ class OuterFoldManager:
                     ].train_indices,
                     metrics=self.optimization_info.metrics,
                     training=True,
+                    transformed_data=validation_data_transformed,
                     **self._validation_kwargs
                 )
 
@@ -412,6 +392,240 @@ class OuterFoldManager:
             )
         )
 
+    def _create_inner_fold_manager(self, current_config, worker_pool=None):
+        if hasattr(self.optimizer, "ask_for_pipe"):
+            pipe_ctor = self.optimizer.ask_for_pipe()
+        else:
+            pipe_ctor = self.copy_pipe_fnc
+
+        # self.__distribute_cv_info_to_hyperpipe_children(reset=True, config_counter=tested_config_counter)
+
+        return InnerFoldManager(
+            pipe_ctor,
+            current_config,
+            self.optimization_info,
+            self.cross_validaton_info,
+            self.outer_fold_id,
+            self.constraint_objects,
+            cache_folder=self.cache_folder,
+            cache_updater=self.cache_updater,
+            worker_pool=worker_pool,
+            shared_data_file=self._shared_validation_data,
+        )
+
+    @staticmethod
+    def fit_config_in_worker(inner_fold_manager, shared_data_file):
+        # runs in a worker process: the validation set is memory-mapped, the config item is sent back
+        X, y, kwargs = PhotonDataHelper.load_shared_data(shared_data_file)
+        return inner_fold_manager.fit(X, y, **kwargs)
+
+    def _optimize_parallelized(
+        self, fold_operation, max_nr_of_configs, tested_config_counter=0
+    ):
+        """
+        Keeps config_n_jobs configurations in flight: whenever a configuration is done, the optimizer
+        is told about its performance and asked for as many new configurations as there are idle workers.
+        Returns the number of tested configurations.
+        """
+        running = dict()
+        while True:
+            n_idle = self.config_n_jobs - len(running)
+            n_configs_left = self._n_configs_left(tested_config_counter)
+            if n_configs_left is not None:
+                n_idle = min(n_idle, n_configs_left)
+            if n_idle > 0:
+                new_configs = self.optimizer.ask_batch(n_idle, n_pending=len(running))
+                skipped = False
+                for current_config in new_configs:
+                    if current_config is None:
+                        continue
+                    if self._skip_finished_config(current_config):
+                        skipped = True
+                        continue
+                    tested_config_counter += 1
+                    future = self._worker_pool.submit(
+                        OuterFoldManager.fit_config_in_worker,
+                        self._create_inner_fold_manager(current_config),
+                        self._shared_validation_data,
+                    )
+                    running[future] = (tested_config_counter, current_config)
+                if skipped:
+                    # the workers may still be idle, so ask for the next configs
+                    continue
+
+            if not running:
+                break
+
+            done, _ = wait(list(running.keys()), return_when=FIRST_COMPLETED)
+            for future in sorted(done, key=lambda f: running[f][0]):
+                config_nr, current_config = running.pop(future)
+                current_config_mdb = future.result()
+                current_config_mdb.config_nr = config_nr
+                logger.clean_info(
+                    "---------------------------------------------------------------------------------------------------------------"
+                )
+                # the constraint objects were copied to the worker, so they learn about the config here
+                if (
+                    self.constraint_objects is not None
+                    and not current_config_mdb.config_failed
+                ):
+                    for constraint in self.constraint_objects:
+                        constraint.shall_continue(current_config_mdb)
+                self._process_config_result(
+                    current_config,
+                    current_config_mdb,
+                    fold_operation,
+                    max_nr_of_configs,
+                )
+
+        # the configs finish in arbitrary order
+        self.result_object.tested_config_list = sorted(
+            self.result_object.tested_config_list, key=lambda c: c.config_nr
+        )
+        return tested_config_counter
+
+    @staticmethod
+    def _config_key(config_dict):
+        return json.dumps(config_dict, sort_keys=True, default=str)
+
+    def _tell_finished_configs(self, fold_operation, max_nr_of_configs):
+        """
+        Puts the configs that were computed before the fit was interrupted into the result tree and
+        tells the optimizer about them, before it is asked for the first config. Optimizers that learn
+        from the performances continue from there instead of proposing the same configs again.
+        Returns the number of finished configs.
+        """
+        self._finished_configs = dict()
+        finished_configs = self.finished_configs or []
+        for config_nr, finished_config in enumerate(finished_configs, 1):
+            logger.info(
+                "Taking over configuration {} from the results".format(config_nr)
+            )
+            finished_config.config_nr = config_nr
+            self._finished_configs[
+                OuterFoldManager._config_key(finished_config.config_dict)
+            ] = self._config_performance(finished_config, fold_operation)
+            self._process_config_result(
+                finished_config.config_dict,
+                finished_config,
+                fold_operation,
+                max_nr_of_configs,
+            )
+        return len(finished_configs)
+
+    def _skip_finished_config(self, current_config):
+        # a finished config that is proposed again, e.g. by a grid search, is not computed twice
+        config_performance = self._finished_configs.pop(
+            OuterFoldManager._config_key(current_config), None
+        )
+        if config_performance is None:
+            return False
+        self.optimizer.tell(current_config, config_performance)
+        return True
+
+    def _n_configs_left(self, tested_config_counter):
+        """
+        The finished configs of an interrupted fit count against the n_configurations of the optimizer.
+        Returns None if the optimizer has no such limit.
+        """
+        n_configurations = getattr(self.optimizer, "n_configurations", None)
+        if n_configurations is None:
+            return None
+        return max(n_configurations - tested_config_counter, 0)
+
+    def _config_performance(self, config_mdb, fold_operation):
+        """
+        The (train, validation) performance that the optimizer is told about.
+        """
+        if config_mdb.config_failed:
+            return -1, -1
+        metric_train = MDBHelper.get_metric(
+            config_mdb, fold_operation, self.optimization_info.best_config_metric
+        )
+        metric_test = MDBHelper.get_metric(
+            config_mdb,
+            fold_operation,
+            self.optimization_info.best_config_metric,
+            train=False,
+        )
+        if metric_train is None or metric_test is None:
+            raise Exception(
+                "Config did not fail, but did not get any metrics either....!!?"
+            )
+        return metric_train, metric_test
+
+    def _process_config_result(
+        self, current_config, current_config_mdb, fold_operation, max_nr_of_configs
+    ):
+        config_performance = self._config_performance(
+            current_config_mdb, fold_operation
+        )
+        if not current_config_mdb.config_failed:
+            metric_test = config_performance[1]
+            if self._best_metric_yet is None:
+                self._best_metric_yet = config_performance
+                self.current_best_config = current_config_mdb
+            else:
+                # check if we have the next superstar around that exceeds any old performance
+                if self.optimization_info.maximize_metric:
+                    if metric_test > self._best_metric_yet[1]:
+                        self._best_metric_yet = config_performance
+                        self.current_best_config.save_memory()
+                        self.current_best_config = current_config_mdb
+                    else:
+                        current_config_mdb.save_memory()
+                else:
+                    if metric_test < self._best_metric_yet[1]:
+                        self._best_metric_yet = config_performance
+                        self.current_best_config.save_memory()
+                        self.current_best_config = current_config_mdb
+                    else:
+                        current_config_mdb.save_memory()
+
+            # Print Result for config
+            computation_duration = (
+                current_config_mdb.computation_end_time
+                - current_config_mdb.computation_start_time
+            )
+            logger.info(
+                "Computed configuration "
+                + str(current_config_mdb.config_nr)
+                + "/"
+                + max_nr_of_configs
+                + " in "
+                + str(computation_duration)
+            )
+            logger.info(
+                "Performance:             "
+                + self.optimization_info.best_config_metric
+                + " - Train: "
+                + "%.4f" % config_performance[0]
+                + ", Validation: "
+                + "%.4f" % config_performance[1]
+            )
+            logger.info(
+                "Best Performance So Far: "
+                + self.optimization_info.best_config_metric
+                + " - Train: "
+                + "%.4f" % self._best_metric_yet[0]
+                + ", Validation: "
+                + "%.4f" % self._best_metric_yet[1]
+            )
+        else:
+            # Print Result for config
+            logger.debug("...failed:")
+            logger.error(current_config_mdb.config_error)
+
+        # add config to result tree
+        self.result_object.tested_config_list.append(current_config_mdb)
+        if self.result_saver is not None:
+            self.result_saver()
+
+        # 3. inform optimizer about performance
+        logger.debug("Telling hyperparameter optimizer about recent performance.")
+        self.optimizer.tell(current_config, config_performance)
+        logger.debug("Asking hyperparameter optimizer for new config.")
+
     def _fit_dummy(self):
         if self.dummy_estimator is not None:
             logger.info("Running Dummy Estimator...")
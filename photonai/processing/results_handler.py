@@ -3,6 +3,7 @@ import itertools
 import os
 import pickle
 import pprint
+from contextlib import contextmanager
 from typing import Union
 
 import matplotlib
@@ -20,16 +21,59 @@ from sklearn.metrics import confusion_matrix, roc_curve
 
 from photonai.photonlogger.logger import logger
 from photonai.processing.metrics import Scorer
-from photonai.processing.results_structure import MDBHyperpipe
+from photonai.processing.results_structure import (
+    MDBHyperpipe,
+    MDBConfigRecord,
+    MDBHelper,
+)
 
 
 class ResultsHandler:
+    CONFIG_TABLE_FILE = "photon_config_table.csv"
+    CONFIG_TABLE_COLUMNS = [
+        "outer_fold",
+        "config",
+        "config_nr",
+        "config_failed",
+        "inner_fold",
+        "operation",
+        "metric",
+        "train",
+        "test",
+    ]
+
     def __init__(self, results_object: MDBHyperpipe = None, output_settings=None):
         self.results = results_object
         self.output_settings = output_settings
+        # number of tested configs per outer fold that were already saved
+        self._saved_config_counts = {}
+        # number of tested configs per outer fold that were written to MongoDB and to the
+        # records file, a failed write is repeated with the next save
+        self._mongodb_config_counts = {}
+        self._file_config_counts = {}
+        self._records_file_started = False
+        # the config table of the saved configs, in chunks as they were added
+        self._config_table_parts = []
 
     def load_from_file(self, results_file: str):
-        self.results = MDBHyperpipe.from_document(pickle.load(open(results_file, "rb")))
+        self.results = MDBHelper.load_results(results_file)
+        table_file = os.path.join(
+            os.path.dirname(results_file), ResultsHandler.CONFIG_TABLE_FILE
+        )
+        if os.path.isfile(table_file):
+            table = pd.read_csv(table_file, float_precision="round_trip")
+            config_counts = {
+                i: len(outer_fold.tested_config_list)
+                for i, outer_fold in enumerate(self.results.outer_folds)
+            }
+            table_counts = table.groupby("outer_fold").config.nunique()
+            # only use the table if it was written together with the loaded configs
+            if all(
+                table_counts.get(outer_fold.fold_nr, 0) == config_counts[i]
+                for i, outer_fold in enumerate(self.results.outer_folds)
+            ):
+                self._saved_config_counts = config_counts
+                self._config_table_parts = [table]
 
     def load_from_mongodb(self, mongodb_connect_url: str, pipe_name: str):
         connect(mongodb_connect_url)
@@ -47,6 +91,7 @@ class ResultsHandler:
             )
         else:
             raise FileNotFoundError("Could not load hyperpipe from MongoDB.")
+        MDBHelper.load_config_records_from_mongodb(self.results)
 
     @staticmethod
     def get_methods():
@@ -111,79 +156,134 @@ class ResultsHandler:
                 performances[metric].append(value)
         return performances
 
+    def get_config_table(self):
+        """
+        Returns all tested configs as a flat pandas DataFrame with one row per outer
+        fold, config, inner fold and metric.
+        The column config is the position of the config in the tested_config_list of
+        the outer fold. Rows of metrics that were aggregated over the inner folds have
+        the inner_fold -1 and their FoldOperation in the column operation.
+        """
+        if self._config_table_parts and not self._get_unsaved_configs():
+            if len(self._config_table_parts) > 1:
+                self._config_table_parts = [
+                    pd.concat(self._config_table_parts, ignore_index=True)
+                ]
+            return self._config_table_parts[0]
+        return self._create_config_table(
+            [
+                (i, position, config)
+                for i, outer_fold in enumerate(self.results.outer_folds)
+                for position, config in enumerate(outer_fold.tested_config_list)
+            ]
+        )
+
+    def _create_config_table(self, configs):
+        rows = []
+        for outer_fold_index, position, config in configs:
+            config_info = (
+                self.results.outer_folds[outer_fold_index].fold_nr,
+                position,
+                config.config_nr,
+                bool(config.config_failed),
+            )
+            n_rows = len(rows)
+            for inner_fold in config.inner_folds:
+                train = inner_fold.training.metrics if inner_fold.training else {}
+                test = inner_fold.validation.metrics if inner_fold.validation else {}
+                for metric in list(train) + [m for m in test if m not in train]:
+                    rows.append(
+                        config_info
+                        + (inner_fold.fold_nr, None, metric)
+                        + (train.get(metric, np.nan), test.get(metric, np.nan))
+                    )
+            train = {
+                (str(m.operation), m.metric_name): m.value for m in config.metrics_train
+            }
+            test = {
+                (str(m.operation), m.metric_name): m.value for m in config.metrics_test
+            }
+            for key in list(train) + [k for k in test if k not in train]:
+                rows.append(
+                    config_info
+                    + (-1,)
+                    + key
+                    + (train.get(key, np.nan), test.get(key, np.nan))
+                )
+            if len(rows) == n_rows:
+                # configs without any metrics keep their position in the table
+                rows.append(config_info + (-1, None, None, np.nan, np.nan))
+        return pd.DataFrame(rows, columns=ResultsHandler.CONFIG_TABLE_COLUMNS)
+
+    def _add_to_config_table(self, new_configs):
+        positions = dict(self._saved_config_counts)
+        configs = []
+        for outer_fold_index, config in new_configs:
+            position = positions.get(outer_fold_index, 0)
+            positions[outer_fold_index] = position + 1
+            configs.append((outer_fold_index, position, config))
+        table = self._create_config_table(configs)
+        if self.output_settings is not None and self.output_settings.save_output:
+            table_file = os.path.join(
+                self.output_settings.results_folder, ResultsHandler.CONFIG_TABLE_FILE
+            )
+            # the first write of this handler replaces the table of an overwritten run
+            first_part = not self._config_table_parts
+            table.to_csv(
+                table_file,
+                mode="w" if first_part else "a",
+                header=first_part,
+                index=False,
+            )
+        self._config_table_parts.append(table)
+
     def get_config_evaluations(self):
         """
         Return the test performance of every tested configuration in every outer fold.
-        :return:
+        :return: dict of metric name -> one list of the mean validation performances
+        per outer fold, failed configs and missing configs are nan
         """
-        config_performances = list()
-        maximum_fold = None
-        for outer_fold in self.results.outer_folds:
-            if (
-                maximum_fold is None
-                or len(outer_fold.tested_config_list) > maximum_fold
-            ):
-                maximum_fold = len(outer_fold.tested_config_list)
+        table = self.get_config_table()
+        outer_folds = [outer_fold.fold_nr for outer_fold in self.results.outer_folds]
+        n_configs = int(table.config.max()) + 1 if len(table) else 0
 
-        for outer_fold in self.results.outer_folds:
-            performance = dict()
-            for metric in self.results.hyperpipe_info.metrics:
-                performance[metric] = list()
-
-            for i in range(maximum_fold):
-                # for config in outer_fold.tested_config_list:
-                for metric in self.results.hyperpipe_info.metrics:
-                    if i >= len(outer_fold.tested_config_list):
-                        performance[metric].append(np.nan)
-                        continue
-                    config = outer_fold.tested_config_list[i]
-                    if config.config_failed:
-                        performance[metric].append(np.nan)
-                    else:
-                        for item in config.metrics_test:
-                            if (item.operation == "FoldOperations.MEAN") and (
-                                item.metric_name == metric
-                            ):
-                                performance[metric].append(item.value)
-            config_performances.append(performance)
+        mean_test = table[
+            (table.operation == "FoldOperations.MEAN")
+            & ~table.config_failed.astype(bool)
+        ]
+        mean_test = (
+            mean_test.set_index(["outer_fold", "config", "metric"])
+            .test.unstack("metric")
+            .reindex(pd.MultiIndex.from_product([outer_folds, range(n_configs)]))
+        )
 
         config_performances_dict = dict()
         for metric in self.results.hyperpipe_info.metrics:
-            config_performances_dict[metric] = list()
-            for fold in config_performances:
-                config_performances_dict[metric].append(fold[metric])
-
+            if metric in mean_test:
+                performance = mean_test[metric].values.astype(float)
+            else:
+                performance = np.full(len(outer_folds) * n_configs, np.nan)
+            config_performances_dict[metric] = performance.reshape(
+                len(outer_folds), n_configs
+            ).tolist()
         return config_performances_dict
 
     def get_minimum_config_evaluations(self):
+        """
+        Return the best performance reached so far after every tested configuration,
+        nan values are skipped.
+        """
         config_evaluations = self.get_config_evaluations()
         minimum_config_evaluations = dict()
 
         for metric, evaluations in config_evaluations.items():
-            minimum_config_evaluations[metric] = list()
-            greater_is_better = Scorer.greater_is_better_distinction(metric)
-
-            for fold in evaluations:
-                fold_evaluations = list()
-
-                if greater_is_better:
-                    for i, config in enumerate(fold):
-                        if i == 0:
-                            last_config = config
-                        else:
-                            if config > last_config:
-                                last_config = config
-                        fold_evaluations.append(last_config)
-                else:
-                    last_config = np.inf
-                    for i, config in enumerate(fold):
-                        if i == 0:
-                            last_config = config
-                        else:
-                            if config < last_config:
-                                last_config = config
-                        fold_evaluations.append(last_config)
-                minimum_config_evaluations[metric].append(fold_evaluations)
+            if Scorer.greater_is_better_distinction(metric):
+                best_so_far = np.fmax.accumulate
+            else:
+                best_so_far = np.fmin.accumulate
+            minimum_config_evaluations[metric] = best_so_far(
+                np.asarray(evaluations, dtype=float), axis=1
+            ).tolist()
 
         return minimum_config_evaluations
 
@@ -428,13 +528,13 @@ class ResultsHandler:
 
             for i, score_info in enumerate(score_info_list):
                 for collectable_key, collectable_list in collectables.items():
-                    if (
-                        getattr(score_info, collectable_key) is not None
-                        and len(getattr(score_info, collectable_key)) > 0
-                    ):
-                        collectables[collectable_key].extend(
-                            list(getattr(score_info, collectable_key))
-                        )
+                    values = getattr(score_info, collectable_key)
+                    if values is not None and len(values) > 0:
+                        # the result tree keeps typed arrays, python values are only
+                        # created here
+                        if isinstance(values, np.ndarray):
+                            values = values.tolist()
+                        collectables[collectable_key].extend(list(values))
                     else:
                         collectables[collectable_key].extend(
                             list(np.full((len(score_info.y_true)), np.nan))
@@ -812,23 +912,84 @@ class ResultsHandler:
             return str_fig.replace("False", "false").replace("True", "true")
 
     def save(self):
+        """
+        Saves the result tree. The tested configs are stored as separate records and
+        only the configs that were added since the last successful write are written.
+        """
+        new_configs = self._get_unsaved_configs()
 
         if self.output_settings.mongodb_connect_url:
-            connect(self.output_settings.mongodb_connect_url, alias="photon_core")
-            logger.debug("Write results to mongodb...")
-            try:
-                self.results.save()
-            except DocumentTooLarge as e:
-                logger.error("Could not save document into MongoDB: Document too large")
-                # try to reduce the amount of configs saved
-                # if len(results_tree.outer_folds[0].tested_config_list) > 100:
-                #     for outer_fold in results_tree.outer_folds:
-                #         metrics_configs = [outer_fold.tested_configlist
+            self.write_result_tree_to_mongodb()
 
         if self.output_settings.save_output:
             logger.info("Writing results to project folder...")
             self.write_result_tree_to_file()
 
+        if new_configs or not self._config_table_parts:
+            self._add_to_config_table(new_configs)
+        self._mark_saved(new_configs, self._saved_config_counts)
+
+    def _get_unsaved_configs(self, saved_config_counts=None):
+        if saved_config_counts is None:
+            saved_config_counts = self._saved_config_counts
+        new_configs = []
+        for i, outer_fold in enumerate(self.results.outer_folds):
+            for config in outer_fold.tested_config_list[
+                saved_config_counts.get(i, 0) :
+            ]:
+                new_configs.append((i, config))
+        return new_configs
+
+    @staticmethod
+    def _mark_saved(configs, saved_config_counts):
+        for outer_fold_index, _ in configs:
+            saved_config_counts[outer_fold_index] = (
+                saved_config_counts.get(outer_fold_index, 0) + 1
+            )
+
+    def write_result_tree_to_mongodb(self):
+        """
+        Saves the result tree without the tested configs and adds the configs that
+        were not written to MongoDB yet as MDBConfigRecord documents.
+        Returns False if the results could not be saved.
+        """
+        new_configs = self._get_unsaved_configs(self._mongodb_config_counts)
+        connect(self.output_settings.mongodb_connect_url, alias="photon_core")
+        logger.debug("Write results to mongodb...")
+        try:
+            with self._without_tested_configs():
+                self.results.save()
+            if new_configs:
+                MDBConfigRecord.objects.bulk_create(
+                    [
+                        MDBConfigRecord(
+                            hyperpipe_id=self.results._id,
+                            outer_fold_index=outer_fold_index,
+                            config=config,
+                        )
+                        for outer_fold_index, config in new_configs
+                    ]
+                )
+        except DocumentTooLarge as e:
+            logger.error("Could not save document into MongoDB: Document too large")
+            return False
+        self._mark_saved(new_configs, self._mongodb_config_counts)
+        return True
+
+    @contextmanager
+    def _without_tested_configs(self):
+        # the tested configs are saved as records of their own
+        config_lists = [
+            outer_fold.tested_config_list for outer_fold in self.results.outer_folds
+        ]
+        try:
+            for outer_fold in self.results.outer_folds:
+                outer_fold.tested_config_list = []
+            yield
+        finally:
+            for outer_fold, config_list in zip(self.results.outer_folds, config_lists):
+                outer_fold.tested_config_list = config_list
+
     def save_backmapping(self, filename: str, backmapping):
         try:
             if isinstance(backmapping, np.ndarray):
@@ -878,16 +1039,50 @@ class ResultsHandler:
                 self.eval_mean_time_components()
 
     def write_result_tree_to_file(self):
+        """
+        Appends the configs that were not written yet to the config records file and
+        rewrites the result tree without the tested configs.
+        Returns False if the results could not be written.
+        """
+        new_configs = self._get_unsaved_configs(self._file_config_counts)
+        # the first write of this handler replaces the records of an overwritten run
+        mode = "ab" if self._records_file_started else "wb"
+        records_file = os.path.join(
+            self.output_settings.results_folder, MDBHelper.CONFIG_RECORDS_FILE
+        )
+        try:
+            with open(records_file, mode) as file_opened:
+                for outer_fold_index, config in new_configs:
+                    record = {
+                        "outer_fold_index": outer_fold_index,
+                        "config": config.to_son(),
+                    }
+                    pickle.dump(record, file_opened)
+        except OSError as e:
+            logger.error("Could not write results to local file")
+            logger.error(str(e))
+            if self._records_file_started:
+                # records that made it into the file before the error would be
+                # appended twice, so the file is written from scratch next time
+                self._records_file_started = False
+                self._file_config_counts.clear()
+            return False
+        self._records_file_started = True
+        self._mark_saved(new_configs, self._file_config_counts)
+
         try:
+            with self._without_tested_configs():
+                results_son = self.results.to_son()
             local_file = os.path.join(
                 self.output_settings.results_folder, "photon_result_file.p"
             )
-            file_opened = open(local_file, "wb")
-            pickle.dump(self.results.to_son(), file_opened)
-            file_opened.close()
+            with open(local_file, "wb") as file_opened:
+                pickle.dump(results_son, file_opened)
         except OSError as e:
             logger.error("Could not write results to local file")
             logger.error(str(e))
+            return False
+        return True
 
     def get_best_config_inner_fold_predictions(self, filename=""):
         score_info_list = []
@@ -1,10 +1,58 @@
 import pickle
+import os
 import pickle
 import uuid
 from enum import Enum
 
 import numpy as np
+from bson import Binary
 from pymodm import MongoModel, EmbeddedMongoModel, fields
+from pymongo import ASCENDING
+
+
+class ArrayField(fields.MongoBaseField):
+    """
+    Stores a numpy array as typed binary buffer instead of a list of boxed python numbers.
+    The buffer is decoded on first access, lists of older result trees are returned as they are.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs.setdefault("default", list)
+        super(ArrayField, self).__init__(**kwargs)
+
+    def is_blank(self, value):
+        if isinstance(value, np.ndarray):
+            # arrays are always encoded, even empty ones
+            return False
+        return super(ArrayField, self).is_blank(value)
+
+    def to_python(self, value):
+        if isinstance(value, dict) and "buffer" in value:
+            array = np.frombuffer(
+                value["buffer"], dtype=value.get("storage_dtype", value["dtype"])
+            ).reshape(value["shape"])
+            if "storage_dtype" in value:
+                array = array.astype(value["dtype"])
+            return array
+        return value
+
+    def to_mongo(self, value):
+        if not isinstance(value, np.ndarray):
+            return value
+        if value.dtype.hasobject:
+            # python objects cannot be stored in a typed buffer
+            return value.tolist()
+        document = {"dtype": value.dtype.str, "shape": list(value.shape)}
+        if value.dtype.kind in "iu" and value.size > 0:
+            # class labels and sample indices mostly fit into one or two bytes
+            storage_dtype = np.promote_types(
+                np.min_scalar_type(value.min()), np.min_scalar_type(value.max())
+            )
+            if storage_dtype.itemsize < value.dtype.itemsize:
+                document["storage_dtype"] = storage_dtype.str
+                value = value.astype(storage_dtype)
+        document["buffer"] = Binary(np.ascontiguousarray(value).tobytes())
+        return document
 
 
 class MDBFoldMetric(EmbeddedMongoModel):
@@ -31,10 +79,10 @@ class MDBScoreInformation(EmbeddedMongoModel):
 
     metrics = fields.DictField(blank=True)
     score_duration = fields.IntegerField(blank=True)
-    y_true = fields.ListField(blank=True)
-    y_pred = fields.ListField(blank=True)
-    indices = fields.ListField(blank=True)
-    probabilities = fields.ListField(blank=True)
+    y_true = ArrayField(blank=True)
+    y_pred = ArrayField(blank=True)
+    indices = ArrayField(blank=True)
+    probabilities = ArrayField(blank=True)
     metrics_copied_from_inner = fields.BooleanField(default=False)
 
     def __str__(self):
@@ -207,6 +255,21 @@ class MDBHyperpipe(MongoModel):
     wizard_system_name = fields.CharField(blank=True)
 
 
+class MDBConfigRecord(MongoModel):
+    """
+    A tested config of a hyperpipe, stored as its own document so that saving the
+    results only has to add the configs tested since the last save.
+    """
+
+    class Meta:
+        final = True
+        connection_alias = "photon_core"
+
+    hyperpipe_id = fields.ObjectIdField()
+    outer_fold_index = fields.IntegerField()
+    config = fields.EmbeddedDocumentField(MDBConfig)
+
+
 class FoldOperations(Enum):
     MEAN = 0
     STD = 1
@@ -221,6 +284,7 @@ class ParallelData(MongoModel):
 
 class MDBHelper:
     OPERATION_DICT = {FoldOperations.MEAN: np.mean, FoldOperations.STD: np.std}
+    CONFIG_RECORDS_FILE = "photon_result_configs.p"
 
     @staticmethod
     def aggregate_metrics_for_outer_folds(outer_folds, metrics):
@@ -303,4 +367,58 @@ class MDBHelper:
 
     @staticmethod
     def load_results(filename):
-        return MDBHyperpipe.from_document(pickle.load(open(filename, "rb")))
+        with open(filename, "rb") as results_file:
+            results = MDBHyperpipe.from_document(pickle.load(results_file))
+        records_file = os.path.join(
+            os.path.dirname(filename), MDBHelper.CONFIG_RECORDS_FILE
+        )
+        if os.path.isfile(records_file):
+            MDBHelper.attach_config_records(
+                results, MDBHelper.read_config_records(records_file)
+            )
+        return results
+
+    @staticmethod
+    def load_config_records_from_mongodb(results):
+        """
+        Puts the configs that were saved as MDBConfigRecord documents back into the
+        outer folds of a hyperpipe loaded from MongoDB.
+        """
+        records = MDBConfigRecord.objects.raw({"hyperpipe_id": results._id}).order_by(
+            [("_id", ASCENDING)]
+        )
+        return MDBHelper.attach_config_records(
+            results, ((r.outer_fold_index, r.config) for r in records)
+        )
+
+    @staticmethod
+    def read_config_records(filename):
+        """
+        Yields the (outer_fold_index, config) records appended to filename.
+        A record cut off by an interrupted run ends the stream.
+        """
+        with open(filename, "rb") as records_file:
+            while True:
+                try:
+                    record = pickle.load(records_file)
+                except (EOFError, pickle.UnpicklingError):
+                    return
+                yield record["outer_fold_index"], MDBConfig.from_document(
+                    record["config"]
+                )
+
+    @staticmethod
+    def attach_config_records(results, records):
+        """
+        Puts the tested configs back into the outer folds of the result tree.
+        Outer folds that were saved together with their configs are left as they are.
+        """
+        empty_folds = {
+            i
+            for i, outer_fold in enumerate(results.outer_folds)
+            if not outer_fold.tested_config_list
+        }
+        for outer_fold_index, config in records:
+            if outer_fold_index in empty_folds:
+                results.outer_folds[outer_fold_index].tested_config_list.append(config)
+        return results
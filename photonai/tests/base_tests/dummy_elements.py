@@ -120,3 +120,15 @@ class DummyEstimatorNoPredict(BaseEstimator, RegressorMixin):
 
     def fit(self, X, y, **kwargs):
         return self
+
+
+class DummyInPlaceTransformer(BaseEstimator, TransformerMixin):
+    def __init__(self, high=1):
+        self.high = high
+
+    def fit(self, X, y=None, **kwargs):
+        return self
+
+    def transform(self, X, **kwargs):
+        X[X > self.high] = self.high
+        return X
@@ -9,7 +9,7 @@ from sklearn.datasets import load_breast_cancer
 from sklearn.decomposition.pca import PCA
 from sklearn.dummy import DummyRegressor, DummyClassifier
 from sklearn.ensemble import RandomForestClassifier
-from sklearn.model_selection import KFold
+from sklearn.model_selection import KFold, ShuffleSplit
 from sklearn.pipeline import Pipeline as SKLPipeline
 from sklearn.preprocessing import StandardScaler
 
@@ -23,6 +23,7 @@ from photonai.base import (
     Stack,
     Switch,
 )
+from photonai.errors import PhotonaiError
 from photonai.neuro import NeuroBranch
 from photonai.optimization import IntegerRange, Categorical
 from photonai.processing.results_handler import ResultsHandler
@@ -335,6 +336,148 @@ class HyperpipeTests(PhotonBaseTest):
         self.hyperpipe.fit(self.__X, self.__y)
         self.assertTrue(os.path.exists(self.cache_folder_path))
 
+    def test_resume(self):
+        output_settings = OutputSettings(project_folder=self.tmp_folder_path, resume=True)
+        self.setup_hyperpipe(output_settings)
+        self.hyperpipe.cross_validation.outer_cv = ShuffleSplit(n_splits=2, test_size=0.2)
+        interrupted_pipe = self.hyperpipe
+
+        # interrupt the fit after the first outer fold and two configs of the second one
+        save_results = interrupted_pipe._save_results
+        n_saves = list()
+
+        def save_and_interrupt():
+            save_results()
+            n_saves.append(1)
+            if len(n_saves) == 9:
+                raise KeyboardInterrupt()
+
+        interrupted_pipe._save_results = save_and_interrupt
+        with self.assertRaises(KeyboardInterrupt):
+            interrupted_pipe.fit(self.__X, self.__y)
+
+        self.setup_hyperpipe(output_settings)
+        self.hyperpipe.cross_validation.outer_cv = ShuffleSplit(n_splits=2, test_size=0.2)
+        resume_time = datetime.datetime.now()
+        self.hyperpipe.fit(self.__X, self.__y)
+        results = self.hyperpipe.results
+
+        # the shuffled outer folds are the ones of the interrupted run
+        for interrupted_fold, fold in zip(
+            interrupted_pipe.cross_validation.outer_folds.values(),
+            self.hyperpipe.cross_validation.outer_folds.values(),
+        ):
+            np.testing.assert_array_equal(
+                interrupted_fold.test_indices, fold.test_indices
+            )
+
+        # the first outer fold and the first two configs of the second one are taken over
+        self.assertEqual(
+            results.outer_folds[0].best_config.photon_config_id,
+            interrupted_pipe.results.outer_folds[0].best_config.photon_config_id,
+        )
+        self.assertListEqual(
+            [
+                config.computation_end_time < resume_time
+                for config in results.outer_folds[1].tested_config_list
+            ],
+            [True, True, False, False, False, False],
+        )
+        self.assertListEqual(
+            [config.config_nr for config in results.outer_folds[1].tested_config_list],
+            list(range(1, 7)),
+        )
+
+        # the results folder holds the complete analysis
+        handler = ResultsHandler()
+        handler.load_from_file(
+            os.path.join(output_settings.results_folder, "photon_result_file.p")
+        )
+        self.assertListEqual(
+            [len(f.tested_config_list) for f in handler.results.outer_folds], [6, 6]
+        )
+        self.assertTrue(handler.results.computation_completed)
+
+    def _interrupted_random_grid_search(self, output_settings, n_saves_until_interrupt):
+        def random_grid_pipe():
+            self.setup_hyperpipe(output_settings)
+            self.hyperpipe.optimization.optimizer_input_str = "random_grid_search"
+            self.hyperpipe.optimization.optimizer_params = {"n_configurations": 4}
+            self.hyperpipe.cross_validation.outer_cv = ShuffleSplit(
+                n_splits=1, test_size=0.2
+            )
+            return self.hyperpipe
+
+        interrupted_pipe = random_grid_pipe()
+        save_results = interrupted_pipe._save_results
+        n_saves = list()
+
+        def save_and_interrupt():
+            save_results()
+            n_saves.append(1)
+            if len(n_saves) == n_saves_until_interrupt:
+                raise KeyboardInterrupt()
+
+        interrupted_pipe._save_results = save_and_interrupt
+        with self.assertRaises(KeyboardInterrupt):
+            interrupted_pipe.fit(self.__X, self.__y)
+        return interrupted_pipe, random_grid_pipe()
+
+    def test_resume_random_grid_search(self):
+        output_settings = OutputSettings(project_folder=self.tmp_folder_path, resume=True)
+        np.random.seed(1)
+        interrupted_pipe, pipe = self._interrupted_random_grid_search(output_settings, 3)
+        n_finished = len(interrupted_pipe.results.outer_folds[0].tested_config_list)
+        self.assertGreater(n_finished, 0)
+
+        # the resumed run draws other configs, the finished ones are told to the optimizer
+        # and count against n_configurations
+        np.random.seed(2)
+        resume_time = datetime.datetime.now()
+        pipe.fit(self.__X, self.__y)
+        tested_configs = pipe.results.outer_folds[0].tested_config_list
+        self.assertEqual(len(tested_configs), 4)
+        self.assertListEqual(
+            [config.computation_end_time < resume_time for config in tested_configs],
+            [True] * n_finished + [False] * (4 - n_finished),
+        )
+
+    def test_resume_on_other_data_or_pipeline(self):
+        def fit_other_targets(pipe):
+            pipe.fit(self.__X, 1 - self.__y)
+
+        def fit_other_data(pipe):
+            pipe.fit(self.__X + 1, self.__y)
+
+        def fit_other_hyperparameters(pipe):
+            pipe.elements[-1].hyperparameters = {"C": [0.5, 2], "kernel": ["linear"]}
+            pipe.fit(self.__X, self.__y)
+
+        # same number of samples, but something has changed: nothing is taken over
+        for fit_changed in [
+            fit_other_targets,
+            fit_other_data,
+            fit_other_hyperparameters,
+        ]:
+            with self.subTest(fit_changed.__name__):
+                output_settings = OutputSettings(
+                    project_folder=os.path.join(
+                        self.tmp_folder_path, fit_changed.__name__
+                    ),
+                    resume=True,
+                )
+                _, pipe = self._interrupted_random_grid_search(output_settings, 3)
+                resume_time = datetime.datetime.now()
+                fit_changed(pipe)
+                tested_configs = pipe.results.outer_folds[0].tested_config_list
+                self.assertEqual(len(tested_configs), 4)
+                self.assertTrue(
+                    all(
+                        config.computation_end_time > resume_time
+                        for config in tested_configs
+                    )
+                )
+
     def test_random_state(self):
         self.hyperpipe.random_state = 4567
         self.hyperpipe.fit(self.__X, self.__y)
@@ -347,6 +490,101 @@ class HyperpipeTests(PhotonBaseTest):
             self.hyperpipe._pipe.elements[-1][-1].base_element.random_state, 4567
         )
 
+    def test_parallel_outer_folds(self):
+        self.hyperpipe.cross_validation.outer_cv = KFold(n_splits=3)
+        self.hyperpipe.fit(self.__X, self.__y)
+        sequential_results = self.hyperpipe.results
+
+        self.setup_hyperpipe()
+        self.hyperpipe.cross_validation.outer_cv = KFold(n_splits=3)
+        self.hyperpipe.nr_of_processes = 3
+        # the outer fold workers do not start worker pools of their own
+        self.hyperpipe.config_n_jobs = 2
+        self.hyperpipe.inner_fold_n_jobs = 2
+        fit_outer_folds_parallelized = self.hyperpipe._fit_outer_folds_parallelized
+        n_jobs = list()
+
+        def fit_and_record_n_jobs(outer_fold_computers):
+            n_jobs.extend(
+                (c.config_n_jobs, c.inner_fold_n_jobs) for _, c in outer_fold_computers
+            )
+            fit_outer_folds_parallelized(outer_fold_computers)
+
+        self.hyperpipe._fit_outer_folds_parallelized = fit_and_record_n_jobs
+        self.hyperpipe.fit(self.__X, self.__y)
+        parallel_results = self.hyperpipe.results
+        self.assertListEqual(n_jobs, [(1, 1)] * 3)
+
+        # the outer folds computed in the worker processes are merged back in fold order
+        self.assertListEqual(
+            [f.fold_nr for f in parallel_results.outer_folds], [1, 2, 3]
+        )
+        for sequential_fold, parallel_fold in zip(
+            sequential_results.outer_folds, parallel_results.outer_folds
+        ):
+            self.assertEqual(
+                len(sequential_fold.tested_config_list),
+                len(parallel_fold.tested_config_list),
+            )
+            self.assertDictEqual(
+                sequential_fold.best_config.best_config_score.validation.metrics,
+                parallel_fold.best_config.best_config_score.validation.metrics,
+            )
+
+    def test_parallel_outer_folds_clear_cache_on_error(self):
+        self.hyperpipe.cross_validation.outer_cv = KFold(n_splits=2)
+        self.hyperpipe.nr_of_processes = 2
+        self.hyperpipe.cache_folder = self.cache_folder_path
+        cache_file = os.path.join(self.cache_folder_path, "entry.p")
+
+        def fail_in_worker(outer_fold_computers):
+            with open(cache_file, "w") as f:
+                f.write("x")
+            raise RuntimeError("outer fold failed")
+
+        self.hyperpipe._fit_outer_folds_parallelized = fail_in_worker
+        with self.assertRaises(RuntimeError):
+            self.hyperpipe.fit(self.__X, self.__y)
+        self.assertFalse(os.path.isfile(cache_file))
+
+    def test_parallel_configs(self):
+        self.hyperpipe.cross_validation.outer_cv = KFold(n_splits=2)
+        self.hyperpipe.fit(self.__X, self.__y)
+        sequential_results = self.hyperpipe.results
+
+        self.setup_hyperpipe()
+        self.hyperpipe.cross_validation.outer_cv = KFold(n_splits=2)
+        self.hyperpipe.config_n_jobs = 3
+        self.hyperpipe.fit(self.__X, self.__y)
+        parallel_results = self.hyperpipe.results
+
+        # the configs finish in arbitrary order but are stored in the order they were handed out
+        for sequential_fold, parallel_fold in zip(
+            sequential_results.outer_folds, parallel_results.outer_folds
+        ):
+            self.assertListEqual(
+                [c.config_dict for c in sequential_fold.tested_config_list],
+                [c.config_dict for c in parallel_fold.tested_config_list],
+            )
+            self.assertListEqual(
+                [c.config_nr for c in parallel_fold.tested_config_list],
+                list(range(1, len(parallel_fold.tested_config_list) + 1)),
+            )
+            self.assertDictEqual(
+                sequential_fold.best_config.best_config_score.validation.metrics,
+                parallel_fold.best_config.best_config_score.validation.metrics,
+            )
+
+    def test_parallel_backend(self):
+        with self.assertRaises(PhotonaiError):
+            Hyperpipe(
+                "god",
+                inner_cv=self.inner_cv_object,
+                metrics=self.metrics,
+                best_config_metric=self.best_config_metric,
+                parallel_backend="threads",
+            )
+
     def test_dummy_estimator_preparation(self):
 
         self.hyperpipe.results = MDBHyperpipe()
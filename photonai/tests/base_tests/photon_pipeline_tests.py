@@ -1,5 +1,10 @@
 import glob
 import os
+import socket
+import subprocess
+import sys
+import threading
+from concurrent.futures import ProcessPoolExecutor
 
 import numpy as np
 from sklearn.datasets import load_breast_cancer
@@ -20,11 +25,14 @@ from photonai.base import (
     Branch,
     CallbackElement,
 )
-from photonai.base.cache_manager import CacheManager
+from photonai.base.cache_manager import CacheManager, CacheIndex, MemoryCache
 from photonai.base.photon_pipeline import PhotonPipeline
 from photonai.neuro import NeuroBranch
 from photonai.neuro.brain_atlas import AtlasLibrary
-from photonai.test.base_tests.dummy_elements import DummyYAndCovariatesTransformer
+from photonai.test.base_tests.dummy_elements import (
+    DummyYAndCovariatesTransformer,
+    DummyInPlaceTransformer,
+)
 from photonai.test.photon_base_test import PhotonBaseTest
 
 
@@ -288,16 +296,42 @@ class CacheManagerTests(PhotonBaseTest):
         self.cache_man.prepare(
             pipe_elements=self.item_names, X=self.X, config=self.config1
         )
-        relevant_items = {"PCA__n_components": 5}
-        relevant_items_hash = hash(frozenset(relevant_items.items()))
         new_hash = self.cache_man._find_config_for_element("PCA")
-        self.assertEqual(relevant_items_hash, new_hash)
+
+        # the SVC parameters are irrelevant for the PCA output
+        self.cache_man.prepare(
+            pipe_elements=self.item_names,
+            X=self.X,
+            config={"PCA__n_components": 5, "SVC__C": 1},
+        )
+        self.assertEqual(new_hash, self.cache_man._find_config_for_element("PCA"))
+
+        self.cache_man.prepare(
+            pipe_elements=self.item_names, X=self.X, config=self.config2
+        )
+        self.assertNotEqual(new_hash, self.cache_man._find_config_for_element("PCA"))
 
     def test_empty_config(self):
         self.cache_man.prepare(pipe_elements=self.item_names, X=self.X, config={})
-        relevant_items_hash = hash(frozenset({}.items()))
         new_hash = self.cache_man._find_config_for_element("PCA")
-        self.assertEqual(relevant_items_hash, new_hash)
+        self.assertEqual(new_hash, CacheManager.digest(repr([])))
+
+    def test_data_digest(self):
+        # data that only differs after the first row must not share cache entries
+        X1 = np.zeros((10, 3))
+        X2 = np.zeros((10, 3))
+        X2[-1, -1] = 1
+        self.cache_man.prepare(pipe_elements=self.item_names, X=X1, config=self.config1)
+        key_1 = self.cache_man.generate_cache_key("PCA")
+        self.cache_man.prepare(pipe_elements=self.item_names, X=X2, config=self.config1)
+        key_2 = self.cache_man.generate_cache_key("PCA")
+        self.assertNotEqual(key_1, key_2)
+
+        # the digest does not depend on the process' hash seed
+        self.assertEqual(
+            CacheManager.digest(np.arange(3, dtype=np.int64)),
+            "67817ab6d706532f2c317cb6364285d8",
+        )
 
     def test_initial_transformation(self):
         self.cache_man.prepare(pipe_elements=self.item_names, config=self.config1)
@@ -333,6 +367,270 @@ class CacheManagerTests(PhotonBaseTest):
             np.array_equal(self.kwargs["covariates"], kwargs_loaded["covariates"])
         )
 
+    def test_memory_mapped_loading(self):
+        X = np.random.rand(100, 50)
+        images = np.array(["img_1.nii", "img_2.nii"], dtype=object)
+        self.cache_man.prepare(pipe_elements=self.item_names, config=self.config1)
+        self.cache_man.save_data_to_cache("PCA", (X, images, self.kwargs))
+
+        X_loaded, images_loaded, _ = self.cache_man.load_cached_data("PCA")
+        self.assertIsInstance(X_loaded, np.memmap)
+        self.assertTrue(np.array_equal(X, X_loaded))
+        # changes in place do not reach the cache entry
+        X_loaded[:] = 0
+        X_loaded, _, _ = self.cache_man.load_cached_data("PCA")
+        self.assertTrue(np.array_equal(X, X_loaded))
+        # arrays of python objects cannot be mapped and are unpickled as before
+        self.assertNotIsInstance(images_loaded, np.memmap)
+        self.assertTrue(np.array_equal(images, images_loaded))
+
+    def test_failed_save_leaves_no_temporary_file(self):
+        self.cache_man.max_cache_bytes = 10 ** 6
+        self.cache_man.prepare(pipe_elements=self.item_names, config=self.config1)
+        with self.assertRaises(Exception):
+            # a lambda cannot be pickled
+            self.cache_man.save_data_to_cache("PCA", (self.X, self.y, lambda: None))
+        self.assertListEqual(
+            [f for f in os.listdir(self.cache_folder_path) if f.endswith(".tmp")], []
+        )
+        self.assertFalse(self.cache_man.check_cache("PCA"))
+        self.assertEqual(CacheIndex.of(self.cache_folder_path).nbytes, 0)
+
+    def test_memory_cache(self):
+        self.addCleanup(CacheManager.memory_cache.clear, self.cache_folder_path)
+        self.cache_man.max_memory_cache_bytes = 10 ** 6
+        self.cache_man.prepare(pipe_elements=self.item_names, config=self.config1)
+        X = self.X.copy()
+        self.cache_man.save_data_to_cache("PCA", (X, self.y, self.kwargs))
+        # the producer changing its output afterwards does not change the entry
+        X[:] = 0
+
+        # the cache folder is not read again
+        for cache_file in glob.glob(os.path.join(self.cache_folder_path, "*.p")):
+            os.remove(cache_file)
+        self.assertTrue(self.cache_man.check_cache("PCA"))
+        X_loaded, y_loaded, kwargs_loaded = self.cache_man.load_cached_data("PCA")
+        self.assertTrue(np.array_equal(self.X, X_loaded))
+        self.assertEqual(self.cache_man.statistics["memory_hits"], 1)
+        # a consumer changing its copy in place does not change the entry either
+        X_loaded[:] = 0
+        X_loaded, _, _ = self.cache_man.load_cached_data("PCA")
+        self.assertTrue(np.array_equal(self.X, X_loaded))
+
+    def test_memory_cache_size(self):
+        self.addCleanup(CacheManager.memory_cache.clear, self.cache_folder_path)
+        # room for the data of two configurations
+        self.cache_man.max_memory_cache_bytes = int(
+            2.5 * MemoryCache.estimate_nbytes((self.X, self.y, self.kwargs))
+        )
+        keys = list()
+        for config in [self.config1, self.config2, {"PCA__n_components": 1}]:
+            self.cache_man.prepare(pipe_elements=self.item_names, config=config)
+            self.cache_man.save_data_to_cache("PCA", (self.X, self.y, self.kwargs))
+            keys.append(
+                (self.cache_folder_path, self.cache_man.generate_cache_key("PCA"))
+            )
+        self.assertNotIn(keys[0], CacheManager.memory_cache)
+        self.assertIn(keys[1], CacheManager.memory_cache)
+        self.assertIn(keys[2], CacheManager.memory_cache)
+
+    def test_memory_cache_last_only(self):
+        self.addCleanup(CacheManager.memory_cache.clear, self.cache_folder_path)
+        self.cache_man.max_memory_cache_bytes = 10 ** 6
+        self.cache_man.memory_cache_last_only = True
+        self.cache_man.prepare(pipe_elements=self.item_names, config=self.config1)
+        keys = list()
+        for item in ["StandardScaler", "PCA"]:
+            self.cache_man.save_data_to_cache(item, (self.X, self.y, self.kwargs))
+            keys.append(
+                (self.cache_folder_path, self.cache_man.generate_cache_key(item))
+            )
+        self.assertNotIn(keys[0], CacheManager.memory_cache)
+        self.assertIn(keys[1], CacheManager.memory_cache)
+
+    def test_cache_index(self):
+        self.cache_man.prepare(pipe_elements=self.item_names, config=self.config1)
+        self.cache_man.save_data_to_cache("PCA", (self.X, self.y, self.kwargs))
+
+        # another process reading the log
+        other_index = CacheIndex(self.cache_folder_path)
+        other_index.refresh()
+        self.assertEqual(other_index.files, self.cache_man.cache_index)
+        other_index.remove(self.cache_man.generate_cache_key("PCA"))
+        self.cache_man.prepare(pipe_elements=self.item_names, config=self.config1)
+        self.assertFalse(self.cache_man.check_cache("PCA"))
+
+        # cache folder cleared by another process
+        self.cache_man.prepare(pipe_elements=self.item_names, config=self.config2)
+        self.cache_man.save_data_to_cache("PCA", (self.X, self.y, self.kwargs))
+        CacheManager.clear_cache_files(self.cache_folder_path)
+        other_index.refresh()
+        self.assertEqual(len(other_index.files), 0)
+        self.cache_man.prepare(pipe_elements=self.item_names, config=self.config2)
+        self.assertFalse(self.cache_man.check_cache("PCA"))
+
+    @staticmethod
+    def _add_to_index(cache_folder, worker_nr):
+        index = CacheIndex(cache_folder)
+        for i in range(200):
+            index.add(str(worker_nr) + "_" + str(i), i)
+
+    def test_cache_index_concurrent_writers(self):
+        with ProcessPoolExecutor(4) as executor:
+            list(
+                executor.map(
+                    CacheManagerTests._add_to_index,
+                    [self.cache_folder_path] * 4,
+                    range(4),
+                )
+            )
+        index = CacheIndex(self.cache_folder_path)
+        index.refresh()
+        self.assertEqual(len(index.files), 800)
+        self.assertEqual(index.nbytes, 4 * sum(range(200)))
+
+    def _fill_cache(self, configs, compute_durations):
+        for config, compute_duration in zip(configs, compute_durations):
+            self.cache_man.prepare(pipe_elements=self.item_names, config=config)
+            self.cache_man.save_data_to_cache(
+                "PCA", (self.X, self.y, self.kwargs), compute_duration
+            )
+        return [
+            os.path.join(self.cache_folder_path, self._cache_key(c) + ".p")
+            for c in configs
+        ]
+
+    def _cache_key(self, config):
+        self.cache_man.prepare(pipe_elements=self.item_names, config=config)
+        return self.cache_man.generate_cache_key("PCA")
+
+    def test_lru_eviction(self):
+        configs = [{"PCA__n_components": i} for i in range(3)]
+        self.cache_man.max_cache_bytes = 10 ** 9
+        files = self._fill_cache(configs[:2], [100, 100])
+        entry_size = os.path.getsize(files[0])
+        self.cache_man.max_cache_bytes = int(2.5 * entry_size)
+
+        # the first entry is used again, so the second one is the least recently used
+        self.cache_man.prepare(pipe_elements=self.item_names, config=configs[0])
+        self.assertIsNotNone(self.cache_man.load_cached_data("PCA"))
+        # the access order is shared with other processes through the index
+        other_index = CacheIndex(self.cache_folder_path)
+        other_index.refresh()
+        self.assertListEqual(
+            [entry[0] for entry in other_index.entries_by_access()],
+            [self._cache_key(configs[1]), self._cache_key(configs[0])],
+        )
+
+        files += self._fill_cache(configs[2:], [100])
+        self.assertTrue(os.path.isfile(files[0]))
+        self.assertFalse(os.path.isfile(files[1]))
+        self.assertTrue(os.path.isfile(files[2]))
+        self.assertEqual(self.cache_man.statistics["hits"], 1)
+        self.assertEqual(self.cache_man.statistics["misses"], 3)
+        self.assertEqual(self.cache_man.statistics["evictions"], 1)
+        self.assertEqual(self.cache_man.statistics["evicted_bytes"], entry_size)
+
+    def test_evict_cheap_entries_first(self):
+        configs = [{"PCA__n_components": i} for i in range(3)]
+        self.cache_man.max_cache_bytes = 10 ** 9
+        # the second entry is recomputed faster than it is written to disk
+        files = self._fill_cache(configs[:2], [100, 0])
+        self.cache_man.max_cache_bytes = int(2.5 * os.path.getsize(files[0]))
+
+        files += self._fill_cache(configs[2:], [100])
+        self.assertTrue(os.path.isfile(files[0]))
+        self.assertFalse(os.path.isfile(files[1]))
+        self.assertTrue(os.path.isfile(files[2]))
+
+    def test_evict_fold_data_together(self):
+        self.cache_man.max_cache_bytes = 10 ** 9
+        # training and test data of the same fold and configuration
+        for X in [self.X, self.X + 1]:
+            self.cache_man.prepare(
+                pipe_elements=self.item_names, X=X, config=self.config1
+            )
+            self.cache_man.save_data_to_cache("PCA", (X, self.y, self.kwargs), 100)
+        self.cache_man.prepare(pipe_elements=self.item_names, config=self.config2)
+        self.cache_man.max_cache_bytes = 1
+        self.cache_man.save_data_to_cache("PCA", (self.X, self.y, self.kwargs), 100)
+
+        self.assertEqual(self.cache_man.statistics["evictions"], 2)
+        self.assertEqual(
+            len(glob.glob(os.path.join(self.cache_folder_path, "*.p"))), 1
+        )
+
+    def test_pinned_entries_are_not_evicted(self):
+        configs = [{"PCA__n_components": i} for i in range(2)]
+        self.cache_man.max_cache_bytes = 10 ** 9
+        files = self._fill_cache(configs[:1], [100])
+        self.cache_man.max_cache_bytes = 1
+
+        # found in the cache, so it will be loaded soon
+        self.assertTrue(self.cache_man.check_cache("PCA"))
+        self.cache_man.state.config = configs[1]
+        self.cache_man.save_data_to_cache("PCA", (self.X, self.y, self.kwargs), 100)
+        self.assertTrue(os.path.isfile(files[0]))
+        self.assertEqual(self.cache_man.statistics["evictions"], 0)
+
+    def _other_cache_man(self):
+        # a cache manager of another worker computing the same configuration
+        other_cache_man = CacheManager("123353423434", self.cache_folder_path)
+        other_cache_man.prepare(pipe_elements=self.item_names, config=self.config1)
+        return other_cache_man
+
+    def test_single_flight(self):
+        self.cache_man.prepare(pipe_elements=self.item_names, config=self.config1)
+        self.assertIsNone(self.cache_man.acquire("PCA"))
+
+        other_cache_man = self._other_cache_man()
+        self.assertFalse(other_cache_man.try_claim("PCA"))
+        saving = threading.Timer(
+            0.2,
+            self.cache_man.save_data_to_cache,
+            args=("PCA", (self.X, self.y, self.kwargs)),
+        )
+        saving.start()
+        X_loaded, _, _ = other_cache_man.acquire("PCA")
+        saving.join()
+        self.assertTrue(np.array_equal(self.X, X_loaded))
+        self.assertEqual(other_cache_man.statistics["waits"], 1)
+        self.assertEqual(other_cache_man.statistics["misses"], 0)
+        self.assertEqual(
+            glob.glob(os.path.join(self.cache_folder_path, "*.inflight")), []
+        )
+
+    def test_failed_computation_is_taken_over(self):
+        self.cache_man.prepare(pipe_elements=self.item_names, config=self.config1)
+        self.assertIsNone(self.cache_man.acquire("PCA"))
+        other_cache_man = self._other_cache_man()
+        threading.Timer(0.2, self.cache_man.release, args=("PCA",)).start()
+        self.assertIsNone(other_cache_man.acquire("PCA"))
+        self.assertFalse(self.cache_man.try_claim("PCA"))
+
+    def test_abandoned_in_flight_marker(self):
+        self.cache_man.prepare(pipe_elements=self.item_names, config=self.config1)
+        marker = os.path.join(
+            self.cache_folder_path,
+            self.cache_man.generate_cache_key("PCA") + ".inflight",
+        )
+        dead_process = subprocess.Popen([sys.executable, "-c", "pass"])
+        dead_process.wait()
+        for owner, age in [
+            (socket.gethostname() + " " + str(dead_process.pid), 0),
+            ("other_host 1", CacheManager.IN_FLIGHT_TIMEOUT + 1),
+        ]:
+            with open(marker, "w") as f:
+                f.write(owner)
+            os.utime(marker, (0, os.path.getmtime(marker) - age))
+            self.assertTrue(self.cache_man.try_claim("PCA"))
+            self.cache_man.release()
+
+        # the owner on another host might still be computing
+        with open(marker, "w") as f:
+            f.write("other_host 1")
+        self.assertFalse(self.cache_man.try_claim("PCA"))
+
     def test_clearing_folder(self):
         self.cache_man.clear_cache()
         self.assertTrue(
@@ -398,6 +696,86 @@ class CachedPhotonPipelineTests(PhotonBaseTest):
         self.assertTrue(np.array_equal(y_uc, y_2))
         self.assertTrue(np.array_equal(kwargs_uc, kwargs_2))
 
+    def test_evicted_test_data(self):
+        def new_pipe():
+            pipe = PhotonPipeline(
+                [
+                    ("StandardScaler", PipelineElement("StandardScaler", {})),
+                    ("PCA", PipelineElement("PCA", random_state=3)),
+                    ("SVC", PipelineElement("SVC", random_state=3)),
+                ]
+            )
+            pipe.max_cache_bytes = 10 ** 9
+            pipe.fold_id = "12345643463434"
+            pipe.cache_folder = self.cache_folder_path
+            pipe.set_params(**self.config1)
+            return pipe
+
+        X_train, X_test, y_train = self.X[:400], self.X[400:], self.y[:400]
+        new_pipe().fit(X_train, y_train)
+
+        # the training data is loaded from the cache, so the transformers are not fitted
+        pipe = new_pipe()
+        pipe.fit(X_train, y_train)
+        self.assertEqual(pipe.cache_statistics["hits"], 1)
+        self.assertEqual(pipe._unfitted_elements, {"StandardScaler", "PCA"})
+
+        # nothing has been cached for the test data, so the pipeline is fitted again
+        y_pred = pipe.predict(X_test)
+        self.assertEqual(pipe._unfitted_elements, set())
+
+        pipe = new_pipe()
+        pipe.caching = False
+        pipe.fit(X_train, y_train)
+        self.assertTrue(np.array_equal(y_pred, pipe.predict(X_test)))
+
+    def test_in_place_element_behind_cached_step(self):
+        def new_pipe(high, cache_folder, max_memory_cache_bytes):
+            pipe = PhotonPipeline(
+                [
+                    ("StandardScaler", PipelineElement("StandardScaler", {})),
+                    (
+                        "InPlace",
+                        PipelineElement.create(
+                            "InPlace", DummyInPlaceTransformer(), {}
+                        ),
+                    ),
+                    ("SVC", PipelineElement("SVC", random_state=3)),
+                ]
+            )
+            pipe.caching = True
+            pipe.fold_id = "12345643463434"
+            pipe.max_memory_cache_bytes = max_memory_cache_bytes
+            pipe.cache_folder = cache_folder
+            pipe.set_params(InPlace__high=high)
+            return pipe
+
+        X_scaled = StandardScaler().fit_transform(self.X)
+        # the element changes the scaler output from the memory-mapped cache folder or
+        # from the memory cache in place
+        for max_memory_cache_bytes in [None, 10 ** 7]:
+            with self.subTest(max_memory_cache_bytes=max_memory_cache_bytes):
+                cache_folder = os.path.join(
+                    self.cache_folder_path, str(max_memory_cache_bytes)
+                )
+                self.addCleanup(CacheManager.memory_cache.clear, cache_folder)
+                new_pipe(1, cache_folder, max_memory_cache_bytes).fit(self.X, self.y)
+
+                pipe = new_pipe(2, cache_folder, max_memory_cache_bytes)
+                pipe.fit(self.X, self.y)
+                self.assertGreater(pipe.cache_statistics["hits"], 0)
+                self.assertEqual(
+                    pipe.cache_statistics["memory_hits"] > 0,
+                    max_memory_cache_bytes is not None,
+                )
+                X_new, _, _ = pipe.transform(self.X)
+                self.assertTrue(np.allclose(X_new, np.minimum(X_scaled, 2)))
+
+                pipe = new_pipe(2, cache_folder, max_memory_cache_bytes)
+                pipe.caching = False
+                pipe.fit(self.X, self.y)
+                self.assertTrue(np.array_equal(X_new, pipe.transform(self.X)[0]))
+
     def test_empty_hyperparameters(self):
         # test if one can use it when only default parameters are given and hyperparameter space is empty
         self.pipe.set_params(**{})
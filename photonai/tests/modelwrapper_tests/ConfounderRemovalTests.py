@@ -7,6 +7,7 @@ from sklearn.model_selection import KFold, ShuffleSplit
 from sklearn.preprocessing import StandardScaler
 
 from photonai.base import Hyperpipe, PipelineElement, OutputSettings
+from photonai.modelwrapper.ConfounderRemoval import ConfounderRemoval
 from photonai.test.photon_base_test import PhotonBaseTest
 
 
@@ -138,6 +139,28 @@ class ConfounderRemovalTests(PhotonBaseTest):
             X_transformed[0], self.X_transformed_standardized
         )
 
+    def test_feature_chunks(self):
+        cr = ConfounderRemoval()
+        cr.FEATURE_CHUNK_SIZE = 7
+        cr.fit(self.X, self.y, **{"confounder": self.multiple_confounders})
+        X_transformed = cr.transform(
+            self.X, **{"confounder": self.multiple_confounders}
+        )
+        np.testing.assert_array_almost_equal(
+            X_transformed[0], self.X_transformed_standardized
+        )
+
+    def test_float32(self):
+        cr = ConfounderRemoval()
+        X = self.X.astype(np.float32)
+        cr.fit(X, self.y, **{"confounder": self.multiple_confounders})
+        X_transformed = cr.transform(X, **{"confounder": self.multiple_confounders})
+        self.assertEqual(cr.olsModel_params.dtype, np.float32)
+        self.assertEqual(X_transformed[0].dtype, np.float32)
+        np.testing.assert_allclose(
+            X_transformed[0], self.X_transformed_standardized, rtol=1e-3, atol=1e-3
+        )
+
     def test_use(self):
         self.pipe.fit(self.X, self.y, **{"confounder": self.random_confounders})
         trans_data = self.pipe.transform(
@@ -0,0 +1,81 @@
+import unittest
+
+import numpy as np
+from scipy.spatial.distance import pdist
+from sklearn.preprocessing import StandardScaler
+
+from photonai.modelwrapper.SamplePairing import (
+    SamplePairingBase,
+    SamplePairingRegression,
+    SamplePairingClassification,
+)
+
+
+class SamplePairingTests(unittest.TestCase):
+    def setUp(self):
+        random_state = np.random.RandomState(42)
+        self.X = random_state.randn(200, 5)
+        self.y = random_state.randn(200)
+        self.covariate = np.arange(200, dtype=float)
+
+    def test_triu_pairs(self):
+        for n in [2, 3, 10, 57]:
+            all_pairs = SamplePairingBase._triu_pairs(np.arange(n * (n - 1) // 2), n)
+            np.testing.assert_array_equal(
+                all_pairs, np.stack(np.triu_indices(n, k=1), axis=1)
+            )
+
+    def test_random_pairs(self):
+        pairs = SamplePairingBase.random_pair_generator(range(200), 45, 5000)
+        self.assertEqual(pairs.shape, (5000, 2))
+        self.assertTrue(np.all(pairs[:, 0] < pairs[:, 1]))
+        self.assertEqual(len(set(map(tuple, pairs))), 5000)
+        # same seed, same pairs
+        np.testing.assert_array_equal(
+            pairs, SamplePairingBase.random_pair_generator(range(200), 45, 5000)
+        )
+        # no more pairs than there are combinations
+        pairs = SamplePairingBase.random_pair_generator(range(5), 45, 100)
+        self.assertEqual(len(set(map(tuple, pairs))), 10)
+
+    def test_nearest_pairs(self):
+        distances = pdist(StandardScaler().fit_transform(self.X), "euclidean")
+        expected = np.stack(np.triu_indices(200, k=1), axis=1)[
+            np.argsort(distances, kind="stable")[:300]
+        ]
+        SamplePairingBase.DISTANCE_BLOCK_SIZE = 1000
+        try:
+            pairs = SamplePairingBase.nearest_pair_generator(self.X, "euclidean", 300)
+        finally:
+            SamplePairingBase.DISTANCE_BLOCK_SIZE = 1000000
+        np.testing.assert_array_equal(pairs, expected)
+
+    def test_regression(self):
+        X_new, y_new, kwargs_new = SamplePairingRegression(draw_limit=1000).transform(
+            self.X, self.y, covariate=self.covariate
+        )
+        pairs = SamplePairingBase.random_pair_generator(range(200), 45, 1000)
+        self.assertEqual(X_new.shape, (1200, 5))
+        np.testing.assert_array_equal(X_new[:200], self.X)
+        np.testing.assert_array_almost_equal(
+            X_new[200:], np.mean([self.X[pairs[:, 0]], self.X[pairs[:, 1]]], axis=0)
+        )
+        np.testing.assert_array_almost_equal(
+            y_new[200:], np.mean([self.y[pairs[:, 0]], self.y[pairs[:, 1]]], axis=0)
+        )
+        np.testing.assert_array_almost_equal(
+            kwargs_new["covariate"][200:], np.mean(pairs, axis=1)
+        )
+
+    def test_balance_classes(self):
+        y = (self.y > 0).astype(int)
+        X_new, y_new, kwargs_new = SamplePairingClassification(
+            draw_limit=500
+        ).transform(self.X, y, covariate=self.covariate)
+        self.assertListEqual(np.bincount(y_new.astype(int)).tolist(), [500, 500])
+        self.assertEqual(X_new.shape, (1000, 5))
+        self.assertEqual(len(kwargs_new["covariate"]), 1000)
+
+
+if __name__ == "__main__":
+    unittest.main()
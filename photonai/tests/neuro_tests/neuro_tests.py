@@ -1,5 +1,7 @@
 import glob
 import os
+import time
+from unittest.mock import patch
 
 import numpy as np
 from nibabel.nifti1 import Nifti1Image
@@ -9,8 +11,11 @@ from sklearn.model_selection import ShuffleSplit
 
 from photonai.base import OutputSettings, Hyperpipe, PipelineElement
 from photonai.base.photon_pipeline import CacheManager
+from photonai.helper.helper import PhotonWorkerPool
 from photonai.neuro import NeuroBranch
+from photonai.neuro.atlas_mapping import AtlasMapper
 from photonai.neuro.brain_atlas import BrainMask, AtlasLibrary, BrainAtlas
+from photonai.neuro.nifti_loader import NiftiLoader
 from photonai.processing import ResultsHandler
 from photonai.test.photon_base_test import PhotonBaseTest
 
@@ -162,6 +167,49 @@ class NeuroTest(PhotonBaseTest):
         ).get_data()
         self.assertTrue(np.array_equal(man_map, brain_atlas.map))
 
+    def test_atlas_library_disk_cache(self):
+        affine, shape = BrainMask.get_format_info_from_first_image(self.X)
+        library = AtlasLibrary()
+        library.CACHE_FOLDER = os.path.join(self.tmp_folder_path, "atlas_cache")
+        try:
+            library.library = dict()
+            atlas_obj = library.get_atlas(self.atlas_name, affine, shape)
+            mask_obj = library.get_mask("MNI_ICBM152_WholeBrain", affine, shape)
+            self.assertEqual(len(os.listdir(library.CACHE_FOLDER)), 2)
+
+            # a fresh library, e.g. in another process, loads both from the cache folder
+            library.library = dict()
+            cached_atlas = library.get_atlas(self.atlas_name, affine, shape)
+            cached_mask = library.get_mask("MNI_ICBM152_WholeBrain", affine, shape)
+            self.assertEqual(len(os.listdir(library.CACHE_FOLDER)), 2)
+            self.assertTrue(np.array_equal(atlas_obj.map, cached_atlas.map))
+            self.assertListEqual(
+                [(roi.index, roi.label, roi.size) for roi in atlas_obj.roi_list],
+                [(roi.index, roi.label, roi.size) for roi in cached_atlas.roi_list],
+            )
+            self.assertTrue(
+                np.array_equal(mask_obj.mask.get_data(), cached_mask.mask.get_data())
+            )
+        finally:
+            library.library = dict()
+            del library.CACHE_FOLDER
+
+    def test_lazy_roi_masks(self):
+        affine, shape = BrainMask.get_format_info_from_first_image(self.X)
+        atlas_obj = AtlasLibrary().get_atlas(self.atlas_name, affine, shape)
+        roi_objects = BrainAtlas._get_rois(atlas_obj, which_rois=self.roi_list)
+
+        for roi in roi_objects:
+            self.assertEqual(roi.size, np.sum(atlas_obj.map == roi.index))
+            self.assertTrue(
+                np.array_equal(roi.mask.get_data(), atlas_obj.map == roi.index)
+            )
+        # only the requested masks have been created
+        self.assertEqual(
+            len([roi for roi in atlas_obj.roi_list if roi._mask is not None]),
+            len(roi_objects),
+        )
+
     def test_brain_masker(self):
 
         affine, shape = BrainMask.get_format_info_from_first_image(self.X)
@@ -185,6 +233,27 @@ class NeuroTest(PhotonBaseTest):
 
             self.assertTrue(np.array_equal(own_calculation, nilearn_calculation))
 
+    def test_brain_masker_mean_and_box(self):
+        affine, shape = BrainMask.get_format_info_from_first_image(self.X)
+        atlas_obj = AtlasLibrary().get_atlas(self.atlas_name, affine, shape)
+        roi = BrainAtlas._get_rois(atlas_obj, which_rois=self.roi_list)[0]
+
+        vec = BrainMask(mask_image=roi, extract_mode="vec").transform(self.X)
+        mean = BrainMask(mask_image=roi, extract_mode="mean").transform(self.X)
+        self.assertTrue(np.allclose(mean, np.mean(vec, axis=1)))
+
+        box = BrainMask(mask_image=roi, extract_mode="box").transform(self.X)
+        corners = np.argwhere(roi.mask.get_data())
+        c1, c2 = corners.min(axis=0), corners.max(axis=0) + 1
+        self.assertEqual(len(box), len(self.X))
+        for img_box, filename in zip(box, self.X):
+            data = image.load_img(filename).get_data()
+            self.assertTrue(
+                np.array_equal(
+                    img_box, data[c1[0] : c2[0], c1[1] : c2[1], c1[2] : c2[2]]
+                )
+            )
+
     def test_brain_atlas(self):
 
         brain_atlas = BrainAtlas(self.atlas_name, "vec", rois=self.roi_list)
@@ -196,6 +265,82 @@ class NeuroTest(PhotonBaseTest):
         # Todo: how to compare?
         debug = True
 
+    def test_brain_atlas_label_map_extraction(self):
+        affine, shape = BrainMask.get_format_info_from_first_image(self.X)
+        atlas_obj = AtlasLibrary().get_atlas(self.atlas_name, affine, shape)
+        roi_objects = BrainAtlas._get_rois(atlas_obj, which_rois="all")
+        series = image.load_img(self.X).get_data().astype("float32")
+
+        brain_atlas = BrainAtlas(self.atlas_name, "vec", rois="all")
+        masked = [brain_atlas.apply_mask(series, roi.mask) for roi in roi_objects]
+
+        concat_data = brain_atlas.transform(self.X)
+        self.assertTrue(np.array_equal(concat_data, np.concatenate(masked, axis=1)))
+        for i, roi_data in enumerate(masked):
+            self.assertEqual(np.sum(brain_atlas.mask_indices == i), roi_data.shape[1])
+
+        brain_atlas.collection_mode = "list"
+        list_data = brain_atlas.transform(self.X)
+        self.assertEqual(len(list_data), len(self.X))
+        for sub_i, subject_data in enumerate(list_data):
+            for roi_i, roi_data in enumerate(subject_data):
+                self.assertTrue(np.array_equal(roi_data, masked[roi_i][sub_i]))
+
+    def test_chunked_loading(self):
+        brain_atlas = BrainAtlas(self.atlas_name, "vec", rois=self.roi_list)
+        brain_mask = BrainMask(mask_image="MNI_ICBM152_WholeBrain")
+        atlas_data = brain_atlas.transform(self.X)
+        mask_data = brain_mask.transform(self.X)
+
+        BrainAtlas.LOAD_CHUNK_SIZE = 2
+        BrainMask.LOAD_CHUNK_SIZE = 2
+        try:
+            self.assertTrue(np.array_equal(brain_atlas.transform(self.X), atlas_data))
+            self.assertTrue(
+                np.array_equal(
+                    BrainMask(mask_image="MNI_ICBM152_WholeBrain").transform(self.X),
+                    mask_data,
+                )
+            )
+        finally:
+            BrainAtlas.LOAD_CHUNK_SIZE = 50
+            BrainMask.LOAD_CHUNK_SIZE = 50
+
+    def test_nifti_loader(self):
+        for nr_of_threads in [1, 3]:
+            loaded = NiftiLoader(nr_of_threads).load_images(self.X)
+            self.assertEqual(len(loaded), len(self.X))
+            for img, filename in zip(loaded, self.X):
+                self.assertTrue(
+                    np.array_equal(img.get_data(), image.load_img(filename).get_data())
+                )
+        self.assertIsInstance(NiftiLoader().load_images(self.X[0]), Nifti1Image)
+
+    def test_nifti_loader_threads_in_workers(self):
+        self.assertEqual(NiftiLoader().nr_of_threads, os.cpu_count() or 1)
+        # the worker processes already keep every core busy
+        with PhotonWorkerPool(2) as pool:
+            future = pool.submit(NiftiLoader.default_nr_of_threads)
+            self.assertEqual(future.result(), 1)
+
+    def test_nifti_loader_cache(self):
+        cache_folder = os.path.join(self.tmp_folder_path, "decoded_images")
+        decoded = NiftiLoader(cache_folder=cache_folder).load_images(self.X)
+        self.assertEqual(len(os.listdir(cache_folder)), len(set(self.X)))
+
+        cached = NiftiLoader(cache_folder=cache_folder).load_images(self.X)
+        self.assertEqual(len(os.listdir(cache_folder)), len(set(self.X)))
+        for img, cached_img, filename in zip(decoded, cached, self.X):
+            original = image.load_img(filename)
+            self.assertEqual(cached_img.get_data().dtype, np.float32)
+            self.assertTrue(np.allclose(cached_img.affine, original.affine))
+            self.assertTrue(
+                np.array_equal(
+                    cached_img.get_data(), original.get_data().astype(np.float32)
+                )
+            )
+            self.assertTrue(np.array_equal(img.get_data(), cached_img.get_data()))
+
     def test_resampling_and_smoothing(self):
 
         testsuite = [
@@ -335,7 +480,79 @@ class NeuroTest(PhotonBaseTest):
             atlas.transform(self.X)
 
     def test_atlas_mapper(self):
-        pass
+        settings = OutputSettings(project_folder=self.tmp_folder_path, resume=True)
+        pipe = Hyperpipe(
+            "Limbic_System",
+            optimizer="grid_search",
+            metrics=["mean_absolute_error"],
+            best_config_metric="mean_absolute_error",
+            outer_cv=ShuffleSplit(n_splits=2, test_size=0.2),
+            inner_cv=ShuffleSplit(n_splits=1, test_size=0.2),
+            verbosity=0,
+            output_settings=settings,
+            config_n_jobs=2,
+            inner_fold_n_jobs=2,
+        )
+        pipe += PipelineElement("LinearSVR")
+        atlas = PipelineElement(
+            "BrainAtlas", rois=self.roi_list, atlas_name="AAL", extract_mode="vec"
+        )
+
+        def map_atlas(y=self.y):
+            atlas_mapper = AtlasMapper(nr_of_processes=2)
+            atlas_mapper.generate_mappings(pipe, atlas, self.tmp_folder_path)
+            atlas_mapper.fit(self.X, y)
+            return atlas_mapper
+
+        # the roi workers do not start worker pools of their own
+        submit = PhotonWorkerPool.submit
+        n_jobs = list()
+
+        def submit_and_record_n_jobs(worker_pool, fnc, hyperpipe, *args):
+            n_jobs.append(
+                (
+                    hyperpipe.nr_of_processes,
+                    hyperpipe.config_n_jobs,
+                    hyperpipe.inner_fold_n_jobs,
+                )
+            )
+            return submit(worker_pool, fnc, hyperpipe, *args)
+
+        with patch.object(PhotonWorkerPool, "submit", submit_and_record_n_jobs):
+            atlas_mapper = map_atlas()
+        self.assertListEqual(n_jobs, [(1, 1, 1)] * len(self.roi_list))
+        self.assertCountEqual(atlas_mapper.hyperpipe_infos.keys(), self.roi_list)
+        roi_files = sorted(
+            glob.glob(
+                os.path.join(self.tmp_folder_path, "*", AtlasMapper.ROI_RESULT_FILE)
+            )
+        )
+        self.assertEqual(len(roi_files), len(self.roi_list))
+
+        # an interrupted mapping only fits the unfinished rois again
+        os.remove(roi_files[0])
+        finished = {f: os.path.getmtime(f) for f in roi_files[1:]}
+        atlas_mapper = map_atlas()
+        self.assertTrue(os.path.isfile(roi_files[0]))
+        for f, mtime in finished.items():
+            self.assertEqual(os.path.getmtime(f), mtime)
+        predictions = atlas_mapper.predict(self.X)
+        self.assertCountEqual(predictions.keys(), self.roi_list)
+
+        loaded_mapper = AtlasMapper()
+        loaded_mapper.load_from_folder(self.tmp_folder_path, "Limbic_System")
+        loaded_predictions = loaded_mapper.predict(self.X)
+        for roi_name in self.roi_list:
+            self.assertTrue(
+                np.array_equal(predictions[roi_name], loaded_predictions[roi_name])
+            )
+
+        # rois that were fitted on other targets are fitted again
+        finished = {f: os.path.getmtime(f) for f in roi_files}
+        time.sleep(0.01)
+        map_atlas(y=self.y[::-1])
+        for f, mtime in finished.items():
+            self.assertNotEqual(os.path.getmtime(f), mtime)
 
     def test_inverse_transform(self):
         settings = OutputSettings(
@@ -13,6 +13,7 @@ from photonai.optimization import IntegerRange, FloatRange
 from photonai.optimization.config_grid import (
     create_global_config_dict,
     create_global_config_grid,
+    order_config_grid,
 )
 from photonai.test.photon_base_test import PhotonBaseTest
 
@@ -187,6 +188,21 @@ class CreateGlobalConfigBaseElements(unittest.TestCase):
             ],
         )
 
+    def test_order_config_grid(self):
+        """
+        Test that configurations sharing the hyperparameters of the first elements are adjacent.
+        """
+        config_grid = create_global_config_grid(self.pipeline_elements)
+        self.assertListEqual(
+            order_config_grid(config_grid, self.pipeline_elements), config_grid
+        )
+
+        shuffled_grid = [config_grid[i] for i in [15, 0, 6, 9, 3, 12, 1, 10]]
+        self.assertListEqual(
+            order_config_grid(shuffled_grid, self.pipeline_elements),
+            [config_grid[i] for i in [15, 12, 9, 10, 0, 3, 1, 6]],
+        )
+
 
 class CreateGlobalConfigAdvancedElements(PhotonBaseTest):
     def setUp(self):
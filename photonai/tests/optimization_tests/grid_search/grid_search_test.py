@@ -68,6 +68,29 @@ class GridSearchOptimizerTest(unittest.TestCase):
         self.assertIn("PCA__n_components", generated_elements)
         return generated_elements
 
+    def test_ask_batch(self):
+        """
+        Test that several configurations are handed out at once and that all of them are handed out.
+        """
+        self.optimizer.prepare(
+            pipeline_elements=self.pipeline_elements, maximize_metric=True
+        )
+        nr_of_configs = len(list(self.optimizer.ask))
+        self.optimizer.prepare(
+            pipeline_elements=self.pipeline_elements, maximize_metric=True
+        )
+        batches = list()
+        batch = self.optimizer.ask_batch(3)
+        while batch:
+            self.assertLessEqual(len(batch), 3)
+            batches.append(batch)
+            for config in batch:
+                self.assertIsInstance(config, dict)
+                self.optimizer.tell(config, (0.5, 0.5))
+            batch = self.optimizer.ask_batch(3)
+        self.assertEqual(len(batches[0]), min(3, nr_of_configs))
+        self.assertEqual(sum([len(b) for b in batches]), nr_of_configs)
+
     def test_ask_advanced(self):
         """
         Test advanced functionality of .ask()
@@ -129,6 +152,22 @@ class RandomGridSearchOptimizerTest(GridSearchOptimizerTest):
         )
         self.assertEqual(len(self.optimizer.param_grid), 16)
 
+    def test_order_for_caching(self):
+        """
+        Test that the drawn configurations sharing the PCA hyperparameters are adjacent.
+        """
+        self.optimizer.prepare(
+            pipeline_elements=[
+                PipelineElement("PCA", {"n_components": [1, 2, 3, 4]}),
+                PipelineElement("SVC", {"C": [0.1, 1, 10]}),
+            ],
+            maximize_metric=True,
+        )
+        pca_values = [config["PCA__n_components"] for config in self.optimizer.ask]
+        changes = [a != b for a, b in zip(pca_values[:-1], pca_values[1:])]
+        self.assertEqual(len(pca_values), 12)
+        self.assertEqual(sum(changes), 3)
+
 
 class TimeBoxedRandomGridSearchOptimizerTest(RandomGridSearchOptimizerTest):
     def setUp(self):
@@ -145,3 +184,9 @@ class TimeBoxedRandomGridSearchOptimizerTest(RandomGridSearchOptimizerTest):
             PipelineElement("SVC"),
         ]
         self.optimizer = TimeBoxedRandomGridSearchOptimizer()
+
+    def test_order_for_caching(self):
+        """
+        Test that the configurations tested until the time limit remain a random sample.
+        """
+        self.assertFalse(self.optimizer.order_for_caching)
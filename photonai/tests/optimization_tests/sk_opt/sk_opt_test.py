@@ -20,3 +20,19 @@ class SkOptOptimizerTest(GridSearchOptimizerTest):
             PipelineElement("SVC"),
         ]
         self.optimizer = SkOptOptimizer()
+
+    def test_ask_batch_pending(self):
+        """
+        Test that the configurations handed out at once are remembered until their performance is told.
+        """
+        self.optimizer.prepare(
+            pipeline_elements=self.pipeline_elements, maximize_metric=True
+        )
+        batch = self.optimizer.ask_batch(3)
+        self.assertEqual(len(batch), 3)
+        self.assertEqual(len(self.optimizer._pending_points), 3)
+        more = self.optimizer.ask_batch(2, n_pending=3)
+        self.assertEqual(len(more), 2)
+        for config in batch + more:
+            self.optimizer.tell(config, (0.5, 0.5))
+        self.assertEqual(len(self.optimizer._pending_points), 0)
@@ -11,6 +11,7 @@ from sklearn.preprocessing import StandardScaler
 
 from photonai.base import PipelineElement, Hyperpipe
 from photonai.base.photon_pipeline import PhotonPipeline
+from photonai.helper.helper import PhotonWorkerPool
 from photonai.optimization import MinimumPerformance
 from photonai.processing.inner_folds import InnerFoldManager
 from photonai.processing.photon_folds import FoldInfo
@@ -164,6 +165,53 @@ class InnerFoldTests(PhotonBaseTest):
         photon_results_config_item = test_pipe.fit(self.X, self.y)
         self.assertTrue(len(photon_results_config_item.inner_folds) == 4)
 
+    def test_parallel_inner_folds(self):
+        sequential_config_item = InnerFoldManager(
+            self.pipe.copy_me,
+            self.config,
+            self.optimization,
+            self.cross_validation,
+            self.outer_fold_id,
+        ).fit(self.X, self.y)
+
+        with PhotonWorkerPool(2) as worker_pool:
+            parallel_config_item = InnerFoldManager(
+                self.pipe.copy_me,
+                self.config,
+                self.optimization,
+                self.cross_validation,
+                self.outer_fold_id,
+                worker_pool=worker_pool,
+            ).fit(self.X, self.y)
+
+            # the results are collected in fold order
+            self.assertEqual(len(parallel_config_item.inner_folds), 4)
+            for sequential_fold, parallel_fold in zip(
+                sequential_config_item.inner_folds, parallel_config_item.inner_folds
+            ):
+                self.assertEqual(sequential_fold.fold_nr, parallel_fold.fold_nr)
+                np.testing.assert_array_equal(
+                    sequential_fold.validation.indices, parallel_fold.validation.indices
+                )
+                np.testing.assert_array_equal(
+                    sequential_fold.validation.y_pred, parallel_fold.validation.y_pred
+                )
+                self.assertDictEqual(
+                    sequential_fold.validation.metrics, parallel_fold.validation.metrics
+                )
+
+            # the remaining folds are skipped as soon as a constraint fails
+            constrained_config_item = InnerFoldManager(
+                self.pipe.copy_me,
+                self.config,
+                self.optimization,
+                self.cross_validation,
+                self.outer_fold_id,
+                optimization_constraints=MinimumPerformance("accuracy", 0.95, "first"),
+                worker_pool=worker_pool,
+            ).fit(self.X, self.y)
+            self.assertEqual(len(constrained_config_item.inner_folds), 1)
+
     def test_raise_error(self):
 
         # case A: raise_error = False -> we expect continuation of the computation
@@ -207,6 +255,32 @@ class InnerFoldTests(PhotonBaseTest):
                 len(inner_fold.validation.y_pred), inner_fold.number_samples_validation
             )
 
+    def test_single_pass_scoring(self):
+        pipe = self.pipe.copy_me()
+        pipe.set_params(**self.config)
+        train_data_transformed = pipe.fit_transform(self.X[:400], self.y[:400])
+        transformations = pipe.time_monitor["transform_computed"]
+
+        nr_of_transformations = len(transformations)
+        test_scores = InnerFoldManager.score(
+            pipe, self.X[400:], self.y[400:], ["accuracy", "score"]
+        )
+        # StandardScaler and PCA transform the test data once
+        self.assertEqual(len(transformations) - nr_of_transformations, 2)
+        self.assertEqual(test_scores.metrics["score"], test_scores.metrics["accuracy"])
+
+        nr_of_transformations = len(transformations)
+        train_scores = InnerFoldManager.score(
+            pipe,
+            self.X[:400],
+            self.y[:400],
+            ["accuracy"],
+            training=True,
+            transformed_data=train_data_transformed,
+        )
+        self.assertEqual(len(transformations), nr_of_transformations)
+        self.assertEqual(len(train_scores.y_pred), 400)
+
     def test_save_feature_importances(self):
         test_pipe = InnerFoldManager(
             self.pipe.copy_me,
@@ -1,4 +1,5 @@
 import os
+import pickle
 import shutil
 from io import StringIO
 
@@ -11,7 +12,7 @@ from photonai.base import Hyperpipe, OutputSettings
 from photonai.base import PipelineElement
 from photonai.processing import ResultsHandler
 from photonai.test.photon_base_test import PhotonBaseTest
-from photonai.processing.results_structure import MDBHyperpipe
+from photonai.processing.results_structure import MDBHyperpipe, MDBHelper
 
 
 class ResultsHandlerTest(PhotonBaseTest):
@@ -26,6 +27,8 @@ class ResultsHandlerTest(PhotonBaseTest):
             "time_monitor.csv",
             "time_monitor_pie.png",
             "photon_result_file.p",
+            "photon_result_configs.p",
+            "photon_config_table.csv",
             "photon_summary.txt",
             "photon_best_model.photon",
             "optimum_pipe_feature_importances_backmapped.npz",
@@ -296,6 +299,123 @@ class ResultsHandlerTest(PhotonBaseTest):
         my_result_handler.load_from_file(results_file)
         self.assertIsInstance(my_result_handler.results, MDBHyperpipe)
 
+    def test_incremental_save(self):
+        results_folder = self.output_settings.results_folder
+        records_file = os.path.join(results_folder, MDBHelper.CONFIG_RECORDS_FILE)
+        tested_configs = [
+            len(outer_fold.tested_config_list)
+            for outer_fold in self.hyperpipe.results.outer_folds
+        ]
+
+        # the result tree is written without the tested configs ...
+        with open(os.path.join(results_folder, "photon_result_file.p"), "rb") as f:
+            tree = pickle.load(f)
+        for outer_fold in tree["outer_folds"]:
+            self.assertEqual(len(outer_fold["tested_config_list"]), 0)
+        # ... which are stored as one record each
+        records = list(MDBHelper.read_config_records(records_file))
+        self.assertEqual(len(records), sum(tested_configs))
+
+        # saving again only appends configs that are new
+        handler = self.hyperpipe.results_handler
+        handler.save()
+        records = list(MDBHelper.read_config_records(records_file))
+        self.assertEqual(len(records), sum(tested_configs))
+        new_config = self.hyperpipe.results.outer_folds[1].tested_config_list[0]
+        self.hyperpipe.results.outer_folds[1].tested_config_list.append(new_config)
+        handler.save()
+        records = list(MDBHelper.read_config_records(records_file))
+        self.assertEqual(len(records), sum(tested_configs) + 1)
+        self.assertEqual(records[-1][0], 1)
+
+        # a record cut off by an interrupted run is skipped
+        with open(records_file, "ab") as f:
+            f.write(pickle.dumps({"outer_fold_index": 0})[:-3])
+
+        loaded = ResultsHandler()
+        loaded.load_from_file(os.path.join(results_folder, "photon_result_file.p"))
+        tested_configs[1] += 1
+        self.assertListEqual(
+            [len(f.tested_config_list) for f in loaded.results.outer_folds],
+            tested_configs,
+        )
+        self.assertEqual(
+            loaded.results.outer_folds[1].tested_config_list[-1].photon_config_id,
+            new_config.photon_config_id,
+        )
+
+    def test_failed_save_is_repeated(self):
+        records_file = os.path.join(
+            self.output_settings.results_folder, MDBHelper.CONFIG_RECORDS_FILE
+        )
+        outer_folds = self.hyperpipe.results.outer_folds
+        outer_folds[0].tested_config_list.append(outer_folds[0].tested_config_list[0])
+        tested_configs = [len(f.tested_config_list) for f in outer_folds]
+
+        # the records file cannot be written, so the new config is not saved
+        os.remove(records_file)
+        os.mkdir(records_file)
+        self.hyperpipe.results_handler.save()
+        os.rmdir(records_file)
+
+        self.hyperpipe.results_handler.save()
+        loaded = ResultsHandler()
+        loaded.load_from_file(
+            os.path.join(self.output_settings.results_folder, "photon_result_file.p")
+        )
+        self.assertListEqual(
+            [len(f.tested_config_list) for f in loaded.results.outer_folds],
+            tested_configs,
+        )
+
+    def test_config_table(self):
+        handler = self.hyperpipe.results_handler
+        table = handler.get_config_table()
+        for outer_fold in self.hyperpipe.results.outer_folds:
+            fold_rows = table[table.outer_fold == outer_fold.fold_nr]
+            self.assertEqual(
+                fold_rows.config.nunique(), len(outer_fold.tested_config_list)
+            )
+            for position, config in enumerate(outer_fold.tested_config_list):
+                rows = fold_rows[fold_rows.config == position]
+                for inner_fold in config.inner_folds:
+                    for metric, value in inner_fold.validation.metrics.items():
+                        row = rows[
+                            (rows.inner_fold == inner_fold.fold_nr)
+                            & (rows.metric == metric)
+                        ]
+                        self.assertEqual(row.test.iloc[0], value)
+                for item in config.metrics_train:
+                    row = rows[
+                        (rows.operation == item.operation)
+                        & (rows.metric == item.metric_name)
+                    ]
+                    self.assertEqual(row.inner_fold.iloc[0], -1)
+                    self.assertEqual(row.train.iloc[0], item.value)
+
+        # the evaluations are queried from the table
+        mean_accuracy = [
+            [
+                MDBHelper.get_metric(config, "FoldOperations.MEAN", "accuracy", False)
+                for config in outer_fold.tested_config_list
+            ]
+            for outer_fold in self.hyperpipe.results.outer_folds
+        ]
+        evaluations = handler.get_config_evaluations()
+        self.assertListEqual(evaluations["accuracy"], mean_accuracy)
+        self.assertListEqual(
+            handler.get_minimum_config_evaluations()["accuracy"],
+            np.maximum.accumulate(mean_accuracy, axis=1).tolist(),
+        )
+
+        # the table saved with the results is loaded again
+        loaded = ResultsHandler()
+        loaded.load_from_file(
+            os.path.join(self.output_settings.results_folder, "photon_result_file.p")
+        )
+        pd.testing.assert_frame_equal(loaded.get_config_table(), table)
+        self.assertDictEqual(loaded.get_config_evaluations(), evaluations)
+
     def test_get_performance_table(self):
         pass
 
@@ -9,7 +9,11 @@ from sklearn.model_selection import KFold
 
 from photonai.base import Hyperpipe, PipelineElement, OutputSettings
 from photonai.optimization import IntegerRange, FloatRange, Categorical
-from photonai.processing.results_structure import MDBHelper, FoldOperations
+from photonai.processing.results_structure import (
+    MDBHelper,
+    FoldOperations,
+    MDBScoreInformation,
+)
 from photonai.test.photon_base_test import PhotonBaseTest
 
 
@@ -115,6 +119,32 @@ class ResultHandlerAndHelperTests(PhotonBaseTest):
             len(self.hyperpipe.results.dummy_estimator.train) == expected_dummy_metrics
         )
 
+    def test_score_information_storage(self):
+        score_info = MDBScoreInformation(
+            y_true=np.array([0, 1, 1]),
+            y_pred=np.array(["a", "b", "c"]),
+            indices=np.array([4, 2, 0]),
+            probabilities=np.array([[0.1, 0.9], [0.5, 0.5], [0.7, 0.3]]),
+        )
+        son = score_info.to_son()
+        self.assertEqual(son["y_true"]["dtype"], np.array([0, 1, 1]).dtype.str)
+        self.assertEqual(len(son["probabilities"]["buffer"]), 6 * 8)
+
+        loaded = MDBScoreInformation.from_document(son)
+        self.assertTrue(np.array_equal(loaded.y_true, [0, 1, 1]))
+        self.assertTrue(np.array_equal(loaded.y_pred, ["a", "b", "c"]))
+        self.assertTrue(np.array_equal(loaded.indices, [4, 2, 0]))
+        self.assertEqual(loaded.probabilities.shape, (3, 2))
+
+        # arrays of python objects and lists of older result trees are stored as lists
+        score_info = MDBScoreInformation(
+            y_true=[0, 1], y_pred=np.array([None, 1], dtype=object)
+        )
+        son = score_info.to_son()
+        self.assertListEqual(son["y_true"], [0, 1])
+        self.assertListEqual(son["y_pred"], [None, 1])
+        self.assertListEqual(MDBScoreInformation.from_document(son).y_true, [0, 1])
+
     def test_get_predictions(self):
 
         self.hyperpipe += PipelineElement("PhotonTestXPredictor")